@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "utils"))
+
+
+@pytest.fixture
+def support_db(tmp_path):
+    """A fresh SQLite support database per test."""
+    return str(tmp_path / "support.db")
@@ -0,0 +1,91 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from answer_cache import AnswerCache, chunk_key, normalize_query
+
+
+class FakeCollection:
+    def __init__(self, ids, version):
+        self.ids = set(ids)
+        self.metadata = {"corpus_version": version}
+
+    def get(self, ids, include):
+        return {"ids": [i for i in ids if i in self.ids]}
+
+
+def test_normalized_query_and_chunk_order_hit_exactly():
+    cache = AnswerCache(threshold=1.0)
+    cache.store("Battery not charging?", None, ["c1", "c2"], "Try another adapter", 1.5)
+
+    assert normalize_query("Battery  not CHARGING") == "battery not charging"
+    assert chunk_key(["c2", "c1", "c1"]) == chunk_key(["c1", "c2"])
+    assert cache.lookup("battery not charging", None, ["c2", "c1"]) == ("Try another adapter", "exact")
+    assert cache.lookup("battery not charging", None, ["c1", "c3"]) == (None, None)
+
+
+def test_semantic_hit_needs_close_embedding_and_same_chunks():
+    cache = AnswerCache(threshold=0.9)
+    cache.store("battery not charging", [1.0, 0.0, 0.0], ["c1"], "Try another adapter", 2.0)
+
+    assert cache.lookup("laptop will not charge", [0.99, 0.05, 0.0], ["c1"]) == ("Try another adapter", "semantic")
+    assert cache.lookup("laptop will not charge", [0.0, 1.0, 0.0], ["c1"]) == (None, None)
+    assert cache.lookup("laptop will not charge", [0.99, 0.05, 0.0], ["c9"]) == (None, None)
+    metrics = cache.metrics()
+    assert metrics["hits_semantic"] == 1 and metrics["misses"] == 2 and metrics["latency_saved_s"] == 2.0
+
+
+def test_empty_answers_are_not_cached():
+    cache = AnswerCache()
+    cache.store("q", None, ["c1"], "  ", 1.0)
+    assert cache.metrics()["entries"] == 0
+
+
+def test_invalidate_chunks_drops_answers_citing_them():
+    cache = AnswerCache()
+    cache.store("q1", None, ["c1", "c2"], "a1", 1.0)
+    cache.store("q2", None, ["c3"], "a2", 1.0)
+
+    assert cache.invalidate_chunks(["c2"]) == 1
+    assert cache.lookup("q1", None, ["c1", "c2"]) == (None, None)
+    assert cache.lookup("q2", None, ["c3"]) == ("a2", "exact")
+
+
+def test_purge_missing_runs_once_per_corpus_version():
+    cache = AnswerCache()
+    cache.store("q1", None, ["c1"], "a1", 1.0)
+    cache.store("q2", None, ["c2"], "a2", 1.0)
+
+    assert cache.purge_missing(FakeCollection(["c2"], "v2")) == 1
+    assert cache.purge_missing(FakeCollection([], "v2")) == 0
+    assert cache.lookup("q1", None, ["c1"]) == (None, None)
+    assert cache.lookup("q2", None, ["c2"]) == ("a2", "exact")
+
+
+def test_lru_eviction_and_expiry():
+    cache = AnswerCache(max_entries=2)
+    cache.store("q1", None, ["c1"], "a1", 1.0)
+    cache.store("q2", None, ["c2"], "a2", 1.0)
+    cache.lookup("q1", None, ["c1"])
+    cache.store("q3", None, ["c3"], "a3", 1.0)
+
+    assert cache.lookup("q2", None, ["c2"]) == (None, None)
+    assert cache.lookup("q1", None, ["c1"]) == ("a1", "exact")
+
+    expired = AnswerCache(ttl_s=-1)
+    expired.store("q1", None, ["c1"], "a1", 1.0)
+    assert expired.lookup("q1", None, ["c1"]) == (None, None)
+
+
+def test_sqlite_persistence_survives_restart_and_invalidation(tmp_path):
+    path = str(tmp_path / "answers.db")
+    cache = AnswerCache(db_path=path, threshold=0.9)
+    cache.store("q1", [0.0, 1.0], ["c1"], "a1", 1.0)
+    cache.store("q2", None, ["c2"], "a2", 1.0)
+    cache.invalidate_chunks(["c2"])
+
+    reopened = AnswerCache(db_path=path, threshold=0.9)
+
+    assert reopened.metrics()["entries"] == 1
+    assert reopened.lookup("something else", np.array([0.0, 2.0]), ["c1"]) == ("a1", "semantic")
+    assert reopened.lookup("q2", None, ["c2"]) == (None, None)
@@ -0,0 +1,74 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from embed_cache import EmbeddingCache
+
+
+class CountingEmbed:
+    """Deterministic fake embedder that records which texts it was asked for."""
+
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t) + i) for i in range(self.dim)] for t in texts]
+
+
+def test_only_misses_are_embedded_once(tmp_path):
+    cache = EmbeddingCache("test/model", str(tmp_path))
+    embed = CountingEmbed()
+
+    first = cache.embed(["alpha", "beta", "alpha"], embed)
+    second = cache.embed(["beta", "gamma"], embed)
+
+    assert embed.calls == [["alpha", "beta"], ["gamma"]]
+    assert first[0] == first[2] == embed(["alpha"])[0]
+    assert second[0] == first[1]
+    assert cache.stats() == {"cache_hits": 2, "cache_misses": 3, "cache_entries": 3}
+
+
+def test_entries_persist_across_instances(tmp_path):
+    EmbeddingCache("test/model", str(tmp_path)).embed(["alpha"], CountingEmbed())
+    embed = CountingEmbed()
+
+    vectors = EmbeddingCache("test/model", str(tmp_path)).embed(["alpha", "beta"], embed)
+
+    assert embed.calls == [["beta"]]
+    assert vectors[0] == CountingEmbed()(["alpha"])[0]
+    assert EmbeddingCache("other-model", str(tmp_path)).embed(["alpha"], embed) and embed.calls[-1] == ["alpha"]
+
+
+def test_reload_picks_up_another_writer(tmp_path):
+    reader = EmbeddingCache("test/model", str(tmp_path))
+    reader.embed(["alpha"], CountingEmbed())
+    EmbeddingCache("test/model", str(tmp_path)).embed(["beta"], CountingEmbed())
+    embed = CountingEmbed()
+
+    reader.embed(["alpha", "beta"], embed)
+
+    assert embed.calls == []
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    dim = 64 * 1024  # 4 vectors per MB
+    cache = EmbeddingCache("test/model", str(tmp_path), max_mb=1)
+    embed = CountingEmbed(dim)
+    cache.embed(["a", "b", "c", "d"], embed)
+    cache.embed(["a"], embed)
+    cache.embed(["e"], embed)
+
+    assert cache.stats()["cache_entries"] <= 4
+    embed.calls.clear()
+    vectors = cache.embed(["a", "e", "b"], embed)
+    assert embed.calls == [["b"]]
+    assert np.allclose(vectors[0], CountingEmbed(dim)(["a"])[0])
+
+
+def test_dimension_mismatch_is_rejected(tmp_path):
+    cache = EmbeddingCache("test/model", str(tmp_path))
+    cache.embed(["alpha"], CountingEmbed(8))
+    with pytest.raises(ValueError):
+        cache.embed(["beta"], CountingEmbed(4))
@@ -0,0 +1,58 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from feedback_store import FeedbackStore, GapClusterer, source_document
+
+TOPICS = ("battery", "display", "wifi")
+
+
+def topic_embed(texts):
+    """One axis per topic word, so suggestions about the same topic are near-identical."""
+    return np.array([[float(topic in text.lower()) + 0.01 for topic in TOPICS] for text in texts])
+
+
+def test_source_document():
+    assert source_document("a.docx › Power > Battery") == "a.docx"
+    assert source_document("a.docx|b.docx") == "a.docx"
+
+
+def test_stats_are_counted_per_dimension(support_db):
+    store = FeedbackStore(support_db)
+    store.add("TCK-001", "alice", "Very Useful", category="Battery",
+              sources=["a.docx › Power", "a.docx › Charging", "b.docx"])
+    store.add("TCK-002", "bob", "Not Useful", category="Battery", sources=["b.docx"])
+    record = store.add("TCK-003", "bob", "Not Useful", missing_kb="  ")
+
+    assert store.totals() == {"Very Useful": 1, "Not Useful": 2}
+    assert store.stats("source") == {"a.docx": {"Very Useful": 1}, "b.docx": {"Very Useful": 1, "Not Useful": 1}}
+    assert store.stats("category") == {"Battery": {"Very Useful": 1, "Not Useful": 1}}
+    assert store.count() == 3
+    assert record["missing_kb"] is None and record["sources"] == []
+    assert [r["ticket_id"] for r in store.page(0, 2)] == ["TCK-003", "TCK-002"]
+
+
+def test_gaps_cluster_incrementally(support_db):
+    store = FeedbackStore(support_db)
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return topic_embed(texts)
+
+    clusterer = GapClusterer(store, embed, threshold=0.9)
+    for ticket, text in (("TCK-1", "Battery swelling guide"), ("TCK-2", "battery calibration"),
+                         ("TCK-3", "Display flicker"), ("TCK-2", "Battery swelling guide")):
+        store.add(ticket, "alice", "Not Useful", missing_kb=text)
+
+    gaps = clusterer.gaps()
+    assert [(g["suggestions"], g["tickets"]) for g in gaps] == [(3, ["TCK-1", "TCK-2"]), (1, ["TCK-3"])]
+    assert gaps[0]["label"] in ("Battery swelling guide", "battery calibration")
+
+    store.add("TCK-4", "bob", "Not Useful", missing_kb="wifi drops")
+    store.add("TCK-5", "bob", "Not Useful", missing_kb="Display dead pixels")
+    gaps = clusterer.gaps(limit=2)
+
+    assert calls == [4, 2]
+    assert [g["suggestions"] for g in gaps] == [3, 2]
+    assert clusterer.gaps() and calls == [4, 2]
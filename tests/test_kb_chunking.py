@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("docx")
+
+import kb_chunking
+
+
+def piece_tokens(text, model_name=None):
+    """A subword-like count: one token per 4 characters of each word, so long words cost more."""
+    return sum(-(-len(word) // 4) for word in text.split())
+
+
+@pytest.fixture(autouse=True)
+def uneven_tokens(monkeypatch):
+    monkeypatch.setattr(kb_chunking, "count_tokens", piece_tokens)
+
+
+def test_windows_are_recounted_when_tokens_are_uneven():
+    words = ["ok"] * 40 + ["0x" + "deadbeef" * 8, "https://www.dell.com/support/kbdoc/en-us/000123456/long-path"] * 3
+    text = " ".join(words)
+
+    pieces = kb_chunking.split_unit(text, 16, "model")
+
+    assert all(n <= 16 and piece_tokens(t) == n for t, n in pieces)
+    assert "".join(t.replace(" ", "") for t, _ in pieces) == text.replace(" ", "")
+
+
+def test_chunks_stay_within_max_tokens_with_long_tokens():
+    hexdump = " ".join("0x" + "0123456789abcdef" * 6 for _ in range(5))
+    units = [("Errors > Stop codes", "Short intro. " + hexdump), ("Errors > Stop codes", "ok " * 30)]
+
+    chunks = kb_chunking.chunk_units(units, max_tokens=24, overlap_tokens=4, model_name="model")
+
+    assert chunks
+    assert all(piece_tokens(c["text"]) <= 24 for c in chunks)
@@ -0,0 +1,60 @@
+import pytest
+
+import kb_context
+from kb_context import build_context
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    """Counts whitespace words instead of loading the embedding model's tokenizer."""
+    monkeypatch.setattr(kb_context, "count_tokens", lambda text: len(text.split()))
+
+
+def lines(prefix, n):
+    return "\n".join(f"{prefix}{i} {prefix}x{i}" for i in range(n))
+
+
+def test_exact_and_overlapping_duplicates_are_dropped():
+    docs = [
+        "Hold the power button for 15 seconds to drain residual power",
+        "Hold the power button for 15 seconds to drain residual power",
+        "Hold the power button for 15 seconds to drain power",
+        "Update the BIOS from the support site",
+    ]
+    metas = [{"source": "a.docx", "chunk": 0}, {"source": "b.docx", "chunk": 4},
+             {"source": "c.docx", "chunk": 9}, {"source": "d.docx", "chunk": 1}]
+
+    text, report = build_context(docs, ["1", "2", "3", "4"], metas, max_tokens=500)
+
+    assert report["duplicates_dropped"] == 2
+    assert report["parts"] == 2 and report["chunks_used"] == 2
+    assert report["sources"] == ["a.docx", "d.docx"]
+    assert text.startswith("[1] a.docx\n") and "[2] d.docx\n" in text
+
+
+def test_adjacent_chunks_merge_in_document_order_without_overlap():
+    docs = ["Battery\nstep two\nstep three", "Battery\nstep one\nstep two"]
+    metas = [{"source": "a.docx", "section": "Battery", "chunk": 3},
+             {"source": "a.docx", "section": "Battery", "chunk": 2}]
+
+    text, report = build_context(docs, ["x", "y"], metas, max_tokens=500, overlap_threshold=1.1)
+
+    assert text == "[1] a.docx › Battery\nstep one\nstep two\nstep three"
+    assert report["merged"] == 1 and report["parts"] == 1 and report["chunks_used"] == 2
+
+
+def test_budget_truncates_then_skips():
+    docs = [lines("alpha", 20), lines("gamma", 60), lines("omega", 20)]
+    metas = [{"source": "a.docx"}, {"source": "b.docx"}, {"source": "c.docx"}]
+
+    text, report = build_context(docs, ["a", "b", "c"], metas, max_tokens=120)
+
+    assert report["truncated"] == 1 and report["skipped"] == 1
+    assert report["parts"] == 2 and report["sources"] == ["a.docx", "b.docx"]
+    assert report["context_tokens"] <= 120
+    assert kb_context.count_tokens(text) <= report["context_tokens"]
+    assert "gamma0 " in text and "gamma59" not in text and "omega" not in text
+
+
+def test_empty_input():
+    assert build_context([]) == ("", kb_context.new_context_report(kb_context.CONTEXT_MAX_TOKENS) | {"parts": 0})
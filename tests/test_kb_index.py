@@ -0,0 +1,43 @@
+import kb_index
+
+
+def write_docs(folder, contents):
+    folder.mkdir(exist_ok=True)
+    for name, data in contents.items():
+        (folder / name).write_bytes(data)
+
+
+def entry(path):
+    st = path.stat()
+    return {"sha256": kb_index.file_sha256(str(path)), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "chunks": {}}
+
+
+def test_indexed_version_matches_corpus_once_every_file_is_synced(tmp_path):
+    docs = tmp_path / "docs"
+    write_docs(docs, {"a.docx": b"first", "b.docx": b"second"})
+    manifest = {"files": {name: entry(docs / name) for name in ("a.docx", "b.docx")}}
+
+    assert kb_index.indexed_version(manifest) == kb_index.corpus_version(str(docs), manifest)
+
+
+def test_unsynced_or_failed_files_keep_the_index_stale(tmp_path):
+    docs = tmp_path / "docs"
+    write_docs(docs, {"a.docx": b"first"})
+    manifest = {"files": {"a.docx": entry(docs / "a.docx")}}
+    write_docs(docs, {"a.docx": b"edited", "b.docx": b"never parsed"})
+
+    assert kb_index.indexed_version(manifest) != kb_index.corpus_version(str(docs), manifest)
+    manifest["files"]["b.docx"] = entry(docs / "b.docx")
+    assert kb_index.indexed_version(manifest) != kb_index.corpus_version(str(docs), manifest)
+    manifest["files"]["a.docx"] = entry(docs / "a.docx")
+    assert kb_index.indexed_version(manifest) == kb_index.corpus_version(str(docs), manifest)
+
+
+def test_upload_sync_does_not_vouch_for_untouched_files(tmp_path):
+    docs = tmp_path / "docs"
+    write_docs(docs, {"old.docx": b"indexed"})
+    manifest = {"files": {"old.docx": entry(docs / "old.docx")}}
+    write_docs(docs, {"old.docx": b"edited on disk", "upload.docx": b"uploaded"})
+    manifest["files"]["upload.docx"] = entry(docs / "upload.docx")  # what sync_index(only_files=[upload]) commits
+
+    assert kb_index.indexed_version(manifest) != kb_index.corpus_version(str(docs), manifest)
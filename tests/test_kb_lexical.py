@@ -0,0 +1,80 @@
+from kb_lexical import LexicalIndex, rrf_fuse, tokenize
+
+
+def test_tokenize_normalizes_hex_codes():
+    assert tokenize("Stop code 0x0000007B") == ["stop", "code", "0x7b"]
+    assert tokenize("0x7b") == tokenize("0X0000007b")
+
+
+def test_tokenize_keeps_codes_and_their_parts():
+    terms = tokenize("CRITICAL_PROCESS_DIED on the XPS-15")
+    assert terms == ["critical_process_died", "critical", "process", "died", "xps-15", "xps", "15"]
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("How do I fix the battery") == ["fix", "battery"]
+
+
+def make_index():
+    index = LexicalIndex("v1")
+    index.add_many(["a", "b", "c"], [
+        "Battery not charging on the XPS-15",
+        "Blue screen with stop code 0x0000007B",
+        "Battery drains fast when the laptop sleeps",
+    ])
+    return index
+
+
+def test_search_ranks_matching_chunks():
+    index = make_index()
+    assert [cid for cid, _ in index.search("xps 15 battery")][0] == "a"
+    assert [cid for cid, _ in index.search("0x7B")] == ["b"]
+    assert index.search("printer") == []
+
+
+def test_remove_drops_postings_and_lengths():
+    index = make_index()
+    index.remove(["b", "missing"])
+
+    assert len(index) == 2
+    assert "0x7b" not in index.postings and "b" not in index.terms
+    assert index.total_length == sum(index.lengths.values())
+    assert all("b" not in docs for docs in index.postings.values())
+    assert index.search("stop code") == []
+
+
+def test_add_replaces_existing_chunk():
+    index = make_index()
+    index.add("a", "Keyboard backlight")
+
+    assert [cid for cid, _ in index.search("battery")] == ["c"]
+    assert [cid for cid, _ in index.search("keyboard")] == ["a"]
+    assert index.total_length == sum(index.lengths.values())
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = make_index()
+    path = str(tmp_path / "bm25.json")
+    index.save(path)
+
+    loaded = LexicalIndex.load(path)
+    loaded.remove(["a"])
+    index.remove(["a"])
+
+    assert loaded.version == "v1"
+    assert loaded.postings == index.postings
+    assert loaded.lengths == index.lengths
+    assert loaded.search("battery") == index.search("battery")
+
+
+def test_load_rejects_missing_or_corrupt_file(tmp_path):
+    path = tmp_path / "bm25.json"
+    assert LexicalIndex.load(str(path)) is None
+    path.write_text("{not json")
+    assert LexicalIndex.load(str(path)) is None
+
+
+def test_rrf_fuse_rewards_agreement():
+    fused = rrf_fuse([["a", "b", "c"], ["b", "a", "d"]])
+    assert [cid for cid, _ in fused][:2] in (["a", "b"], ["b", "a"])
+    assert [cid for cid, _ in fused][2:] == ["c", "d"]
@@ -0,0 +1,35 @@
+import os
+
+import kb_index
+import reindex_job
+
+
+def make_slots(root, names):
+    for name in names:
+        os.makedirs(kb_index.slot_dir(name, str(root)))
+
+
+def test_remove_old_slots_keeps_the_newest_and_the_active(tmp_path):
+    make_slots(tmp_path, ["20260101-1", "20260102-2", "20260103-3", "20260104-4"])
+
+    reindex_job.remove_old_slots(str(tmp_path), "20260104-4", keep=3)
+
+    assert sorted(os.listdir(tmp_path / kb_index.SLOTS_DIR)) == ["20260102-2", "20260103-3", "20260104-4"]
+
+
+def test_remove_old_slots_never_removes_the_active_slot(tmp_path):
+    make_slots(tmp_path, ["20260101-1", "20260102-2", "20260103-3"])
+
+    reindex_job.remove_old_slots(str(tmp_path), "20260101-1", keep=2)
+
+    assert sorted(os.listdir(tmp_path / kb_index.SLOTS_DIR)) == ["20260101-1", "20260103-3"]
+
+
+def test_rebuild_lock_is_exclusive(tmp_path):
+    lock = reindex_job.acquire_lock(str(tmp_path))
+
+    assert lock is not None
+    assert reindex_job.acquire_lock(str(tmp_path)) is None
+    assert reindex_job.is_running(str(tmp_path))
+    lock.close()
+    assert not reindex_job.is_running(str(tmp_path))
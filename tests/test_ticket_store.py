@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+import time
+
+from ticket_store import UNASSIGNED, TicketStore
+
+
+def backdate(store, ticket_id, hours):
+    """Moves a ticket's SLA due time `hours` into the past."""
+    seq = int(ticket_id.split("-")[1])
+    conn = store.db.connect()
+    conn.execute("UPDATE tickets SET due = ? WHERE seq = ?", (time.time() - 3600 * hours, seq))
+
+
+def test_queue_order_breached_then_priority_then_age(support_db):
+    store = TicketStore(support_db)
+    low = store.create("a@x.com", "m", "Battery", "Low")
+    high = store.create("b@x.com", "m", "Battery", "High")
+    medium = store.create("c@x.com", "m", "Display", "Medium")
+    high2 = store.create("d@x.com", "m", "Display", "High")
+    overdue = store.create("e@x.com", "m", "Display", "Low")
+    very_overdue = store.create("f@x.com", "m", "Battery", "Medium")
+    backdate(store, overdue["id"], 1)
+    backdate(store, very_overdue["id"], 5)
+    store.update(high2["id"], status="In Progress")
+
+    tickets, next_page = store.queue_page(page_size=10)
+
+    assert [t["id"] for t in tickets] == [very_overdue["id"], overdue["id"], high["id"], high2["id"],
+                                          medium["id"], low["id"]]
+    assert [t["breached"] for t in tickets] == [True, True, False, False, False, False]
+    assert next_page is None
+
+
+def test_queue_page_filters_and_pages(support_db):
+    store = TicketStore(support_db)
+    ids = [store.create(f"{i}@x.com", "m", "Battery" if i % 2 else "Display", "Medium")["id"] for i in range(7)]
+    store.update(ids[0], status="Resolved")
+
+    first, next_page = store.queue_page(None, 2, category="Display")
+    last, after_last = store.queue_page(next_page, 2, category="Display")
+
+    assert [t["id"] for t in first] == [ids[2], ids[4]]
+    assert next_page is not None
+    assert [t["id"] for t in last] == [ids[6]]
+    assert after_last is None
+
+
+def test_queue_pages_do_not_read_earlier_pages(support_db):
+    store = TicketStore(support_db)
+    tickets = [store.create(f"{i}@x.com", "m", "Battery", ("Low", "Medium", "High")[i % 3]) for i in range(24)]
+    for ticket in tickets[::4]:
+        backdate(store, ticket["id"], 2)
+    for ticket in tickets[1::3]:
+        store.update(ticket["id"], status="In Progress")
+    expected = [t["id"] for t in store.queue_page(page_size=len(tickets))[0]]
+    fetched = []
+
+    def recording_row(cursor, values):
+        row = sqlite3.Row(cursor, values)
+        fetched.append(row["seq"])
+        return row
+
+    store.db.connect().row_factory = recording_row
+    shown, after = [], None
+    while True:
+        fetched.clear()
+        page, after = store.queue_page(after, 5)
+        assert not set(fetched) & {int(ticket_id.split("-")[1]) for ticket_id in shown}
+        shown.extend(t["id"] for t in page)
+        if after is None:
+            break
+
+    assert shown == expected
+
+
+def test_claim_next_takes_queue_head_and_skips_assigned(support_db):
+    store = TicketStore(support_db)
+    low = store.create("a@x.com", "m", "Battery", "Low")
+    high = store.create("b@x.com", "m", "Battery", "High")
+    store.assign(high["id"], "alice")
+
+    claimed = store.claim_next("bob")
+
+    assert claimed["id"] == low["id"]
+    assert claimed["agent"] == "bob" and claimed["status"] == "In Progress"
+    assert store.get(low["id"])["agent"] == "bob"
+    assert store.claim_next("carol") is None
+
+
+def test_claim_next_is_atomic_across_threads(support_db):
+    store = TicketStore(support_db)
+    created = {store.create(f"{i}@x.com", "m", "Battery", "Medium")["id"] for i in range(40)}
+    claims, lock = [], threading.Lock()
+
+    def agent(name):
+        while True:
+            ticket = store.claim_next(name)
+            if ticket is None:
+                return
+            with lock:
+                claims.append((ticket["id"], name))
+
+    threads = [threading.Thread(target=agent, args=(f"agent-{i}",)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(ticket_id for ticket_id, _ in claims) == sorted(created)
+    for ticket_id, name in claims:
+        assert store.get(ticket_id)["agent"] == name
+    assert store.count(agent=UNASSIGNED) == 0
+
+
+def test_assign_refuses_ticket_of_another_agent(support_db):
+    store = TicketStore(support_db)
+    ticket = store.create("a@x.com", "m", "Battery", "High")
+
+    assert store.assign(ticket["id"], "alice")
+    assert not store.assign(ticket["id"], "bob")
+    assert store.assign(ticket["id"], "alice")
+    assert not store.assign("TCK-999", "alice")
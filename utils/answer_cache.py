@@ -0,0 +1,217 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Configuration
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", str(24 * 3600)))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB", "")  # SQLite file; empty keeps the cache in memory only
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace: 'Battery not charging?' == 'battery  not charging'."""
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", query.lower())).strip()
+
+
+def chunk_key(chunk_ids) -> str:
+    """Order-independent key for the set of retrieved chunk ids."""
+    return hashlib.sha1("\n".join(sorted(set(chunk_ids))).encode("utf-8")).hexdigest()
+
+
+def unit_vector(vec):
+    vec = np.asarray(vec, dtype=np.float32).ravel()
+    return vec / max(float(np.linalg.norm(vec)), 1e-12)
+
+
+# Answer Cache
+class AnswerCache:
+    """
+    Two-level cache in front of the LLM call.
+
+    Level 1: exact match on the normalized query text.
+    Level 2: a previous query whose embedding is within `threshold` cosine similarity.
+
+    Both levels only hit if the retrieval returned the same set of chunk ids as when the
+    answer was generated. Chunk ids are content hashes, so re-indexing an edited chunk
+    changes its id and the old answers simply stop matching; purge_missing() also drops
+    them from memory/SQLite once the index changes. Entries are evicted LRU-first and
+    expire after ttl_s.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl_s: float = ANSWER_CACHE_TTL_S,
+                 threshold: float = ANSWER_CACHE_THRESHOLD, db_path: str = ANSWER_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.threshold = threshold
+        self.entries = OrderedDict()  # key -> entry dict, least recently used first
+        self.by_chunks = {}  # chunk key -> set of entry keys
+        self.index_version = None
+        self.lock = threading.Lock()
+        self.counters = {"lookups": 0, "hits_exact": 0, "hits_semantic": 0, "misses": 0, "latency_saved_s": 0.0}
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, query TEXT, chunk_key TEXT, "
+                "chunk_ids TEXT, embedding BLOB, answer TEXT, created REAL, latency REAL)"
+            )
+            self.db.commit()
+            self.load()
+
+    # Persistence
+    def load(self):
+        cutoff = time.time() - self.ttl_s
+        rows = self.db.execute(
+            "SELECT key, query, chunk_key, chunk_ids, embedding, answer, created, latency FROM answers "
+            "WHERE created >= ? ORDER BY created DESC LIMIT ?", (cutoff, self.max_entries)
+        ).fetchall()
+        for key, query, ckey, ids, emb, answer, created, latency in reversed(rows):
+            self.insert(key, {
+                "query": query, "chunk_key": ckey, "chunk_ids": ids.split("\n") if ids else [],
+                "embedding": np.frombuffer(emb, dtype=np.float32) if emb else None,
+                "answer": answer, "created": created, "latency": latency,
+            })
+        self.db.execute("DELETE FROM answers WHERE created < ?", (cutoff,))
+        self.db.commit()
+
+    def db_delete(self, keys):
+        if self.db and keys:
+            self.db.executemany("DELETE FROM answers WHERE key = ?", [(k,) for k in keys])
+            self.db.commit()
+
+    # Bookkeeping
+    def insert(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self.by_chunks.setdefault(entry["chunk_key"], set()).add(key)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            keys = self.by_chunks.get(entry["chunk_key"], set())
+            keys.discard(key)
+            if not keys:
+                self.by_chunks.pop(entry["chunk_key"], None)
+        return entry
+
+    def expired(self, entry, now) -> bool:
+        return now - entry["created"] > self.ttl_s
+
+    # Lookup / Store
+    def lookup(self, query: str, query_embedding, chunk_ids):
+        """Returns (answer, level) with level "exact"/"semantic", or (None, None) on a miss."""
+        norm = normalize_query(query)
+        ckey = chunk_key(chunk_ids)
+        now = time.time()
+        with self.lock:
+            self.counters["lookups"] += 1
+            expired = []
+            hit, level = None, None
+
+            key = hashlib.sha1(f"{norm}\n{ckey}".encode("utf-8")).hexdigest()
+            entry = self.entries.get(key)
+            if entry is not None and not self.expired(entry, now):
+                hit, level = key, "exact"
+            elif query_embedding is not None and self.threshold < 1:
+                q = unit_vector(query_embedding)
+                best, best_sim = None, self.threshold
+                for k in list(self.by_chunks.get(ckey, ())):
+                    candidate = self.entries[k]
+                    if self.expired(candidate, now):
+                        expired.append(k)
+                        continue
+                    if candidate["embedding"] is None:
+                        continue
+                    sim = float(candidate["embedding"] @ q)
+                    if sim >= best_sim:
+                        best, best_sim = k, sim
+                if best is not None:
+                    hit, level = best, "semantic"
+
+            for k in expired:
+                self.remove(k)
+            self.db_delete(expired)
+
+            if hit is None:
+                self.counters["misses"] += 1
+                return None, None
+            self.entries.move_to_end(hit)
+            self.counters["hits_" + level] += 1
+            self.counters["latency_saved_s"] += self.entries[hit]["latency"] or 0.0
+            return self.entries[hit]["answer"], level
+
+    def store(self, query: str, query_embedding, chunk_ids, answer: str, latency_s: float):
+        if not (answer or "").strip():
+            return
+        norm = normalize_query(query)
+        ckey = chunk_key(chunk_ids)
+        key = hashlib.sha1(f"{norm}\n{ckey}".encode("utf-8")).hexdigest()
+        emb = unit_vector(query_embedding) if query_embedding is not None else None
+        entry = {
+            "query": norm, "chunk_key": ckey, "chunk_ids": sorted(set(chunk_ids)), "embedding": emb,
+            "answer": answer, "created": time.time(), "latency": latency_s,
+        }
+        with self.lock:
+            self.remove(key)
+            self.insert(key, entry)
+            evicted = []
+            while len(self.entries) > self.max_entries:
+                old_key = next(iter(self.entries))
+                self.remove(old_key)
+                evicted.append(old_key)
+            if self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, norm, ckey, "\n".join(entry["chunk_ids"]),
+                     emb.tobytes() if emb is not None else None, answer, entry["created"], latency_s),
+                )
+                self.db.commit()
+            self.db_delete(evicted)
+
+    # Invalidation
+    def invalidate_chunks(self, chunk_ids):
+        """Drops every cached answer that was generated from any of these chunks."""
+        gone = set(chunk_ids)
+        with self.lock:
+            stale = [k for k, e in self.entries.items() if gone.intersection(e["chunk_ids"])]
+            for k in stale:
+                self.remove(k)
+            self.db_delete(stale)
+        return len(stale)
+
+    def purge_missing(self, collection):
+        """After a re-index, drops answers that cite chunks no longer in the collection."""
+        version = (collection.metadata or {}).get("corpus_version")
+        if version == self.index_version:
+            return 0
+        self.index_version = version
+        with self.lock:
+            cited = sorted({c for e in self.entries.values() for c in e["chunk_ids"]})
+        if not cited:
+            return 0
+        present = set(collection.get(ids=cited, include=[])["ids"])
+        return self.invalidate_chunks([c for c in cited if c not in present])
+
+    def clear(self):
+        with self.lock:
+            self.db_delete(list(self.entries))
+            self.entries.clear()
+            self.by_chunks.clear()
+
+    # Metrics
+    def metrics(self) -> dict:
+        with self.lock:
+            c = dict(self.counters)
+            hits = c["hits_exact"] + c["hits_semantic"]
+            c["hit_rate"] = round(hits / c["lookups"], 4) if c["lookups"] else 0.0
+            c["latency_saved_s"] = round(c["latency_saved_s"], 3)
+            c["entries"] = len(self.entries)
+            return c
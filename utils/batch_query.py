@@ -0,0 +1,241 @@
+"""
+Batch mode for the knowledge-base CLI: answers a file of queries instead of input() lines.
+
+Queries come from JSONL ({"id": ..., "query": ...} per line, or a bare JSON string) or CSV
+(a "query" or "question" column, optional "id" and "category"). They are retrieved BATCH_ENCODE_SIZE at a
+time with one batched encode and one vector query (retrieve_many), and answered with up to
+BATCH_CONCURRENCY LLM calls in flight, started at most BATCH_RATE_PER_S per second. Each
+result is appended to the output JSONL as soon as it is done, with per-item timings.
+Re-running with the same output resumes: ids that already have an answer are skipped, and
+items that failed are retried (the last record per id wins). Records of a --retrieve-only run
+carry "mode": "retrieve" and do not count as answered for a later full run.
+
+    python utils/batch_query.py backlog.jsonl -o answers.jsonl
+    python utils/batch_query.py regression.csv -o out.jsonl --concurrency 16 --rate 5
+    python utils/batch_query.py regression.csv -o out.jsonl --retrieve-only
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import statistics
+import sys
+import time
+
+import dell_knowledge_query_groq as kb
+
+
+# Configuration
+BATCH_ENCODE_SIZE = int(os.getenv("BATCH_ENCODE_SIZE", "64"))  # queries per encode + vector query
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # LLM calls in flight
+BATCH_RATE_PER_S = float(os.getenv("BATCH_RATE_PER_S", "2"))  # LLM call starts per second; 0 = unlimited
+
+
+# Input
+def read_queries(path: str):
+    """
+    [(id, query, category)] from a JSONL or CSV file; items without an id are numbered by their
+    line/row. category (a ticket category, or None) steers the two-stage search.
+    """
+    items = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for n, row in enumerate(csv.DictReader(f), 1):
+                query = (row.get("query") or row.get("question") or "").strip()
+                if query:
+                    items.append((str(row.get("id") or n), query, row.get("category") or None))
+        else:
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if isinstance(record, str):
+                    record = {"query": record}
+                query = (record.get("query") or record.get("question") or "").strip()
+                if query:
+                    items.append((str(record.get("id", n)), query, record.get("category")))
+    seen = set()
+    return [item for item in items if not (item[0] in seen or seen.add(item[0]))]
+
+
+# Output
+def completed_ids(path: str, retrieve_only: bool = False):
+    """
+    Ids done in an earlier run's output: answered, or for a retrieve-only run also retrieved.
+    A torn last line (crash mid-write) is cut off.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb") as f:
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    if end < len(data):
+        with open(path, "r+b") as f:
+            f.truncate(end)
+    done = set()
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("error") or record.get("mode") == "retrieve" and not retrieve_only:
+            done.discard(record["id"])
+        else:
+            done.add(record["id"])
+    return done
+
+
+class ResultWriter:
+    """Appends one JSON line per finished item and flushes it, so a crash loses at most the item in flight."""
+
+    def __init__(self, path: str):
+        self.f = open(path, "a", encoding="utf-8")
+
+    def write(self, record: dict):
+        self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+
+# Scheduling
+class RateLimiter:
+    """Spaces call starts at least 1/rate_per_s apart (rate_per_s <= 0: no limit)."""
+
+    def __init__(self, rate_per_s: float):
+        self.interval = 1.0 / rate_per_s if rate_per_s > 0 else 0.0
+        self.next_at = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.next_at)
+        self.next_at = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+def result_record(item_id, query, hits, timings, mode="answer"):
+    return {
+        "id": item_id,
+        "mode": mode,
+        "query": query,
+        "answer": hits.get("answer"),
+        "chunk_ids": hits["ids"],
+        "sources": [meta.get("source") for meta in hits["metadatas"]],
+        "routed": hits.get("routed"),
+        "cache": hits.get("cache"),
+        "provider": hits.get("provider"),
+        "ttft_s": hits.get("ttft_s"),
+        "timings": {k: round(v, 4) for k, v in timings.items()},
+    }
+
+
+async def run_batch(vectordb, items, writer, concurrency=BATCH_CONCURRENCY, rate_per_s=BATCH_RATE_PER_S,
+                    encode_size=BATCH_ENCODE_SIZE, n_results=kb.N_RESULTS, retrieve_only=False):
+    """
+    Retrieves `items` [(id, query, category)] encode_size at a time and answers them concurrently.
+    The next retrieval batch runs while answers of the previous one are still streaming,
+    but at most one batch of items waits for an LLM slot at a time. Returns the records.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate_per_s)
+    records, pending = [], set()
+
+    def finish(record):
+        writer.write(record)
+        records.append(record)
+
+    async def answer(item_id, query, hits, timings, started):
+        queued = time.perf_counter()
+        try:
+            async with slots:
+                timings["queue_s"] = time.perf_counter() - queued
+                t0 = time.perf_counter()
+                await kb.agenerate_answer(query, hits, throttle=limiter.wait)
+                timings["generate_s"] = time.perf_counter() - t0
+            error = "no LLM response" if hits["answer"] == kb.NO_LLM_RESPONSE else None  # retried on resume
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        timings["total_s"] = time.perf_counter() - started
+        record = result_record(item_id, query, hits, timings)
+        if error:
+            record["error"] = error
+        finish(record)
+
+    for start in range(0, len(items), encode_size):
+        batch = items[start:start + encode_size]
+        t0 = time.perf_counter()
+        try:
+            # In a worker thread so the answers already in flight keep streaming meanwhile
+            all_hits = await asyncio.to_thread(kb.retrieve_many, vectordb, [q for _, q, _ in batch], n_results,
+                                               [c for _, _, c in batch])
+        except Exception as e:
+            for item_id, query, _ in batch:
+                finish({"id": item_id, "mode": "retrieve" if retrieve_only else "answer", "query": query,
+                        "error": f"retrieval failed: {type(e).__name__}: {e}"})
+            continue
+        retrieve_s = (time.perf_counter() - t0) / len(batch)  # the batch's cost, shared per item
+        for (item_id, query, _), hits in zip(batch, all_hits):
+            timings = {"retrieve_s": retrieve_s}
+            if retrieve_only:
+                timings["total_s"] = retrieve_s
+                finish(result_record(item_id, query, hits, timings, mode="retrieve"))
+            else:
+                pending.add(asyncio.ensure_future(answer(item_id, query, hits, timings, t0)))
+        while len(pending) > concurrency:  # backpressure: don't retrieve far ahead of the LLM
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        print(f" Retrieved {min(start + encode_size, len(items))}/{len(items)}, answered {len(records)}")
+    if pending:
+        await asyncio.wait(pending)
+    return records
+
+
+def summarize(records, elapsed_s):
+    ok = [r for r in records if not r.get("error")]
+    totals = sorted(r["timings"]["total_s"] for r in ok)
+    print(f"\n {len(ok)} answered, {len(records) - len(ok)} failed in {elapsed_s:.1f}s "
+          f"({len(records) / elapsed_s if elapsed_s else 0:.1f} items/s)")
+    if totals:
+        p95 = totals[min(len(totals) - 1, int(0.95 * len(totals)))]
+        print(f" Per item: p50 {statistics.median(totals):.2f}s / p95 {p95:.2f}s; "
+              f"{sum(1 for r in ok if r.get('cache'))} answers from the answer cache")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a JSONL/CSV file of queries against the Dell KB")
+    parser.add_argument("input", help="queries (.jsonl or .csv)")
+    parser.add_argument("-o", "--output", required=True, help="results JSONL (appended to; resumes a previous run)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--rate", type=float, default=BATCH_RATE_PER_S, help="LLM call starts per second (0 = no limit)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_ENCODE_SIZE, help="queries per batched encode")
+    parser.add_argument("--k", type=int, default=kb.N_RESULTS)
+    parser.add_argument("--retrieve-only", action="store_true", help="skip the LLM, record retrieved chunks only")
+    args = parser.parse_args()
+
+    items = read_queries(args.input)
+    done = completed_ids(args.output, args.retrieve_only)
+    todo = [item for item in items if item[0] not in done]
+    print(f" {len(items)} queries, {len(items) - len(todo)} already done in {args.output}, {len(todo)} to go")
+    if not todo:
+        sys.exit(0)
+    if not args.retrieve_only and not kb.backend.has_llm():
+        sys.exit(1)
+    try:
+        vectordb = kb.load_vectorstore()
+    except kb.kb_index.IndexUnavailable as e:
+        print(f" {e}")
+        sys.exit(1)
+
+    writer = ResultWriter(args.output)
+    t0 = time.perf_counter()
+    try:
+        records = asyncio.run(run_batch(vectordb, todo, writer, args.concurrency, args.rate, args.batch_size,
+                                        args.k, args.retrieve_only))
+    finally:
+        writer.close()
+    summarize(records, time.perf_counter() - t0)
@@ -0,0 +1,196 @@
+"""
+Embedding backend benchmark: latency, memory and retrieval agreement.
+
+Each backend runs in its own interpreter (so RSS is not shared) over the same chunks of
+docs/dell-data and the same queries. Recall@k is measured against the first backend:
+the share of its top-k chunks per query that the other backend also returns.
+
+    python utils/bench_embeddings.py                                  # torch vs onnx vs onnx-int8
+    python utils/bench_embeddings.py --backends torch onnx-int8 --k 4 --json
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import kb_index
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_QUERIES = [
+    "laptop battery not charging",
+    "battery drains quickly when the lid is closed",
+    "blue screen CRITICAL_PROCESS_DIED after update",
+    "stop code INACCESSIBLE_BOOT_DEVICE",
+    "no bootable device found on startup",
+    "computer will not turn on, power light blinking",
+    "how to run ePSA diagnostics",
+    "update BIOS from Dell Support",
+    "touchpad not working",
+    "external monitor not detected over USB-C",
+    "screen flickering on battery power",
+    "Wi-Fi keeps disconnecting",
+    "laptop overheating and fan noise",
+    "keyboard backlight does not turn on",
+    "how to reset Windows to factory settings",
+    "SSD not detected in BIOS",
+    "replace the coin-cell battery",
+    "audio not working through headphones",
+    "ESD protection before working inside the computer",
+    "warranty and Dell support policy",
+]
+
+
+# Worker (runs one backend in a fresh process)
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(backend: str, model_name: str, data_path: str, out_path: str, batch_size: int):
+    with open(data_path, encoding="utf-8") as f:
+        data = json.load(f)
+    rss_start = rss_mb()
+    t0 = time.perf_counter()
+    embed = kb_index.get_embedding_function(model_name, backend)
+    embed(["warm up"])
+    load_s = time.perf_counter() - t0
+    rss_loaded = rss_mb()
+
+    latencies, query_vecs = [], []
+    for query in data["queries"]:
+        t = time.perf_counter()
+        query_vecs.append(embed([query])[0])
+        latencies.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    corpus_vecs = []
+    for start in range(0, len(data["chunks"]), batch_size):
+        corpus_vecs.extend(embed(data["chunks"][start:start + batch_size]))
+    corpus_s = time.perf_counter() - t
+
+    np.savez(out_path, queries=np.asarray(query_vecs, dtype=np.float32), corpus=np.asarray(corpus_vecs, dtype=np.float32))
+    latencies.sort()
+    print(json.dumps({
+        "backend": backend,
+        "load_s": round(load_s, 3),
+        "query_p50_ms": round(1000 * statistics.median(latencies), 2),
+        "query_p95_ms": round(1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        "corpus_chunks_per_s": round(len(data["chunks"]) / corpus_s, 1) if corpus_s else None,
+        "rss_model_mb": round(rss_loaded - rss_start, 1),
+        "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+# Comparison
+def unit(vecs):
+    return vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+
+
+def top_k(queries, corpus, k):
+    return np.argsort(-(unit(queries) @ unit(corpus).T), axis=1)[:, :k]
+
+
+def recall_at_k(reference, candidate) -> float:
+    k = reference.shape[1]
+    return float(np.mean([len(set(r) & set(c)) / k for r, c in zip(reference, candidate)]))
+
+
+def load_corpus(docs_folder: str, max_chunks: int):
+    from kb_chunking import chunk_file
+
+    chunks = []
+    for file in kb_index.list_docx_files(docs_folder):
+        chunks.extend(c["text"] for c in chunk_file(os.path.join(docs_folder, file)))
+        if len(chunks) >= max_chunks:
+            break
+    return chunks[:max_chunks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+                        help="first one is the reference for recall@k")
+    parser.add_argument("--model", default=kb_index.embed_model_name())
+    parser.add_argument("--docs", default=kb_index.DOCS_DIR)
+    parser.add_argument("--queries", help="file with one query per line (default: built-in support queries)")
+    parser.add_argument("--max-chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.model, args.data, args.out, args.batch_size)
+        return
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    chunks = load_corpus(args.docs, args.max_chunks)
+    if not chunks:
+        print(f" No chunks found in {args.docs}")
+        sys.exit(1)
+
+    results, vectors = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, "data.json")
+        with open(data_path, "w", encoding="utf-8") as f:
+            json.dump({"queries": queries, "chunks": chunks}, f)
+        for backend in args.backends:
+            out_path = os.path.join(tmp, f"{backend}.npz")
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", backend, "--model", args.model,
+                 "--data", data_path, "--out", out_path, "--batch-size", str(args.batch_size)],
+                cwd=UTILS_DIR, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                print(f" {backend} failed:\n{proc.stderr.strip()[-2000:]}")
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            with np.load(out_path) as npz:
+                vectors[backend] = (npz["queries"], npz["corpus"])
+
+    if not results:
+        sys.exit(1)
+    reference = results[0]["backend"]
+    ref_q, ref_c = vectors[reference]
+    ref_top = top_k(ref_q, ref_c, args.k)
+    for r in results:
+        q, c = vectors[r["backend"]]
+        r[f"recall@{args.k}_vs_{reference}"] = round(recall_at_k(ref_top, top_k(q, c, args.k)), 4)
+        r[f"mean_cosine_vs_{reference}"] = round(float(np.mean(np.sum(unit(c) * unit(ref_c), axis=1))), 4) \
+            if c.shape == ref_c.shape else None
+
+    summary = {"model": args.model, "chunks": len(chunks), "queries": len(queries), "k": args.k, "results": results}
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f" {args.model}: {len(chunks)} chunks, {len(queries)} queries, recall@{args.k} vs {reference}\n")
+    print(f" {'backend':<10} {'load s':>7} {'q p50 ms':>9} {'q p95 ms':>9} {'chunks/s':>9} "
+          f"{'model MB':>9} {'peak MB':>8} {'recall':>7} {'cosine':>7}")
+    for r in results:
+        print(f" {r['backend']:<10} {r['load_s']:>7} {r['query_p50_ms']:>9} {r['query_p95_ms']:>9} "
+              f"{r['corpus_chunks_per_s']:>9} {r['rss_model_mb']:>9} {r['rss_peak_mb']:>8} "
+              f"{r[f'recall@{args.k}_vs_{reference}']:>7} {str(r[f'mean_cosine_vs_{reference}']):>7}")
+
+
+if __name__ == "__main__":
+    main()
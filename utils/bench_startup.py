@@ -0,0 +1,95 @@
+"""
+Startup-time benchmark for the query module.
+
+Imports dell_knowledge_query_groq in fresh interpreters and fails (exit 1) if the best
+import time exceeds the budget or if any heavy dependency got imported eagerly:
+
+    python utils/bench_startup.py                 # 5 runs, 0.5s budget
+    python utils/bench_startup.py --runs 10 --budget 0.3 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE = "dell_knowledge_query_groq"
+STARTUP_BUDGET_S = float(os.getenv("STARTUP_BUDGET_S", "0.5"))
+
+# Must only be imported on first use, never by `import dell_knowledge_query_groq`
+HEAVY_MODULES = (
+    "chromadb", "sentence_transformers", "torch", "transformers", "numpy", "httpx",
+    "docx", "dotenv", "groq", "google.generativeai",
+)
+
+PROBE = f"""
+import json, sys, time
+t0 = time.perf_counter()
+import {MODULE}
+elapsed = time.perf_counter() - t0
+heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]
+print(json.dumps({{"import_s": elapsed, "heavy": heavy}}))
+"""
+
+
+def run_once(python: str):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="0")
+    out = subprocess.run([python, "-c", PROBE], cwd=UTILS_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(python: str, top: int = 8):
+    """Top-level cumulative import times (microseconds) from `python -X importtime`."""
+    out = subprocess.run([python, "-X", "importtime", "-c", f"import {MODULE}"], cwd=UTILS_DIR,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import time of the query module")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_S, help="max best-of-N import time (s)")
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    run_once(args.python)  # warm the bytecode cache so runs measure imports, not compilation
+    runs = [run_once(args.python) for _ in range(args.runs)]
+    times = [r["import_s"] for r in runs]
+    heavy = sorted({m for r in runs for m in r["heavy"]})
+    result = {
+        "module": MODULE,
+        "runs": args.runs,
+        "best_s": round(min(times), 4),
+        "median_s": round(statistics.median(times), 4),
+        "budget_s": args.budget,
+        "heavy_imports": heavy,
+        "ok": min(times) <= args.budget and not heavy,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f" import {MODULE}: best {result['best_s']}s, median {result['median_s']}s "
+              f"over {args.runs} runs (budget {args.budget}s)")
+        if heavy:
+            print(f" Eagerly imported heavy modules: {', '.join(heavy)}")
+        if not result["ok"]:
+            print(" Slowest imports:")
+            for us, name in slowest_imports(args.python):
+                print(f"  {us / 1e6:.3f}s {name}")
+        print(" OK" if result["ok"] else " FAILED")
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
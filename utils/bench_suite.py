@@ -0,0 +1,359 @@
+"""
+Offline benchmark suite: ingestion throughput, retrieval latency, recall@k and end-to-end
+answer latency against the local stub LLM server.
+
+Everything runs in a temporary index (chroma_dell_db/ is never touched) over docs/dell-data,
+optionally scaled up with synthetic variants of every document. Results go to JSON so runs
+can be compared between commits:
+
+    python utils/bench_suite.py                          # writes bench_results/<git sha>.json
+    python utils/bench_suite.py --scale 10 --rounds 5    # 10x synthetic corpus
+    python utils/bench_suite.py --compare bench_results/<old sha>.json --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(UTILS_DIR)
+LABELED_QUERIES = os.path.join(BASE_DIR, "docs", "bench", "labeled_queries.jsonl")
+RESULTS_DIR = os.path.join(BASE_DIR, "bench_results")
+PRODUCT_NAMES = ["Inspiron", "Latitude", "XPS", "Vostro", "Precision", "Alienware", "OptiPlex"]
+SYNTHETIC_RE = re.compile(r" \(synthetic \d+\)(?=\.docx$)")
+REGRESSION_TOLERANCE = 0.10  # relative change that counts as a regression in --compare
+
+# (section, metric, higher is better) compared by --compare
+KEY_METRICS = [
+    ("parse", "chunks_per_s", True),
+    ("ingest", "cold_chunks_per_s", True),
+    ("ingest", "cold_embeddings_per_s", True),
+    ("ingest", "warm_resync_s", False),
+    ("query", "vector_query_ms.p50", False),
+    ("query", "vector_query_ms.p95", False),
+    ("query", "vector_query_ms.p99", False),
+    ("query", "hybrid_retrieve_ms.p95", False),
+    ("recall", "vector.recall@4", True),
+    ("recall", "hybrid.recall@4", True),
+    ("e2e", "get_ai_response_ms.p50", False),
+    ("e2e", "get_ai_response_ms.p95", False),
+    ("e2e", "stream_ttft_ms.p95", False),
+]
+
+
+def percentiles(samples_s) -> dict:
+    """p50/p95/p99/mean in milliseconds."""
+    ms = sorted(1000 * s for s in samples_s)
+    if not ms:
+        return {"n": 0}
+    pick = lambda p: round(ms[min(len(ms) - 1, int(len(ms) * p))], 3)
+    return {"n": len(ms), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "mean": round(statistics.mean(ms), 3)}
+
+
+def git_sha() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or "nogit"
+    except OSError:
+        return "nogit"
+
+
+def load_labeled(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Synthetic Corpus
+def perturb_docx(src: str, dst: str, variant: int):
+    """A distinct but realistic copy: product names rotated and every body paragraph tagged."""
+    from docx import Document as DocxDocument
+    from kb_chunking import heading_level
+
+    names = PRODUCT_NAMES[variant % len(PRODUCT_NAMES):] + PRODUCT_NAMES[:variant % len(PRODUCT_NAMES)]
+    swap = dict(zip(PRODUCT_NAMES, names))
+    doc = DocxDocument(src)
+    for i, paragraph in enumerate(doc.paragraphs):
+        if not paragraph.text.strip():
+            continue
+        for run in paragraph.runs:
+            for old, new in swap.items():
+                if old in run.text:
+                    run.text = run.text.replace(old, new)
+        if heading_level(paragraph) is None:
+            paragraph.add_run(f" [KB-{variant:03d}-{i}]")
+    doc.save(dst)
+
+
+def build_corpus(docs_folder: str, target: str, scale: int):
+    """Copies the corpus into target and adds scale-1 synthetic variants of every document."""
+    import kb_index
+
+    os.makedirs(target, exist_ok=True)
+    for file in kb_index.list_docx_files(docs_folder):
+        src = os.path.join(docs_folder, file)
+        shutil.copy(src, os.path.join(target, file))
+        for variant in range(1, scale):
+            perturb_docx(src, os.path.join(target, f"{file[:-5]} (synthetic {variant}).docx"), variant)
+    return len(kb_index.list_docx_files(target))
+
+
+# Stages
+def bench_parse(docs_folder: str, workers: int = None) -> dict:
+    """Parse + chunk throughput of the streaming parser behind sync_index (store_embedding/create_vectorstore)."""
+    import ingest_pipeline
+    import kb_index
+    from kb_chunking import chunk_file
+
+    files = kb_index.list_docx_files(docs_folder)
+    docs = chunks = 0
+    t0 = time.perf_counter()
+    for _, parsed, error in ingest_pipeline.parse_stream(chunk_file, docs_folder, files, workers):
+        if not error:
+            docs += 1
+            chunks += len(parsed)
+    elapsed = time.perf_counter() - t0
+    return {"docs": docs, "chunks": chunks, "elapsed_s": round(elapsed, 3),
+            "docs_per_s": round(docs / elapsed, 2), "chunks_per_s": round(chunks / elapsed, 2)}
+
+
+def bench_ingest(docs_folder: str, db_dir: str, workers: int = None):
+    """Cold build (what create_vectorstore does on a fresh install) and a no-op re-sync."""
+    import ingest_pipeline
+    from kb_chunking import chunk_file
+
+    collection, cold = ingest_pipeline.sync_index(chunk_file, docs_folder=docs_folder, db_dir=db_dir, workers=workers)
+    t0 = time.perf_counter()
+    collection, warm = ingest_pipeline.sync_index(chunk_file, docs_folder=docs_folder, db_dir=db_dir, workers=workers)
+    result = {
+        "records": collection.count(),
+        "cold_elapsed_s": cold["elapsed_s"],
+        "cold_docs_per_s": cold["docs_per_s"],
+        "cold_chunks_per_s": cold["chunks_per_s"],
+        "cold_embeddings_per_s": cold["embeddings_per_s"],
+        "duplicates_exact": cold["duplicates_exact"],
+        "duplicates_near": cold["duplicates_near"],
+        "warm_resync_s": round(time.perf_counter() - t0, 3),
+        "warm_chunks_embedded": warm["chunks_embedded"],
+    }
+    return collection, result
+
+
+def bench_queries(kb, collection, queries, rounds: int, k: int) -> dict:
+    """Latency of query embedding, vectordb.query and the full (hybrid) retrieve()."""
+    embed = kb.backend.embedding_function
+    embed(["warm up"])
+    kb.retrieve(collection, queries[0], k)
+    embed_s, query_s, retrieve_s = [], [], []
+    for _ in range(rounds):
+        for query in queries:
+            t0 = time.perf_counter()
+            vec = embed([query])[0]
+            t1 = time.perf_counter()
+            collection.query(query_embeddings=[vec], n_results=k)
+            t2 = time.perf_counter()
+            kb.retrieve(collection, query, k)
+            t3 = time.perf_counter()
+            embed_s.append(t1 - t0)
+            query_s.append(t2 - t1)
+            retrieve_s.append(t3 - t2)
+    return {
+        "k": k,
+        "embed_query_ms": percentiles(embed_s),
+        "vector_query_ms": percentiles(query_s),
+        "hybrid_retrieve_ms": percentiles(retrieve_s),
+    }
+
+
+def bench_recall(kb, collection, labeled, ks=(1, 4, 10)) -> dict:
+    """Share of labeled questions with a chunk from a relevant doc in the top k, plus MRR@max(k)."""
+    depth = max(ks)
+
+    def relevant(meta, sources):
+        names = (meta or {}).get("sources") or (meta or {}).get("source") or ""
+        return any(SYNTHETIC_RE.sub("", name) in sources for name in names.split("|"))
+
+    def score(ranked_metas):
+        out = {f"recall@{k}": 0.0 for k in ks}
+        rr = 0.0
+        for metas, item in ranked_metas:
+            hits = [relevant(m, set(item["sources"])) for m in metas]
+            for k in ks:
+                out[f"recall@{k}"] += any(hits[:k])
+            rr += next((1.0 / (i + 1) for i, hit in enumerate(hits) if hit), 0.0)
+        n = len(ranked_metas)
+        result = {key: round(value / n, 4) for key, value in out.items()}
+        result[f"mrr@{depth}"] = round(rr / n, 4)
+        return result
+
+    embed = kb.backend.embedding_function
+    vector, hybrid = [], []
+    for item in labeled:
+        res = collection.query(query_embeddings=[embed([item["query"]])[0]], n_results=depth, include=["metadatas"])
+        vector.append((res["metadatas"][0], item))
+        hybrid.append((kb.retrieve(collection, item["query"], depth)["metadatas"], item))
+    return {"queries": len(labeled), "vector": score(vector), "hybrid": score(hybrid)}
+
+
+def bench_e2e(kb, collection, queries, rounds: int, k: int) -> dict:
+    """get_ai_response and streamed answers (TTFT) against the stub LLM server, answer cache bypassed."""
+    kb.backend.llm  # built now, pointed at the stub through GROQ_BASE_URL/GEMINI_BASE_URL
+    total_s, ttft_s, stream_s, cached_s = [], [], [], []
+    for _ in range(rounds):
+        for query in queries:
+            hits = kb.retrieve(collection, query, k)
+            t0 = time.perf_counter()
+            kb.get_ai_response(query, hits["documents"], hits["ids"], hits["metadatas"])
+            total_s.append(time.perf_counter() - t0)
+
+            kb.backend.answer_cache.clear()
+            t0 = time.perf_counter()
+            first = None
+            for _ in kb.stream_answer(query, hits):
+                first = first or time.perf_counter()
+            stream_s.append(time.perf_counter() - t0)
+            if first:
+                ttft_s.append(first - t0)
+            t0 = time.perf_counter()
+            for _ in kb.stream_answer(query, hits):
+                pass
+            cached_s.append(time.perf_counter() - t0)
+    return {
+        "get_ai_response_ms": percentiles(total_s),
+        "stream_ttft_ms": percentiles(ttft_s),
+        "stream_total_ms": percentiles(stream_s),
+        "cached_answer_ms": percentiles(cached_s),
+        "llm": kb.backend.llm.stats(),
+    }
+
+
+# Comparison
+def metric(results: dict, section: str, path: str):
+    value = results.get(section, {})
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(old: dict, new: dict, tolerance: float = REGRESSION_TOLERANCE):
+    """Prints key metrics side by side; returns the list of regressions."""
+    regressions = []
+    old_meta, new_meta = old.get("meta", {}), new.get("meta", {})
+    print(f"\n Comparison: {old_meta.get('git_sha')} -> {new_meta.get('git_sha')}")
+    differing = [key for key in ("scale", "docs", "rounds", "k", "embed_model", "embed_backend", "cpus")
+                 if old_meta.get(key) != new_meta.get(key)]
+    if differing:
+        print(f"  (runs differ in {', '.join(differing)}; numbers are not directly comparable)")
+    for section, path, higher_better in KEY_METRICS:
+        a, b = metric(old, section, path), metric(new, section, path)
+        if a is None or b is None:
+            continue
+        change = (b - a) / a if a else 0.0
+        worse = -change if higher_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(f"{section}.{path}")
+        print(f"  {section}.{path:<28} {a:>10} -> {b:>10} ({change:+.1%}){flag}")
+    return regressions
+
+
+# Main
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline performance benchmark suite")
+    parser.add_argument("--docs", default=os.path.join(BASE_DIR, "docs", "dell-data"))
+    parser.add_argument("--scale", type=int, default=1, help="corpus multiplier (synthetic variants per document)")
+    parser.add_argument("--labeled", default=LABELED_QUERIES)
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the labeled queries for latency stats")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--stub-ttft", type=float, default=0.25, help="stub LLM time to first token (s)")
+    parser.add_argument("--stub-token-delay", type=float, default=0.01, help="stub LLM delay per token (s)")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["parse", "ingest", "query", "recall", "e2e"])
+    parser.add_argument("--embed-cache", action="store_true", help="keep the embedding cache on (warm ingest numbers)")
+    parser.add_argument("--out", help="result file (default bench_results/<git sha>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    work = tempfile.mkdtemp(prefix="dell-kb-bench-")
+    db_dir = os.path.join(work, "db")
+
+    # Must be set before the modules that read them are imported
+    os.environ["EMBED_CACHE"] = "1" if args.embed_cache else "0"
+    os.environ["EMBED_CACHE_DIR"] = os.path.join(work, "embed_cache")
+    os.environ["ANSWER_CACHE_DB"] = ""
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    import stub_llm_server
+    server, groq_url, gemini_url = stub_llm_server.start_stub_server(
+        0, stub_llm_server.StubConfig(ttft=args.stub_ttft, token_delay=args.stub_token_delay))
+    os.environ.update(GROQ_BASE_URL=groq_url, GEMINI_BASE_URL=gemini_url, GROQ_API_KEY="stub", GEMINI_API_KEY="stub")
+
+    import kb_index
+    import dell_knowledge_query_groq as kb
+
+    kb.backend.db_dir = db_dir
+    labeled = load_labeled(args.labeled)
+    queries = [item["query"] for item in labeled]
+    results = {"meta": {
+        "git_sha": git_sha(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+        "platform": platform.platform(), "cpus": os.cpu_count(), "embed_model": kb_index.embed_model_name(),
+        "embed_backend": kb_index.embed_backend_name(), "scale": args.scale, "rounds": args.rounds, "k": args.k,
+        "stub_ttft_s": args.stub_ttft, "stub_token_delay_s": args.stub_token_delay,
+    }}
+
+    try:
+        docs_folder = args.docs
+        if args.scale > 1:
+            docs_folder = os.path.join(work, "docs")
+            print(f" Building {args.scale}x synthetic corpus...")
+            results["meta"]["docs"] = build_corpus(args.docs, docs_folder, args.scale)
+        else:
+            results["meta"]["docs"] = len(kb_index.list_docx_files(docs_folder))
+
+        if "parse" not in args.skip:
+            print(" Parsing...")
+            results["parse"] = bench_parse(docs_folder, args.workers)
+        print(" Ingesting...")
+        collection, ingest = bench_ingest(docs_folder, db_dir, args.workers)
+        if "ingest" not in args.skip:
+            results["ingest"] = ingest
+        if "query" not in args.skip:
+            print(" Query latency...")
+            results["query"] = bench_queries(kb, collection, queries, args.rounds, args.k)
+        if "recall" not in args.skip:
+            print(" Recall...")
+            results["recall"] = bench_recall(kb, collection, labeled)
+        if "e2e" not in args.skip:
+            print(" End-to-end answers (stub LLM)...")
+            results["e2e"] = bench_e2e(kb, collection, queries, args.rounds, args.k)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work, ignore_errors=True)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{results['meta']['git_sha']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({key: value for key, value in results.items() if key != "meta"}, indent=2))
+    print(f"\n Results written to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), results)
+        if regressions and args.fail_on_regression:
+            print(f" {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import json
+import time
+
+from ticket_store import SUPPORT_DB, get_database
+
+
+# Configuration
+CHAT_WINDOW = 20  # messages loaded per ticket view; older ones on demand
+CHANNELS = ("user", "rag")  # user <-> agent chat, and the agent's RAG assistant thread
+
+
+# Chat Log
+CHAT_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS messages (seq INTEGER PRIMARY KEY AUTOINCREMENT, ticket_id TEXT NOT NULL, "
+    "channel TEXT NOT NULL, sender TEXT NOT NULL, role TEXT NOT NULL, ts REAL NOT NULL, body TEXT NOT NULL, "
+    "meta TEXT)",
+    "CREATE INDEX IF NOT EXISTS messages_ticket ON messages (ticket_id, channel, seq)",
+)
+
+
+class ChatLog:
+    """
+    Append-only message log per (ticket, channel), stored next to the tickets.
+
+    Records are {seq, ticket_id, channel, sender, role, ts, body, meta}; role is
+    "user", "agent" or "rag". Messages are never updated or deleted, and reads are
+    windows over the (ticket_id, channel, seq) index, so loading the latest messages
+    of a long ticket costs the same as for a short one.
+    """
+
+    def __init__(self, db_path: str = SUPPORT_DB):
+        self.db = get_database(db_path)
+        self.db.ensure_schema("messages", CHAT_SCHEMA)
+
+    @staticmethod
+    def to_dict(row) -> dict:
+        record = dict(row)
+        record["meta"] = json.loads(record["meta"]) if record["meta"] else {}
+        return record
+
+    def append(self, ticket_id: str, channel: str, sender: str, role: str, body: str, meta: dict = None) -> dict:
+        if channel not in CHANNELS:
+            raise ValueError(f"unknown chat channel {channel!r}")
+        ts = time.time()
+        conn = self.db.connect()
+        with self.db.transaction(conn):
+            cur = conn.execute(
+                "INSERT INTO messages (ticket_id, channel, sender, role, ts, body, meta) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (ticket_id, channel, sender, role, ts, body, json.dumps(meta) if meta else None),
+            )
+        return {"seq": cur.lastrowid, "ticket_id": ticket_id, "channel": channel, "sender": sender,
+                "role": role, "ts": ts, "body": body, "meta": meta or {}}
+
+    def window(self, ticket_id: str, channel: str, limit: int = CHAT_WINDOW, before_seq: int = None):
+        """
+        The `limit` messages preceding before_seq (default: the latest ones), oldest first.
+        Pass the first returned seq as before_seq to page further back.
+        """
+        sql = "SELECT * FROM messages WHERE ticket_id = ? AND channel = ?"
+        params = [ticket_id, channel]
+        if before_seq is not None:
+            sql += " AND seq < ?"
+            params.append(before_seq)
+        rows = self.db.connect().execute(sql + " ORDER BY seq DESC LIMIT ?", (*params, limit)).fetchall()
+        return [self.to_dict(row) for row in reversed(rows)]
+
+    def count(self, ticket_id: str, channel: str) -> int:
+        return self.db.connect().execute(
+            "SELECT COUNT(*) FROM messages WHERE ticket_id = ? AND channel = ?", (ticket_id, channel)
+        ).fetchone()[0]
@@ -1,23 +1,21 @@
-from dotenv import load_dotenv
+"""
+Dell KB query path: retrieval, cached answers and streamed LLM responses.
+
+Importing this module is cheap. .env, chromadb, the embedding model, numpy and the LLM
+clients are only loaded when `backend` (or a function using it) is first touched, so the
+Streamlit app and scripts can import it freely. `python utils/bench_startup.py` guards
+the import time.
+"""
 from pathlib import Path
+import functools
 import os
 import sys
-import re
-from docx import Document as DocxDocument
-from chromadb import Client
-from chromadb.utils import embedding_functions
-from groq import Groq
-import google.generativeai as genai  
-
-#Load environment variables
-env_path = Path(__file__).resolve().parent.parent / ".env"
-print(" Loading .env from:", env_path)
-
-load_dotenv(dotenv_path=env_path)
-
-# Optional check 
-#print(" GEMINI_API_KEY:", os.getenv("GEMINI_API_KEY"))
-#print(" GROQ_API_KEY:", os.getenv("GROQ_API_KEY"))
+import threading
+import time
+import kb_context
+import kb_index
+import kb_metrics
+from kb_metrics import event, span, tokens
 
 
 # Disable tokenizers parallelism warnings
@@ -25,36 +23,166 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 
 # Configuration
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-DOCS_DIR = os.path.join(BASE_DIR, "docs", "dell-data")
-MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-
-
-# API Keys
-GROQ_KEY = os.getenv("GROQ_API_KEY")
-GEMINI_KEY = os.getenv("GEMINI_API_KEY")
-
-if not GROQ_KEY and not GEMINI_KEY:
-    print(" No LLM API keys found. Set GROQ_API_KEY or GEMINI_API_KEY in environment.")
-    sys.exit(1)
-
-
-# Initialize LLM Clients
-try:
-    groq_client = Groq(api_key=GROQ_KEY) if GROQ_KEY else None
-except Exception as e:
-    groq_client = None
-    print(f" Groq client failed to initialize: {e}")
-
-try:
-    if GEMINI_KEY:
-        genai.configure(api_key=GEMINI_KEY)
-        gemini_model = genai.GenerativeModel("gemini-2.5-pro")
-    else:
-        gemini_model = None
-except Exception as e:
-    gemini_model = None
-    print(f" Gemini client failed to initialize: {e}")
+ENV_PATH = Path(__file__).resolve().parent.parent / ".env"
+BASE_DIR = kb_index.BASE_DIR
+DOCS_DIR = kb_index.DOCS_DIR
+N_RESULTS = 4
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") != "0"  # fuse BM25 with vector results
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))  # per-retriever depth before fusion
+# Route each query to its closest documents first, then search only their chunks:
+# "auto" does so once the KB has TWO_STAGE_MIN_DOCS documents, "1" always, "0" never
+TWO_STAGE_SEARCH = os.getenv("TWO_STAGE_SEARCH", "auto")
+TWO_STAGE_MIN_DOCS = int(os.getenv("TWO_STAGE_MIN_DOCS", "50"))
+FLAT_SEARCH = os.getenv("FLAT_SEARCH", "0") == "1"  # exact search over the memory-mapped export (kb_flat), no chromadb
+NO_LLM_RESPONSE = " No LLM available to generate a response."
+
+
+@functools.lru_cache(maxsize=None)
+def load_env():
+    """Loads .env once (existing environment variables win)."""
+    from dotenv import load_dotenv
+
+    print(" Loading .env from:", ENV_PATH)
+    load_dotenv(dotenv_path=ENV_PATH)
+
+
+def lazy(build):
+    """Like functools.cached_property, but builds at most once when several threads ask at once."""
+    lock = threading.Lock()
+    name = build.__name__
+
+    @functools.wraps(build)
+    def get(self):
+        value = self.__dict__.get(name)
+        if value is None:
+            with lock:
+                value = self.__dict__.get(name)
+                if value is None:
+                    value = self.__dict__[name] = build(self)
+        return value
+
+    return property(get)
+
+
+# Lazily Built Resources
+class Backend:
+    """Process-wide resources of the query path, each created on first access."""
+
+    def __init__(self, db_dir=None):
+        self.db_dir = db_dir  # index directory; None follows the active slot (kb_index.active_db_dir())
+        self.lexical = None
+        self.lexical_dir = None
+        self.lexical_lock = threading.Lock()
+        self.docs = None  # (db_dir, corpus version, document index or None, documents in it, {file: record ids})
+        self.docs_lock = threading.Lock()
+        self.category_embeddings = {}
+
+    def index_dir(self):
+        return self.db_dir or kb_index.active_db_dir()
+
+    @lazy
+    def model_name(self):
+        load_env()
+        return kb_index.embed_model_name()
+
+    @lazy
+    def embedding_function(self):
+        if FLAT_SEARCH:
+            import kb_flat
+
+            return kb_flat.Encoder(self.model_name)
+        return kb_index.get_embedding_function(self.model_name)
+
+    @lazy
+    def answer_cache(self):
+        from answer_cache import AnswerCache
+
+        return AnswerCache()
+
+    @lazy
+    def llm(self):
+        """Groq first, Gemini as hedge/fallback; without keys every answer is NO_LLM_RESPONSE."""
+        load_env()
+        import llm_providers
+
+        groq_key, gemini_key = os.getenv("GROQ_API_KEY"), os.getenv("GEMINI_API_KEY")
+        if not groq_key and not gemini_key:
+            print(" No LLM API keys found. Set GROQ_API_KEY or GEMINI_API_KEY in environment.")
+        return llm_providers.LLMScheduler.from_keys(groq_key=groq_key, gemini_key=gemini_key)
+
+    def lexical_index(self, vectordb):
+        """BM25 index for vectordb's corpus version (reloaded or rebuilt after a re-index or slot switch)."""
+        version = (vectordb.metadata or {}).get("corpus_version")
+        db_dir = self.index_dir()
+        with self.lexical_lock:
+            if self.lexical is None or self.lexical.version != version or self.lexical_dir != db_dir:
+                import kb_lexical
+
+                self.lexical = kb_lexical.open_lexical(vectordb, db_dir)
+                self.lexical_dir = db_dir
+        return self.lexical
+
+    def doc_index(self, vectordb):
+        """
+        (document index, {file: chunk record ids}) for the two-stage search of vectordb, or None
+        when it is off, missing or stale.
+        """
+        if TWO_STAGE_SEARCH == "0" or getattr(vectordb, "exact", False):
+            return None
+        version = (vectordb.metadata or {}).get("corpus_version")
+        db_dir = self.index_dir()
+        with self.docs_lock:
+            if self.docs is None or self.docs[:2] != (db_dir, version):
+                import kb_routing
+
+                docs = kb_routing.open_doc_index(vectordb, db_dir)
+                members = kb_routing.doc_records(db_dir) if docs is not None else {}
+                self.docs = (db_dir, version, docs, docs.count() if docs is not None else 0, members)
+            _, _, docs, count, members = self.docs
+        if docs is None or count == 0 or TWO_STAGE_SEARCH != "1" and count < TWO_STAGE_MIN_DOCS:
+            return None
+        return docs, members
+
+    def index_changed(self):
+        """
+        Forgets the BM25 and document indexes of the old corpus version after this process
+        synced the index (e.g. an upload); callers must also reopen their collection, whose
+        metadata still carries the old version.
+        """
+        with self.lexical_lock:
+            self.lexical = None
+        with self.docs_lock:
+            self.docs = None
+
+    def category_embedding(self, category):
+        """Embedding of the category's routing hint (kb_routing.CATEGORY_HINTS); None for other categories."""
+        import kb_routing
+
+        hint = kb_routing.CATEGORY_HINTS.get(category)
+        if hint is None:
+            return None
+        if category not in self.category_embeddings:
+            self.category_embeddings[category] = self.embedding_function([hint])[0]
+        return self.category_embeddings[category]
+
+    def has_llm(self) -> bool:
+        return bool(self.llm.providers)
+
+
+backend = Backend()
+
+
+def __getattr__(name):
+    """Keeps the old module-level names (MODEL_NAME, llm, answer_cache, ...) working, built lazily."""
+    if name == "MODEL_NAME":
+        return backend.model_name
+    if name in ("llm", "answer_cache"):
+        return getattr(backend, name)
+    if name == "FALLBACK_NOTICE":
+        import llm_providers
+
+        return llm_providers.FALLBACK_NOTICE
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Document & Chunking Utilities
@@ -64,62 +192,71 @@ class Document:
         self.metadata = metadata or {}
 
 
-def read_docx(filepath):
-    doc = DocxDocument(filepath)
-    return "\n".join([p.text.strip() for p in doc.paragraphs if p.text.strip()])
-
-
-def semantic_chunk_text(text):
-    text = re.sub(r'\n{3,}', '\n\n', text.strip())
-    chunks = re.split(r'\n\s*\n', text)
-    return [c.strip() for c in chunks if c.strip()]
-
-
 # Chroma Vectorstore
 def create_vectorstore():
-    if not os.path.exists(DOCS_DIR) or not os.listdir(DOCS_DIR):
-        print(f" No .docx files found in {DOCS_DIR}")
-        sys.exit(1)
-
-    docs = []
-    for file in sorted(os.listdir(DOCS_DIR)):
-        if file.lower().endswith(".docx"):
-            filepath = os.path.join(DOCS_DIR, file)
-            text = read_docx(filepath)
-            if not text:
-                continue
-            chunks = semantic_chunk_text(text)
-            for idx, chunk in enumerate(chunks):
-                docs.append(Document(page_content=chunk, metadata={"source": file, "chunk": idx}))
-            print(f" {len(chunks)} semantic chunks created from {file}")
-
-    embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=MODEL_NAME)
-    chroma = Client()
-    vectordb = chroma.create_collection(name="dell_kb", embedding_function=embedding_func)
-    vectordb.add(
-        documents=[d.page_content for d in docs],
-        metadatas=[d.metadata for d in docs],
-        ids=[str(i) for i in range(len(docs))],
-    )
-    print(f"\n Vectorstore created with {len(docs)} total semantic chunks\n")
+    """Creates or incrementally updates the persisted index (and its flat export, if any) from the .docx corpus."""
+    import ingest_pipeline
+    import kb_flat
+    from kb_chunking import chunk_file
+
+    if not kb_index.list_docx_files(DOCS_DIR):
+        raise kb_index.IndexUnavailable(f"no .docx files found in {DOCS_DIR}")
+
+    with kb_index.index_lock():
+        db_dir = backend.index_dir()
+        vectordb, report = ingest_pipeline.sync_index(chunk_file, docs_folder=DOCS_DIR, db_dir=db_dir,
+                                                      model_name=backend.model_name)
+        print(kb_index.format_sync_report(report))
+        kb_flat.refresh_export(vectordb, report, db_dir)
+    backend.answer_cache.purge_missing(vectordb)
+    print(f"\n Vectorstore ready with {vectordb.count()} total chunks in {db_dir}\n")
     return vectordb
 
 
-def load_vectorstore():
-    chroma = Client()
+def load_vectorstore(sync_if_stale: bool = True):
+    """
+    Opens the persisted index; rebuilds it only if it is missing or stale. Without
+    sync_if_stale (the Streamlit app) nothing is ever embedded: a stale index is served as is,
+    and a missing or incompatible one raises IndexUnavailable.
+    """
+    db_dir = backend.index_dir()
+    if FLAT_SEARCH:
+        import kb_flat
+
+        try:
+            vectordb = kb_flat.open_flat(model_name=backend.model_name, docs_folder=DOCS_DIR, db_dir=db_dir,
+                                         embedding_function=backend.embedding_function, stale_ok=not sync_if_stale)
+            print(f" Loaded flat index ({vectordb.count()} chunks, exact search) from {db_dir}")
+            backend.answer_cache.purge_missing(vectordb)
+            return vectordb
+        except kb_index.IndexUnavailable as e:
+            print(f"ℹ Flat index unusable ({e}). Using the Chroma index...")
     try:
-        return chroma.get_collection(name="dell_kb")
-    except Exception:
-        print("ℹ Chroma DB not found. Creating from docs...")
+        vectordb = kb_index.open_collection(model_name=backend.model_name, docs_folder=DOCS_DIR, db_dir=db_dir,
+                                            stale_ok=not sync_if_stale)
+        print(f" Loaded persisted index ({vectordb.count()} chunks) from {db_dir}")
+        backend.answer_cache.purge_missing(vectordb)
+        return vectordb
+    except kb_index.IndexUnavailable as e:
+        if not sync_if_stale:
+            raise
+        print(f"ℹ Persisted index unusable ({e}). Updating from docs...")
         return create_vectorstore()
 
 
 # AI Query with Fallback
-def get_ai_response(query, docs):
-    context = "\n\n".join(docs)
+def build_prompt(query, docs, ids=None, metadatas=None):
+    """
+    Prompt over a token-budgeted context (see kb_context.build_context).
+    Returns (prompt, context_report); the report includes the prompt's total tokens.
+    """
+    with span("build_context", chunks=len(docs)) as s:
+        context, report = kb_context.build_context(docs, ids, metadatas)
+        s.set(context_tokens=report["context_tokens"], parts=report["parts"])
     prompt = f"""
 You are a Dell technical support assistant.
 Use the following Dell documentation to answer the question.
+Each excerpt is tagged [n] with its source; cite the tags you used.
 
 Context:
 {context}
@@ -128,28 +265,185 @@ Question: {query}
 
 Answer clearly and helpfully.
 """
-
-    # Primary: Groq
-    if groq_client:
-        try:
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f" Groq failed: {e}")
-
-    # Fallback: Gemini
-    if gemini_model:
-        try:
-            gemini_response = gemini_model.generate_content(prompt)
-            return gemini_response.text.strip()
-        except Exception as e2:
-            print(f" Gemini failed: {e2}")
-
-    return " No LLM available to generate a response."
+    report["prompt_tokens"] = kb_context.count_tokens(prompt)
+    tokens("context", report["context_tokens"])
+    tokens("prompt", report["prompt_tokens"])
+    return prompt, report
+
+
+def get_ai_response(query, docs, ids=None, metadatas=None):
+    prompt, _ = build_prompt(query, docs, ids, metadatas)
+    result = backend.llm.complete(prompt)
+    return result.text or NO_LLM_RESPONSE
+
+
+def ttft_summary():
+    """Per-provider calls, failures and p50/p95 time-to-first-token from the scheduler."""
+    return {name: s for name, s in backend.llm.stats().items() if isinstance(s, dict) and s["calls"]}
+
+
+# Retrieval + Cached Answers
+def retrieve(vectordb, query, n_results=N_RESULTS, category=None):
+    """
+    Embeds the query once and returns the matching chunks with their ids and metadata.
+
+    With HYBRID_SEARCH on, the top HYBRID_CANDIDATES of the vector search and of the BM25
+    index are fused by reciprocal rank, so exact error codes and model numbers make it
+    into the top n_results; hits["ranks"] records each chunk's (vector, bm25) rank.
+    With the two-stage search on, the vector search only covers the chunks of the
+    kb_routing.ROUTE_DOCS documents closest to the query (nudged towards the ticket
+    category, if given), listed in hits["routed"]; BM25 still covers the whole KB.
+    """
+    return retrieve_many(vectordb, [query], n_results, [category])[0]
+
+
+def retrieve_many(vectordb, queries, n_results=N_RESULTS, categories=None):
+    """
+    retrieve() for a list of queries: one batched encode, and one vector query for all of them
+    (with the two-stage search: one per distinct set of routed documents).
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    with span("embed_query", queries=len(queries)):
+        query_embeddings = list(backend.embedding_function(queries))
+    depth = max(n_results, HYBRID_CANDIDATES) if HYBRID_SEARCH else n_results
+    routing = backend.doc_index(vectordb)
+    if routing is None:
+        with span("vector_query", n_results=depth, queries=len(queries)):
+            results = vectordb.query(query_embeddings=query_embeddings, n_results=depth)
+        return [hybrid_hits(vectordb, query, query_embeddings[i], results, i, n_results, depth)
+                for i, query in enumerate(queries)]
+
+    import kb_routing
+
+    docs, members = routing
+    with span("route_docs", queries=len(queries)):
+        hints = [backend.category_embedding(c) for c in categories or []]
+        routed = kb_routing.route(docs, kb_routing.routing_vectors(query_embeddings, hints))
+    # Chroma applies one ids filter to a whole query call, so queries routed to the same
+    # documents share a call; the others fall back to one call per set of routed documents.
+    groups = {}
+    for i, files in enumerate(routed):
+        groups.setdefault(tuple(sorted(files)), []).append(i)
+    all_hits = [None] * len(queries)
+    for files, members_of in groups.items():
+        with span("vector_query", n_results=depth, documents=len(files), queries=len(members_of)):
+            results = vectordb.query(query_embeddings=[query_embeddings[i] for i in members_of], n_results=depth,
+                                     ids=list(dict.fromkeys(rid for file in files for rid in members.get(file, ()))))
+        for j, i in enumerate(members_of):
+            hits = hybrid_hits(vectordb, queries[i], query_embeddings[i], results, j, n_results, depth)
+            hits["routed"] = routed[i]
+            all_hits[i] = hits
+    return all_hits
+
+
+def hybrid_hits(vectordb, query, query_embedding, results, i, n_results, depth):
+    """Hits of the i-th query of a vector query result, fused with BM25 when HYBRID_SEARCH is on."""
+    hits = {
+        "query_embedding": query_embedding,
+        "documents": results["documents"][i] if results else [],
+        "ids": results["ids"][i] if results else [],
+        "metadatas": results["metadatas"][i] if results else [],
+    }
+    if not HYBRID_SEARCH:
+        return hits
+
+    import kb_lexical
+
+    with span("bm25_search", n_results=depth):
+        lexical_ids = [cid for cid, _ in backend.lexical_index(vectordb).search(query, depth)]
+    fused = [cid for cid, _ in kb_lexical.rrf_fuse([hits["ids"], lexical_ids])][:n_results]
+    found = {cid: (doc, meta) for cid, doc, meta in zip(hits["ids"], hits["documents"], hits["metadatas"])}
+    missing = [cid for cid in fused if cid not in found]
+    if missing:
+        extra = vectordb.get(ids=missing, include=["documents", "metadatas"])
+        found.update({cid: (doc, meta) for cid, doc, meta in zip(extra["ids"], extra["documents"], extra["metadatas"])})
+    fused = [cid for cid in fused if cid in found]
+    rank = lambda ids, cid: ids.index(cid) + 1 if cid in ids else None
+    vector_ids = hits["ids"]
+    hits["ids"] = fused
+    hits["documents"] = [found[cid][0] for cid in fused]
+    hits["metadatas"] = [found[cid][1] for cid in fused]
+    hits["ranks"] = [(rank(vector_ids, cid), rank(lexical_ids, cid)) for cid in fused]
+    return hits
+
+
+def stream_answer(query, hits):
+    """
+    Yields the answer for retrieved hits token by token; a cached answer is yielded whole.
+    Fills hits["answer"], hits["cache"], hits["provider"] and hits["context"] (the
+    context builder's report) once exhausted.
+    """
+    hits["answer"], hits["cache"], hits["provider"], hits["context"] = None, None, None, None
+    if not hits["documents"]:
+        return
+
+    answer, level = backend.answer_cache.lookup(query, hits["query_embedding"], hits["ids"])
+    if answer is not None:
+        hits["answer"], hits["cache"] = answer, level
+        event("answer_cache_hit", level=level)
+        yield answer
+        return
+
+    t0 = time.perf_counter()
+    prompt, hits["context"] = build_prompt(query, hits["documents"], hits["ids"], hits["metadatas"])
+    stream = backend.llm.stream(prompt)
+    yield from stream
+    hits["provider"], hits["ttft_s"] = stream.provider, stream.ttft_s
+    if not stream.text:  # every provider failed; never cache an empty answer
+        event("llm_unavailable")
+        hits["answer"] = NO_LLM_RESPONSE
+        yield NO_LLM_RESPONSE
+        return
+    hits["answer"] = stream.text
+    if kb_metrics.METRICS_ENABLED:
+        tokens("completion", kb_context.count_tokens(stream.text), provider=stream.provider)
+    backend.answer_cache.store(query, hits["query_embedding"], hits["ids"], stream.text, time.perf_counter() - t0)
+
+
+def generate_answer(query, hits):
+    """LLM answer for retrieved hits, served from the answer cache when the same chunks were answered before."""
+    for _ in stream_answer(query, hits):
+        pass
+    return hits
+
+
+async def agenerate_answer(query, hits, throttle=None):
+    """
+    generate_answer() for asyncio callers: the LLM call is awaited on the scheduler's loop,
+    so many answers can be in flight at once. throttle() is awaited before a (non-cached) LLM call.
+    """
+    hits["answer"], hits["cache"], hits["provider"], hits["context"] = None, None, None, None
+    if not hits["documents"]:
+        return hits
+
+    answer, level = backend.answer_cache.lookup(query, hits["query_embedding"], hits["ids"])
+    if answer is not None:
+        hits["answer"], hits["cache"] = answer, level
+        event("answer_cache_hit", level=level)
+        return hits
+
+    prompt, hits["context"] = build_prompt(query, hits["documents"], hits["ids"], hits["metadatas"])
+    if throttle is not None:
+        await throttle()
+    t0 = time.perf_counter()
+    result = await backend.llm.acomplete(prompt)
+    hits["provider"], hits["ttft_s"] = result.provider, result.ttft_s
+    if not result.text:
+        event("llm_unavailable")
+        hits["answer"] = NO_LLM_RESPONSE
+        return hits
+    hits["answer"] = result.text
+    if kb_metrics.METRICS_ENABLED:
+        tokens("completion", kb_context.count_tokens(result.text), provider=result.provider)
+    backend.answer_cache.store(query, hits["query_embedding"], hits["ids"], result.text, time.perf_counter() - t0)
+    return hits
+
+
+def answer_query(vectordb, query, n_results=N_RESULTS, category=None):
+    with span("answer_query"):
+        return generate_answer(query, retrieve(vectordb, query, n_results, category))
 
 
 # Interactive Query Loop
@@ -161,26 +455,53 @@ def interactive_query(vectordb):
             print(" Bye!")
             break
 
-        results = vectordb.query(query_texts=[query], n_results=4)
-        docs = results["documents"][0] if results else []
-
-        if not docs:
-            print("No results found.\n")
-            continue
+        with span("query"):
+            hits = retrieve(vectordb, query)
+            docs = hits["documents"]
 
-        print("\n Top Matching Documents:")
-        for i, doc in enumerate(docs, 1):
-            snippet = doc[:200].replace("\n", " ")
-            print(f" {i}. {snippet}...\n")
+            if not docs:
+                print("No results found.\n")
+                continue
 
-        print(" Generating AI response...\n")
-        ai_answer = get_ai_response(query, docs)
-        print(" AI Answer:\n")
-        print(ai_answer)
+            print("\n Top Matching Documents:")
+            for i, doc in enumerate(docs, 1):
+                snippet = doc[:200].replace("\n", " ")
+                print(f" {i}. {snippet}...\n")
+
+            print(" AI Answer:\n")
+            for token in stream_answer(query, hits):
+                print(token, end="", flush=True)
+            print()
+        if hits["cache"]:
+            print(f"\n (cached answer, {hits['cache']} match)")
+        elif hits.get("ttft_s") is not None:
+            print(f"\n ({hits['provider']}, first token after {hits['ttft_s']:.2f}s)")
+        if hits["context"]:
+            c = hits["context"]
+            print(f" (prompt {c['prompt_tokens']} tokens; context {c['context_tokens']}/{c['budget_tokens']} from "
+                  f"{c['parts']} parts of {c['chunks_in']} chunks, {c['duplicates_dropped']} duplicates dropped, "
+                  f"{c['merged']} merged)")
         print("\n" + "-" * 60 + "\n")
 
+    m = backend.answer_cache.metrics()
+    print(f" Answer cache: {m['hits_exact']} exact + {m['hits_semantic']} semantic hits / {m['lookups']} lookups "
+          f"(hit rate {m['hit_rate']:.0%}), {m['latency_saved_s']}s of LLM time saved")
+    for name, t in ttft_summary().items():
+        print(f" {name}: {t['calls']} calls, {t['failures']} failed ({t['timeouts']} timeouts), "
+              f"TTFT p50 {t['ttft_p50_s']}s / p95 {t['ttft_p95_s']}s, circuit {t['breaker']}")
+    print(f" Hedged requests: {backend.llm.stats()['hedges']}")
+    if kb_metrics.METRICS_ENABLED:
+        print(" Stage timings:")
+        print("\n".join(kb_metrics.summary_lines()))
+
 
 # Run App
 if __name__ == "__main__":
-    vectordb = load_vectorstore()
+    if not backend.has_llm():
+        sys.exit(1)
+    try:
+        vectordb = load_vectorstore()
+    except kb_index.IndexUnavailable as e:
+        print(f" {e}")
+        sys.exit(1)
     interactive_query(vectordb)
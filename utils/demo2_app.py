@@ -1,9 +1,17 @@
  # demo2_app.py
 import streamlit as st
+import html
 import os
 from datetime import datetime
-import textwrap
 import pandas as pd
+from kb_metrics import span
+from ticket_store import TicketStore
+from chat_log import CHAT_WINDOW, ChatLog
+from ticket_drafts import DraftStore, DraftWorker, hit_sources
+from feedback_store import USEFULNESS_LEVELS, FeedbackStore, GapClusterer
+import reindex_job
+import upload_indexer
+import kb_index
 
 
 # CSS 
@@ -54,14 +62,8 @@ st.markdown(
 )
 
 def init_state():
-    if "tickets" not in st.session_state:
-        st.session_state.tickets = []
-    if "chat" not in st.session_state:
-        st.session_state.chat = {}  
-    if "rag_chat" not in st.session_state:
-        st.session_state.rag_chat = {}  
-    if "agent_feedback" not in st.session_state:
-        st.session_state.agent_feedback = []
+    if "chat_windows" not in st.session_state:
+        st.session_state.chat_windows = {}  # (ticket, channel) -> before_seq of the older page shown
     if "agent_name" not in st.session_state:
         st.session_state.agent_name = "Agent-1"
     if "selected_ticket" not in st.session_state:
@@ -70,20 +72,188 @@ def init_state():
 init_state()
 
 
-def create_ticket_id():
-    return f"TCK-{len(st.session_state.tickets)+1:03}"
+TICKET_LIST_LIMIT = 50
+QUEUE_PAGE_SIZE = 10
+FEEDBACK_PAGE_SIZE = 10
+TICKET_CATEGORIES = ["Login Issue", "Hardware Issue", "Software Bug", "Warranty", "Other"]
+TICKET_PRIORITIES = ["Low", "Medium", "High"]
 
-def save_uploaded_file(uploaded_file, target_dir="docs/dell-data"):
-    os.makedirs(target_dir, exist_ok=True)
-    save_path = os.path.join(target_dir, uploaded_file.name)
-    with open(save_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    return save_path
+# Tickets live in SQLite (support.db), shared by every session and agent
+@st.cache_resource
+def ticket_store():
+    return TicketStore()
 
-def ticket_df():
-    if not st.session_state.tickets:
-        return pd.DataFrame(columns=["id","email","category","priority","status","agent","created_at"])
-    return pd.DataFrame(st.session_state.tickets)
+@st.cache_resource
+def chat_log():
+    return ChatLog()
+
+def save_uploaded_file(uploaded_file, target_dir=kb_index.DOCS_DIR):
+    return upload_indexer.save_upload(uploaded_file, uploaded_file.name, target_dir)
+
+def rag_reply_html(text):
+    body = html.escape(text).replace("\n", "<br/>")
+    return f"<div style='padding:8px; border-radius:8px; background:#f7fbff; margin-bottom:6px'><strong>RAG:</strong> {body}</div>"
+
+# RAG backend: loaded once per process and shared by every session and rerun
+@st.cache_resource(show_spinner="Loading knowledge base...")
+def rag_backend():
+    """The query module (LLM scheduler + answer cache), with the embedding model warmed up."""
+    import dell_knowledge_query_groq as kb
+    kb.backend.embedding_function
+    kb.backend.llm
+    return kb
+
+@st.cache_resource(show_spinner="Opening vector index...", max_entries=2)
+def open_rag_collection(db_dir, syncs_applied):
+    """Never embeds on a page load: a stale index is served as is, syncing is left to the indexer and rebuild job."""
+    return rag_backend().load_vectorstore(sync_if_stale=False)
+
+def rag_collection():
+    """
+    The active index; a finished background rebuild switches the slot, and an applied upload
+    sync bumps the key, so the next query reopens it while earlier runs keep their object.
+    """
+    return open_rag_collection(rag_backend().backend.index_dir(), index_syncs()["applied"])
+
+@st.cache_resource
+def feedback_store():
+    return FeedbackStore()
+
+@st.cache_resource(show_spinner="Loading embedding model...")
+def gap_clusterer():
+    return GapClusterer(feedback_store(), rag_backend().backend.embedding_function)
+
+def ticket_rag_sources(ticket_id):
+    """Sources the RAG cited on a ticket: its draft and the latest RAG assistant replies."""
+    draft = draft_store().get(ticket_id)
+    sources = [where for where, _ in draft["sources"]] if draft else []
+    for m in chat_log().window(ticket_id, "rag"):
+        sources += [where for where, _ in m["meta"].get("sources", [])]
+    return sources
+
+# Drafts are generated off the request path; the query module loads its model in the worker threads
+@st.cache_resource
+def draft_store():
+    return DraftStore()
+
+@st.cache_resource
+def draft_worker():
+    import dell_knowledge_query_groq as kb
+    return DraftWorker(kb, draft_store())
+
+def render_draft(ticket_id):
+    draft = draft_store().get(ticket_id)
+    if not draft:
+        return
+    if draft["state"] in ("pending", "running"):
+        st.caption("RAG draft reply is being prepared…")
+        return
+    if draft["state"] == "failed":
+        st.caption(f"RAG draft reply unavailable: {draft['error']}")
+        return
+    if not draft["draft"]:
+        st.caption("RAG draft reply: no matching KB articles found.")
+        return
+    st.markdown("<div class='card' style='margin-bottom:10px'><strong>Suggested Reply</strong><div class='muted'>Drafted by RAG when the ticket was created</div></div>", unsafe_allow_html=True)
+    st.markdown(rag_reply_html(draft["draft"]) + (rag_sources_html(draft["sources"]) if draft["sources"] else ""), unsafe_allow_html=True)
+    if st.button("Send draft to user", key=f"send_draft_{ticket_id}"):
+        chat_log().append(ticket_id, "user", st.session_state.agent_name, "agent", draft["draft"])
+        st.experimental_rerun()
+
+# Uploads are indexed into the live collection by one background worker per process
+@st.cache_resource
+def index_syncs():
+    """Upload syncs finished by the indexer thread, and how many script runs have applied."""
+    return {"finished": 0, "applied": 0}
+
+@st.cache_resource(show_spinner="Starting the upload indexer...")
+def indexer():
+    syncs = index_syncs()
+
+    def index_updated(collection):
+        # Runs on the indexer thread, outside any script run: only count the sync here
+        syncs["finished"] += 1
+
+    return upload_indexer.UploadIndexer(rag_backend().backend, on_indexed=index_updated)
+
+def apply_index_syncs():
+    """
+    Reopen the collection after upload syncs so BM25 and routing see the new corpus version.
+    The reopen goes through open_rag_collection, so it never syncs, even while other uploads
+    are still queued and the docs folder is ahead of the manifest.
+    """
+    syncs = index_syncs()
+    finished = syncs["finished"]
+    if syncs["applied"] != finished:
+        draft_worker().forget_collections()
+        syncs["applied"] = finished
+
+def rag_sources_html(sources):
+    rows = [f"<li>{html.escape(where)} <span class='kbd'>{html.escape(chunk_id)}</span></li>" for where, chunk_id in sources]
+    return f"<div class='muted' style='margin:-2px 0 8px 0'>Sources:<ul style='margin:2px 0'>{''.join(rows)}</ul></div>"
+
+# Chat: records live in the chat log; HTML is rendered from them on display
+def chat_bubble(label, text, background):
+    body = html.escape(text).replace("\n", "<br/>")
+    return f"<div style='padding:8px; border-radius:8px; background:{background}; margin-bottom:6px'><strong>{html.escape(label)}:</strong> {body}</div>"
+
+def message_html(m, viewer):
+    if m["channel"] == "rag":
+        if m["role"] == "rag":
+            return rag_reply_html(m["body"]) + (rag_sources_html(m["meta"]["sources"]) if m["meta"].get("sources") else "")
+        return chat_bubble("Agent → RAG", m["body"], "#eef6ff")
+    if m["role"] == "user":
+        return chat_bubble("You" if viewer == "user" else "User", m["body"], "#eef6ff")
+    return chat_bubble(m["sender"], m["body"], "#eef9f5" if viewer == "agent" else "#f7f7fb")
+
+def render_chat(ticket_id, channel, viewer):
+    """
+    Shows one page of at most CHAT_WINDOW messages in one markdown call: the latest by default,
+    older pages on demand through the log's seq cursor, so a rerun never reads more than a page.
+    """
+    key = (ticket_id, channel)
+    before = st.session_state.chat_windows.get(key)
+    messages = chat_log().window(ticket_id, channel, limit=CHAT_WINDOW + 1, before_seq=before)
+    has_older = len(messages) > CHAT_WINDOW
+    if has_older:
+        messages = messages[1:]
+    if has_older or before is not None:
+        c1, c2 = st.columns([1, 1])
+        with c1:
+            if has_older and st.button("Load older messages", key=f"older_{channel}_{ticket_id}"):
+                st.session_state.chat_windows[key] = messages[0]["seq"]
+                st.experimental_rerun()
+        with c2:
+            if before is not None and st.button("Latest messages", key=f"latest_{channel}_{ticket_id}"):
+                st.session_state.chat_windows.pop(key, None)
+                st.experimental_rerun()
+    if before is not None:
+        st.caption("Showing older messages")
+    if messages:
+        st.markdown("".join(message_html(m, viewer) for m in messages), unsafe_allow_html=True)
+
+def stream_rag_answer(query, category=None):
+    """Renders the KB answer token by token as the LLM streams it; returns (final text, hits)."""
+    try:
+        kb = rag_backend()
+        vectordb = rag_collection()
+    except Exception as e:
+        st.error(f"RAG backend unavailable: {e}")
+        return "RAG backend unavailable.", None
+    hits = kb.retrieve(vectordb, query, category=category)
+    if not hits["documents"]:
+        return "No matching KB articles found.", hits
+    placeholder = st.empty()
+    text = ""
+    for token in kb.stream_answer(query, hits):
+        text += token
+        placeholder.markdown(rag_reply_html(text + " ▌"), unsafe_allow_html=True)
+    placeholder.empty()
+    return hits["answer"] or text, hits
+
+def ticket_df(limit=TICKET_LIST_LIMIT):
+    columns = ["id","email","category","priority","status","agent","created_at"]
+    return pd.DataFrame(ticket_store().list(limit=limit, newest_first=True), columns=columns)
 
 
 # SIDEBAR
@@ -111,39 +281,33 @@ def user_page():
         st.markdown("<div class='card'><strong>Raise a Ticket</strong><div class='muted'>Report an issue</div></div>", unsafe_allow_html=True)
         with st.form("raise_ticket_form"):
             email = st.text_input("Your email")
-            category = st.selectbox("Category", ["Login Issue", "Hardware Issue", "Software Bug", "Warranty", "Other"])
-            priority = st.selectbox("Priority", ["Low", "Medium", "High"])
+            category = st.selectbox("Category", TICKET_CATEGORIES)
+            priority = st.selectbox("Priority", TICKET_PRIORITIES)
             message = st.text_area("Describe the issue", height=120)
             submitted = st.form_submit_button("Submit Ticket")
             if submitted:
                 if not email or not message.strip():
                     st.warning("Please provide your email and a short description.")
                 else:
-                    tid = create_ticket_id()
-                    st.session_state.tickets.append({
-                        "id": tid,
-                        "email": email,
-                        "message": message.strip(),
-                        "category": category,
-                        "priority": priority,
-                        "status": "Open",
-                        "agent": "Not Assigned",
-                        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    })
-                    st.success(f"Ticket {tid} created.")
+                    ticket = ticket_store().create(email, message.strip(), category, priority)
+                    draft_worker().submit(ticket)
+                    st.success(f"Ticket {ticket['id']} created.")
 
     with col2:
         st.markdown("<div class='card'><strong>Your Tickets</strong><div class='muted'>Track status & open chat</div></div>", unsafe_allow_html=True)
         user_email = st.text_input("Filter by your email (leave empty to see all)", value="")
-        tickets = st.session_state.tickets
-        filtered = [t for t in tickets if (user_email.strip() == "" or t["email"] == user_email.strip())]
+        store = ticket_store()
+        filtered = store.list(email=user_email.strip() or None, limit=TICKET_LIST_LIMIT, newest_first=True)
         if not filtered:
             st.info("No tickets found.")
         else:
+            total = store.count(email=user_email.strip() or None)
+            if total > len(filtered):
+                st.caption(f"Showing the latest {len(filtered)} of {total} tickets.")
             for t in filtered:
-                st.markdown(f"<div class='ticket-box' style='margin-top:10px'>", unsafe_allow_html=True)
+                st.markdown("<div class='ticket-box' style='margin-top:10px'>", unsafe_allow_html=True)
                 st.markdown(f"**{t['id']}**  ·  {t['category']}  ·  <span class='muted'>Priority: {t['priority']}</span>", unsafe_allow_html=True)
-                st.markdown(f"<div style='margin-top:8px'>{t['message']}</div>", unsafe_allow_html=True)
+                st.markdown(f"<div style='margin-top:8px'>{html.escape(t['message'])}</div>", unsafe_allow_html=True)
                 st.markdown(f"<div style='margin-top:8px' class='muted'>Status: {t['status']}  ·  Agent: {t['agent']}</div>", unsafe_allow_html=True)
                 btn_col1, btn_col2 = st.columns([1,1])
                 with btn_col1:
@@ -159,17 +323,13 @@ def user_page():
         if st.session_state.selected_ticket:
             sel = st.session_state.selected_ticket
             st.markdown(f"<div class='card'><strong>Chat — {sel}</strong><div class='muted'>Two-way messages (demo)</div></div>", unsafe_allow_html=True)
-            if sel not in st.session_state.chat:
-                st.session_state.chat[sel] = []
-            
-            for m in st.session_state.chat[sel]:
-                st.markdown(m, unsafe_allow_html=True)
+            render_chat(sel, "user", viewer="user")
             user_msg = st.text_input("Type a message to the agent", key=f"usermsg_{sel}")
             if st.button("Send", key=f"send_user_{sel}"):
                 if user_msg.strip():
-                    st.session_state.chat[sel].append(f"<div style='padding:8px; border-radius:8px; background:#eef6ff; margin-bottom:6px'><strong>You:</strong> {user_msg}</div>")
+                    chat_log().append(sel, "user", "User", "user", user_msg.strip())
                     # dummy agent reply
-                    st.session_state.chat[sel].append(f"<div style='padding:8px; border-radius:8px; background:#f7f7fb; margin-bottom:6px'><strong>{st.session_state.agent_name}:</strong> Thanks — we'll check and update you shortly.</div>")
+                    chat_log().append(sel, "user", st.session_state.agent_name, "agent", "Thanks — we'll check and update you shortly.")
                     st.experimental_rerun()
                 else:
                     st.warning("Message is empty.")
@@ -182,32 +342,76 @@ def agent_page():
 
     with left_col:
         st.markdown("<div class='card'><strong>New Ticket Queue</strong><div class='muted'>Pick a ticket to handle</div></div>", unsafe_allow_html=True)
-        queue = [t for t in st.session_state.tickets if t["status"] in ("Open", "In Progress")]
+        store = ticket_store()
+        agent = st.session_state.agent_name
+        if st.button("Claim next ticket", key="claim_next"):
+            claimed = store.claim_next(agent)
+            if claimed:
+                st.session_state.selected_ticket = claimed["id"]
+                st.experimental_rerun()
+            else:
+                st.info("No unassigned open tickets.")
+
+        f1, f2, f3 = st.columns([1, 1, 1])
+        with f1:
+            category = st.selectbox("Category", ["All"] + TICKET_CATEGORIES, key="queue_category")
+        with f2:
+            priority = st.selectbox("Priority", ["All"] + TICKET_PRIORITIES, key="queue_priority")
+        with f3:
+            only_mine = st.checkbox("Only mine", key="queue_mine")
+        filters = dict(category=None if category == "All" else category,
+                       priority=None if priority == "All" else priority,
+                       agent=agent if only_mine else None)
+
+        # queue_pages holds the cursor each visited page starts after; it resets when the filters change
+        if st.session_state.get("queue_filters") != filters:
+            st.session_state.queue_filters = filters
+            st.session_state.queue_pages = [None]
+        pages = st.session_state.queue_pages
+        queue, next_page = store.queue_page(pages[-1], QUEUE_PAGE_SIZE, **filters)
+        while not queue and len(pages) > 1:  # the last page emptied (tickets resolved or claimed)
+            pages.pop()
+            queue, next_page = store.queue_page(pages[-1], QUEUE_PAGE_SIZE, **filters)
+        page = len(pages) - 1
+
         if not queue:
             st.info("No tickets in queue.")
         else:
+            st.caption(f"Page {page + 1} · SLA breaches first, then priority and age")
             for t in queue:
-                st.markdown(f"<div class='ticket-box' style='margin-top:10px'>", unsafe_allow_html=True)
-                st.markdown(f"**{t['id']}**  ·  {t['category']}  ·  <span class='muted'>Priority: {t['priority']}</span>", unsafe_allow_html=True)
-                st.markdown(f"<div style='margin-top:8px' class='muted'>From: {t['email']} · Created: {t['created_at']}</div>", unsafe_allow_html=True)
+                st.markdown("<div class='ticket-box' style='margin-top:10px'>", unsafe_allow_html=True)
+                breach = " · <span style='color:#c0262d'>SLA breached</span>" if t["breached"] else ""
+                st.markdown(f"**{t['id']}**  ·  {t['category']}  ·  <span class='muted'>Priority: {t['priority']} · {t['status']}</span>{breach}", unsafe_allow_html=True)
+                st.markdown(f"<div style='margin-top:8px' class='muted'>From: {t['email']} · Created: {t['created_at']} · Agent: {t['agent']}</div>", unsafe_allow_html=True)
                 col_a, col_b, col_c = st.columns([1,1,1])
                 with col_a:
                     if st.button("Assign to me", key=f"assign_{t['id']}"):
-                        t["agent"] = st.session_state.agent_name
-                        t["status"] = "In Progress"
-                        st.success(f"{t['id']} assigned to you")
-                        st.experimental_rerun()
+                        if store.assign(t["id"], agent):
+                            st.success(f"{t['id']} assigned to you")
+                            st.experimental_rerun()
+                        else:
+                            st.warning(f"{t['id']} was already claimed by another agent")
                 with col_b:
                     if st.button("Open", key=f"open_{t['id']}"):
                         st.session_state.selected_ticket = t['id']
                         st.experimental_rerun()
                 with col_c:
                     if st.button("Mark Resolved", key=f"resolve_{t['id']}"):
-                        t["status"] = "Resolved"
+                        store.set_status(t["id"], "Resolved")
                         st.success(f"{t['id']} marked resolved")
                         st.experimental_rerun()
                 st.markdown("</div>", unsafe_allow_html=True)
 
+            p1, p2 = st.columns([1, 1])
+            with p1:
+                if st.button("◀ Previous", key="queue_prev", disabled=page == 0):
+                    pages.pop()
+                    st.experimental_rerun()
+            with p2:
+                if st.button("Next ▶", key="queue_next", disabled=next_page is None):
+                    pages.append(next_page)
+                    st.experimental_rerun()
+
     with right_col:
         st.markdown("<div class='card'><strong>Handle Ticket</strong><div class='muted'>Chat with user, consult RAG, and give feedback</div></div>", unsafe_allow_html=True)
         if not st.session_state.selected_ticket:
@@ -215,26 +419,24 @@ def agent_page():
             return
 
         sel = st.session_state.selected_ticket
-        ticket = next((x for x in st.session_state.tickets if x["id"] == sel), None)
+        ticket = ticket_store().get(sel)
         if not ticket:
             st.warning("Ticket not found.")
             return
 
         st.markdown(f"<div style='margin-bottom:8px'><strong>{ticket['id']}</strong>  ·  {ticket['category']}  ·  <span class='muted'>Priority: {ticket['priority']} · Status: {ticket['status']}</span></div>", unsafe_allow_html=True)
-        st.markdown(f"<div class='card' style='margin-bottom:10px'><strong>User Query</strong><div style='margin-top:8px'>{ticket['message']}</div></div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='card' style='margin-bottom:10px'><strong>User Query</strong><div style='margin-top:8px'>{html.escape(ticket['message'])}</div></div>", unsafe_allow_html=True)
+        render_draft(sel)
 
         # two-column layout for chats
         c1, c2 = st.columns([1.6, 1])
         with c1:
             st.markdown("<div class='card'><strong>Chat with User</strong><div class='muted'>Two-way messages</div></div>", unsafe_allow_html=True)
-            if sel not in st.session_state.chat:
-                st.session_state.chat[sel] = []
-            for m in st.session_state.chat[sel]:
-                st.markdown(m, unsafe_allow_html=True)
+            render_chat(sel, "user", viewer="agent")
             agent_msg = st.text_input("Type message to user", key=f"agent_msg_{sel}")
             if st.button("Send to user", key=f"send_agent_{sel}"):
                 if agent_msg.strip():
-                    st.session_state.chat[sel].append(f"<div style='padding:8px; border-radius:8px; background:#eef9f5; margin-bottom:6px'><strong>{st.session_state.agent_name}:</strong> {agent_msg}</div>")
+                    chat_log().append(sel, "user", st.session_state.agent_name, "agent", agent_msg.strip())
                     st.success("Message sent to user (demo)")
                     st.experimental_rerun()
                 else:
@@ -242,25 +444,15 @@ def agent_page():
 
         with c2:
             st.markdown("<div class='card'><strong>RAG Assistant</strong><div class='muted'>Ask the retrieval assistant for suggestions</div></div>", unsafe_allow_html=True)
-            if sel not in st.session_state.rag_chat:
-                st.session_state.rag_chat[sel] = []
-            for m in st.session_state.rag_chat[sel]:
-                st.markdown(m, unsafe_allow_html=True)
+            render_chat(sel, "rag", viewer="agent")
             rag_q = st.text_input("Ask RAG (e.g., recommended fix?)", key=f"rag_q_{sel}")
             if st.button("Query RAG", key=f"query_rag_{sel}"):
                 if rag_q.strip():
-                    st.session_state.rag_chat[sel].append(f"<div style='padding:8px; border-radius:8px; background:#eef6ff; margin-bottom:6px'><strong>Agent → RAG:</strong> {rag_q}</div>")
-                    reply = textwrap.dedent(f"""
-                    <div style='padding:8px; border-radius:8px; background:#f7fbff; margin-bottom:6px'>
-                    <strong>RAG:</strong> Based on KB matches (demo):
-                    <ul style='margin-top:6px'>
-                      <li>Recommended action: Restart the device & update BIOS</li>
-                      <li>Relevant article: <span class='kbd'>dell-battery-troubleshoot.docx</span></li>
-                      <li>Confidence: Medium</li>
-                    </ul>
-                    </div>
-                    """)
-                    st.session_state.rag_chat[sel].append(reply)
+                    chat_log().append(sel, "rag", st.session_state.agent_name, "agent", rag_q.strip())
+                    st.markdown(chat_bubble("Agent → RAG", rag_q.strip(), "#eef6ff"), unsafe_allow_html=True)
+                    answer, hits = stream_rag_answer(rag_q.strip(), ticket["category"])
+                    sources = hit_sources(hits) if hits and hits["ids"] else []
+                    chat_log().append(sel, "rag", "RAG", "rag", answer, {"sources": sources} if sources else None)
                     st.experimental_rerun()
                 else:
                     st.warning("Empty query!")
@@ -269,26 +461,61 @@ def agent_page():
         st.markdown("<div class='card'><strong>Provide Feedback & Update Ticket</strong><div class='muted'>Help Content Manager improve KB</div></div>", unsafe_allow_html=True)
         colf1, colf2 = st.columns([2,1])
         with colf1:
-            usefulness = st.selectbox("RAG Usefulness", ["Very Useful", "Somewhat Useful", "Not Useful"], key=f"useful_{sel}")
+            usefulness = st.selectbox("RAG Usefulness", USEFULNESS_LEVELS, key=f"useful_{sel}")
             missing_suggest = st.text_area("Suggest missing KB article (optional)", key=f"missing_{sel}", height=80)
         with colf2:
             new_status = st.selectbox("Update Ticket Status", ["In Progress", "Waiting for User", "Resolved"], index=0, key=f"status_{sel}")
             if st.button("Submit Feedback & Update", key=f"submit_feedback_{sel}"):
-                ticket["status"] = new_status
-                st.session_state.agent_feedback.append({
-                    "ticket_id": sel,
-                    "agent": st.session_state.agent_name,
-                    "usefulness": usefulness,
-                    "missing_kb": missing_suggest,
-                    "status": new_status,
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
+                ticket_store().set_status(sel, new_status)
+                feedback_store().add(sel, st.session_state.agent_name, usefulness, missing_suggest, new_status,
+                                     ticket["category"], ticket_rag_sources(sel))
                 st.success("Feedback submitted & ticket updated.")
                 st.experimental_rerun()
 
 
 # CONTENT MANAGER PAGE
 
+def file_index_status(fn, indexed):
+    """Upload queue state if the file is being (re)indexed in this process, else what the index manifest says."""
+    job = indexer().status(fn)
+    if job and job["state"] in ("queued", "indexing"):
+        return f"Index status: {job['state']}…"
+    if job and job["state"] == "failed":
+        return f"Index status: failed ({job.get('error')})"
+    entry = indexed.get(fn)
+    if not entry:
+        return "Index status: not indexed"
+    when = datetime.fromtimestamp(entry["indexed_at"]).strftime("%Y-%m-%d %H:%M:%S") if entry["indexed_at"] else "—"
+    took = f" in {job['seconds']}s" if job and job.get("seconds") is not None else ""
+    return f"Index status: indexed{took} · {entry['chunks']} chunks · {when}"
+
+def render_rebuild_status():
+    status = reindex_job.read_status()
+    state = status["state"]
+    if state == "idle":
+        return
+    done, total = status.get("files_done", 0), status.get("files_total", 0)
+    detail = (f"{done}/{total} files · {status.get('chunks', 0)} chunks · {status.get('embedded', 0)} embedded "
+              f"· {status.get('embeddings_per_s', 0)} embeddings/s · {status.get('elapsed_s', 0)}s")
+    if state == "running":
+        st.progress(done / total if total else 0.0, text=f"Rebuilding into slot {status['slot']}: {detail}")
+        if st.button("Refresh status"):
+            st.experimental_rerun()
+    elif state == "done":
+        st.info(f"Last rebuild finished: slot {status['slot']} is live with {status.get('chunks_total', 0)} chunks ({detail}).")
+    else:
+        st.error(f"Last rebuild failed, the current index is unchanged: {status.get('error')}")
+
+def render_index_staleness():
+    try:
+        reason = kb_index.stale_reason(rag_collection(), db_dir=rag_backend().backend.index_dir())
+    except kb_index.IndexUnavailable as e:
+        st.warning(f"No usable index: {e}. Use Rebuild Embeddings to build one.")
+        return
+    if reason:
+        st.info(f"Answers use the last indexed KB: {reason}. Queued uploads are still indexing; "
+                "Rebuild Embeddings re-syncs every document.")
+
 def content_manager_page():
     st.markdown("<div class='card'><strong>Content Manager Dashboard</strong><div class='muted'>Review feedback and manage KB</div></div>", unsafe_allow_html=True)
     tabs = st.tabs(["Feedback Overview", "Upload Documents", "Knowledge Base"])
@@ -296,26 +523,59 @@ def content_manager_page():
     # Feedback 
     with tabs[0]:
         st.subheader("Agent Feedback")
-        feedback = st.session_state.agent_feedback
-        if not feedback:
+        store = feedback_store()
+        totals = store.totals()
+        total = sum(totals.values())
+        if not total:
             st.info("No feedback submitted yet.")
         else:
-            df = pd.DataFrame(feedback)
-            total = len(df)
-            helpful = df[df["usefulness"] == "Very Useful"].shape[0] if "usefulness" in df else 0
-            col1, col2 = st.columns(2)
+            col1, col2, col3 = st.columns(3)
             col1.metric("Total Feedbacks", total)
-            col2.metric("Very Useful", helpful)
+            col2.metric("Very Useful", totals.get("Very Useful", 0))
+            col3.metric("Not Useful", totals.get("Not Useful", 0))
 
             st.markdown("---")
-            if not df.empty and "usefulness" in df:
-                benefit = df["usefulness"].value_counts()
-                st.bar_chart(benefit)
+            st.bar_chart(pd.Series({level: totals.get(level, 0) for level in USEFULNESS_LEVELS}))
+
+            # running aggregates, read as they are stored
+            by_source, by_category, by_day = st.tabs(["By source document", "By category", "By day"])
+            for tab, dimension in ((by_source, "source"), (by_category, "category"), (by_day, "day")):
+                with tab:
+                    stats = pd.DataFrame.from_dict(store.stats(dimension), orient="index")
+                    if stats.empty:
+                        st.caption("No feedback yet.")
+                        continue
+                    stats = stats.reindex(columns=list(USEFULNESS_LEVELS), fill_value=0).fillna(0).astype(int)
+                    if dimension == "day":
+                        st.bar_chart(stats.sort_index())
+                    else:
+                        st.dataframe(stats.sort_values("Not Useful", ascending=False), use_container_width=True)
 
             st.markdown("---")
-            # detailed list
-            for _, row in df.sort_values(by="timestamp", ascending=False).iterrows():
-                st.markdown(f"<div class='card' style='margin-bottom:10px'><strong>Ticket {row['ticket_id']}</strong><div class='muted'>By {row['agent']} · {row['timestamp']}</div><div style='margin-top:8px'><b>Usefulness:</b> {row['usefulness']}<br/><b>Missing KB:</b> {row['missing_kb'] if row['missing_kb'] else '—'}<br/><b>Status:</b> {row['status']}</div></div>", unsafe_allow_html=True)
+            st.markdown("**KB gaps** <span class='muted'>(missing-KB suggestions grouped by similarity)</span>", unsafe_allow_html=True)
+            gaps = gap_clusterer().gaps() if store.count_suggestions() else []  # no model load until there are some
+            if not gaps:
+                st.caption("No missing-KB suggestions yet.")
+            for g in gaps:
+                more = "".join(f"<div class='muted'>· {html.escape(e)}</div>" for e in g["examples"])
+                st.markdown(f"<div class='card' style='margin-bottom:8px'><strong>{html.escape(g['label'])}</strong><div class='muted'>{g['suggestions']} suggestions · tickets {html.escape(', '.join(g['tickets']))}</div>{more}</div>", unsafe_allow_html=True)
+
+            st.markdown("---")
+            # detailed list, one page at a time
+            pages = max(1, -(-total // FEEDBACK_PAGE_SIZE))
+            page = min(st.session_state.get("feedback_page", 0), pages - 1)
+            rows = store.page(page, FEEDBACK_PAGE_SIZE)
+            st.caption(f"Page {page + 1} of {pages}")
+            st.markdown("".join(f"<div class='card' style='margin-bottom:10px'><strong>Ticket {html.escape(row['ticket_id'])}</strong><div class='muted'>By {html.escape(row['agent'])} · {row['timestamp']}</div><div style='margin-top:8px'><b>Usefulness:</b> {row['usefulness']}<br/><b>Missing KB:</b> {html.escape(row['missing_kb']) if row['missing_kb'] else '—'}<br/><b>Status:</b> {row['status']}</div></div>" for row in rows), unsafe_allow_html=True)
+            p1, p2 = st.columns([1, 1])
+            with p1:
+                if st.button("◀ Newer", key="feedback_prev", disabled=page == 0):
+                    st.session_state.feedback_page = page - 1
+                    st.experimental_rerun()
+            with p2:
+                if st.button("Older ▶", key="feedback_next", disabled=page + 1 >= pages):
+                    st.session_state.feedback_page = page + 1
+                    st.experimental_rerun()
 
     # Upload docs
     with tabs[1]:
@@ -323,37 +583,53 @@ def content_manager_page():
         st.markdown("<div class='muted'>Upload .docx files to improve the knowledge base (UI-only upload saved to docs/dell-data)</div>", unsafe_allow_html=True)
         upload = st.file_uploader("Upload .docx (multiple allowed)", type=["docx"], accept_multiple_files=True)
         if upload:
+            handled = st.session_state.setdefault("uploads_handled", set())
             for f in upload:
+                key = (f.name, f.size, getattr(f, "file_id", None))
+                if key in handled:  # the uploader keeps its files across reruns
+                    continue
                 save_path = save_uploaded_file(f)
-                st.success(f"Saved: {os.path.basename(save_path)}")
+                indexer().submit(os.path.basename(save_path))
+                handled.add(key)
+                st.success(f"Saved: {os.path.basename(save_path)}, queued for indexing")
         st.markdown("")
-        if st.button("Rebuild Embeddings (UI-only)"):
-            st.success("Embeddings rebuild started (demo - UI only)")
+        if st.button("Rebuild Embeddings"):
+            if reindex_job.start_rebuild():
+                st.success("Rebuild started in the background; answers keep using the current index until it finishes.")
+            else:
+                st.warning("A rebuild is already running.")
+        render_rebuild_status()
+        render_index_staleness()
 
     # KB viewer
     with tabs[2]:
         st.subheader("Knowledge Base Snapshot")
-        kb_dir = "docs/dell-data"
+        kb_dir = kb_index.DOCS_DIR
         if not os.path.exists(kb_dir):
             st.info("No KB documents uploaded yet.")
         else:
-            files = sorted(os.listdir(kb_dir))
+            files = kb_index.list_docx_files(kb_dir)
             if not files:
                 st.info("No KB documents uploaded yet.")
             else:
+                indexed = upload_indexer.indexed_files()
+                if st.button("Refresh index status"):
+                    st.experimental_rerun()
                 for fn in files:
-                    st.markdown(f"<div class='card' style='margin-bottom:8px'><strong>{fn}</strong><div class='muted'>Stored in {kb_dir}</div></div>", unsafe_allow_html=True)
+                    st.markdown(f"<div class='card' style='margin-bottom:8px'><strong>{html.escape(fn)}</strong><div class='muted'>{html.escape(file_index_status(fn, indexed))}</div></div>", unsafe_allow_html=True)
 
 
 # ROUTER
 
-if role == "User":
-    user_page()
-elif role == "Support Agent":
-    agent_page()
-elif role == "Content Manager":
-    content_manager_page()
-else:
-    st.info("Choose a role from the sidebar.")
+apply_index_syncs()
+with span("streamlit_rerun", role=role):
+    if role == "User":
+        user_page()
+    elif role == "Support Agent":
+        agent_page()
+    elif role == "Content Manager":
+        content_manager_page()
+    else:
+        st.info("Choose a role from the sidebar.")
 
 
@@ -0,0 +1,206 @@
+import json
+import os
+import re
+
+import numpy as np
+
+import kb_index
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer use only
+    fcntl = None
+
+
+# Configuration
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(kb_index.CHROMA_DB_DIR, "embed_cache"))
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "512"))
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE", "1") != "0"
+INITIAL_CAPACITY = 1024
+
+
+def model_slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+
+
+# Cache
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache for one model.
+
+    Vectors live in a memory-mapped float32 file (vectors.f32, one row per slot) and an
+    index.json maps normalized text hash -> [slot, last_used]. When the cache reaches
+    max_bytes the least recently used entries are evicted and their slots reused.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = EMBED_CACHE_DIR, max_mb: int = EMBED_CACHE_MAX_MB):
+        self.model_name = model_name
+        self.dir = os.path.join(cache_dir, model_slug(model_name))
+        self.index_path = os.path.join(self.dir, "index.json")
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.lock_path = os.path.join(self.dir, ".lock")
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.vectors = None
+        self.index_mtime = None
+        self.dirty = False
+        os.makedirs(self.dir, exist_ok=True)
+        self.load()
+
+    # Persistence
+    def load(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+            self.index_mtime = os.stat(self.index_path).st_mtime_ns
+        else:
+            self.index = {"model": self.model_name, "dim": None, "capacity": 0, "tick": 0, "entries": {}, "free": []}
+        self.vectors = None
+        if self.index["dim"] and self.index["capacity"] and os.path.exists(self.vectors_path):
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+",
+                                     shape=(self.index["capacity"], self.index["dim"]))
+
+    def changed_on_disk(self) -> bool:
+        mtime = os.stat(self.index_path).st_mtime_ns if os.path.exists(self.index_path) else None
+        return mtime != self.index_mtime
+
+    def reload_if_changed(self):
+        if self.changed_on_disk():
+            self.load()
+
+    def save(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+        self.index_mtime = os.stat(self.index_path).st_mtime_ns
+        self.dirty = False
+
+    def locked(self):
+        return _FileLock(self.lock_path)
+
+    # Slots
+    def max_entries(self, dim: int) -> int:
+        return max(1, self.max_bytes // (dim * 4))
+
+    def grow(self, dim: int, needed: int):
+        idx = self.index
+        capacity = idx["capacity"]
+        if capacity >= needed:
+            return
+        new_capacity = max(needed, INITIAL_CAPACITY, capacity * 2)
+        new_capacity = min(new_capacity, self.max_entries(dim))
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(new_capacity * dim * 4)
+        idx["free"].extend(range(capacity, new_capacity))
+        idx["capacity"], idx["dim"] = new_capacity, dim
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(new_capacity, dim))
+
+    def evict(self, count: int):
+        entries = self.index["entries"]
+        oldest = sorted(entries.items(), key=lambda kv: kv[1][1])[:count]
+        for key, (slot, _) in oldest:
+            del entries[key]
+            self.index["free"].append(slot)
+
+    def allocate(self, dim: int, count: int):
+        idx = self.index
+        if idx["dim"] not in (None, dim):
+            raise ValueError(f"embedding cache for {self.model_name} holds dim {idx['dim']}, got {dim}")
+        limit = self.max_entries(dim)
+        count = min(count, limit)
+        self.grow(dim, min(len(idx["entries"]) + count, limit))
+        if len(idx["free"]) < count:
+            # Evict a little extra so the next batch does not evict again
+            self.evict(count - len(idx["free"]) + limit // 10)
+        return [idx["free"].pop() for _ in range(count)]
+
+    # Lookup
+    def get_many(self, keys):
+        """Returns {key: vector} for cached keys and marks them recently used."""
+        found = {}
+        entries = self.index["entries"]
+        for key in keys:
+            entry = entries.get(key)
+            if entry is not None and self.vectors is not None:
+                self.index["tick"] += 1
+                entry[1] = self.index["tick"]
+                found[key] = np.array(self.vectors[entry[0]])
+                self.dirty = True
+        return found
+
+    def put_many(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        todo = [(k, v) for k, v in zip(keys, vectors) if k not in self.index["entries"]]
+        if not todo:
+            return
+        slots = self.allocate(vectors.shape[1], len(todo))
+        for (key, vec), slot in zip(todo, slots):
+            self.vectors[slot] = vec
+            self.index["tick"] += 1
+            self.index["entries"][key] = [slot, self.index["tick"]]
+        self.dirty = True
+
+    def embed(self, texts, embed_fn):
+        """Embeds texts, computing only cache misses (each distinct text once) with embed_fn."""
+        keys = [kb_index.chunk_hash(t) for t in texts]
+        with self.locked():
+            self.reload_if_changed()
+            found = self.get_many(set(keys))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            computed = np.asarray(embed_fn(list(missing.values())), dtype=np.float32)
+            found.update(zip(missing.keys(), computed))
+            with self.locked():
+                self.reload_if_changed()
+                self.put_many(list(missing.keys()), computed)
+                self.save()
+        return [found[k].tolist() for k in keys]
+
+    def wrap(self, embed_fn):
+        """Returns an embed_documents-style callable backed by this cache."""
+        return lambda texts: self.embed(texts, embed_fn)
+
+    def close(self):
+        """Persists recency updates, unless another process has rewritten the index meanwhile."""
+        if self.dirty:
+            with self.locked():
+                if not self.changed_on_disk():
+                    self.save()
+
+    def stats(self) -> dict:
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_entries": len(self.index["entries"]),
+        }
+
+
+class _FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, "a")
+        if fcntl:
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from ticket_store import SUPPORT_DB, get_database
+
+
+# Configuration
+USEFULNESS_LEVELS = ("Very Useful", "Somewhat Useful", "Not Useful")
+STAT_DIMENSIONS = ("total", "source", "category", "day")
+MISSING_KB_THRESHOLD = float(os.getenv("MISSING_KB_THRESHOLD", "0.75"))  # cosine for two suggestions to be one gap
+
+
+def source_document(where: str) -> str:
+    """"file.docx › Section > Sub" (as in RAG sources) -> "file.docx"; "a.docx|b.docx" -> "a.docx"."""
+    return where.split(" › ")[0].split("|")[0]
+
+
+# Feedback Store
+FEEDBACK_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS feedback (seq INTEGER PRIMARY KEY AUTOINCREMENT, ticket_id TEXT NOT NULL, "
+    "agent TEXT NOT NULL, usefulness TEXT NOT NULL, missing_kb TEXT, status TEXT, category TEXT, sources TEXT, "
+    "ts REAL NOT NULL)",
+    # running counts per (dimension, key, usefulness), kept in step with every insert
+    "CREATE TABLE IF NOT EXISTS feedback_stats (dimension TEXT NOT NULL, key TEXT NOT NULL, usefulness TEXT NOT NULL, "
+    "count INTEGER NOT NULL, PRIMARY KEY (dimension, key, usefulness))",
+    "CREATE INDEX IF NOT EXISTS feedback_missing ON feedback (seq) WHERE missing_kb IS NOT NULL",
+)
+
+
+class FeedbackStore:
+    """
+    Agent feedback on RAG answers, next to the tickets.
+
+    Records are {seq, ticket_id, agent, usefulness, missing_kb, status, category, sources, ts,
+    timestamp}; sources are the KB documents the RAG cited on the ticket. Usefulness counts
+    overall and per source document, category and day live in feedback_stats and are
+    incremented in the same transaction as the insert, so the dashboard reads totals
+    without scanning the feedback.
+    """
+
+    def __init__(self, db_path: str = SUPPORT_DB):
+        self.db = get_database(db_path)
+        self.db.ensure_schema("feedback", FEEDBACK_SCHEMA)
+
+    @staticmethod
+    def to_dict(row) -> dict:
+        record = dict(row)
+        record["sources"] = json.loads(record["sources"]) if record["sources"] else []
+        record["timestamp"] = datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+        return record
+
+    # Writes
+    def add(self, ticket_id: str, agent: str, usefulness: str, missing_kb: str = None, status: str = None,
+            category: str = None, sources=()) -> dict:
+        ts = time.time()
+        missing_kb = (missing_kb or "").strip() or None
+        sources = sorted({source_document(s) for s in sources})
+        keys = [("total", "all"), ("day", datetime.fromtimestamp(ts).strftime("%Y-%m-%d"))]
+        keys += [("category", category)] if category else []
+        keys += [("source", s) for s in sources]
+        conn = self.db.connect()
+        with self.db.transaction(conn):
+            cur = conn.execute(
+                "INSERT INTO feedback (ticket_id, agent, usefulness, missing_kb, status, category, sources, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (ticket_id, agent, usefulness, missing_kb, status, category, json.dumps(sources) if sources else None, ts),
+            )
+            conn.executemany(
+                "INSERT INTO feedback_stats (dimension, key, usefulness, count) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT (dimension, key, usefulness) DO UPDATE SET count = count + 1",
+                [(dimension, key, usefulness) for dimension, key in keys],
+            )
+        row = conn.execute("SELECT * FROM feedback WHERE seq = ?", (cur.lastrowid,)).fetchone()
+        return self.to_dict(row)
+
+    # Reads
+    def stats(self, dimension: str) -> dict:
+        """{key: {usefulness: count}} for one of STAT_DIMENSIONS."""
+        out = {}
+        for row in self.db.connect().execute(
+                "SELECT key, usefulness, count FROM feedback_stats WHERE dimension = ?", (dimension,)):
+            out.setdefault(row["key"], {})[row["usefulness"]] = row["count"]
+        return out
+
+    def totals(self) -> dict:
+        """{usefulness: count} over all feedback."""
+        return self.stats("total").get("all", {})
+
+    def page(self, page: int = 0, page_size: int = 10):
+        """One page of feedback, newest first."""
+        rows = self.db.connect().execute(
+            "SELECT * FROM feedback ORDER BY seq DESC LIMIT ? OFFSET ?", (page_size, page * page_size)
+        ).fetchall()
+        return [self.to_dict(row) for row in rows]
+
+    def count(self) -> int:
+        return sum(self.totals().values())
+
+    def count_suggestions(self) -> int:
+        return self.db.connect().execute("SELECT COUNT(*) FROM feedback WHERE missing_kb IS NOT NULL").fetchone()[0]
+
+    def suggestions(self, after_seq: int = 0):
+        """[(seq, ticket_id, missing_kb)] of feedback with a missing-KB suggestion, oldest first."""
+        rows = self.db.connect().execute(
+            "SELECT seq, ticket_id, missing_kb FROM feedback WHERE missing_kb IS NOT NULL AND seq > ? ORDER BY seq",
+            (after_seq,),
+        ).fetchall()
+        return [(row["seq"], row["ticket_id"], row["missing_kb"]) for row in rows]
+
+
+# Missing-KB Gaps
+class GapClusterer:
+    """
+    Groups missing-KB suggestions into KB gaps by embedding similarity, incrementally.
+
+    Each refresh embeds only the suggestions added since the last one, in one batched call,
+    and assigns each to the gap whose centroid is closest if that is within the threshold,
+    otherwise it starts a new gap. Gap state (member rows, tickets, running vector sums) is
+    kept per process next to the vectors, so gaps() only sorts the cached gaps. Gaps are
+    ranked by the number of suggestions (and tickets) behind them; the label is the member
+    closest to the centroid.
+    """
+
+    def __init__(self, store: FeedbackStore, embed, threshold: float = MISSING_KB_THRESHOLD):
+        self.store = store
+        self.embed = embed  # texts -> vectors, e.g. the query path's embedding function
+        self.threshold = threshold
+        self.items = []  # (seq, ticket_id, text)
+        self.vectors = None
+        self.members = []  # per gap: rows of self.items
+        self.tickets = []  # per gap: set of ticket ids
+        self.sums = None  # per gap: sum of member vectors (rows beyond len(self.members) are spare capacity)
+        self.centroids = None  # per gap: unit-length mean of member vectors (same capacity)
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        new = self.store.suggestions(self.items[-1][0] if self.items else 0)
+        if not new:
+            return
+        vectors = np.asarray(self.embed([text for _, _, text in new]), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        first = len(self.items)
+        self.items.extend(new)
+        self.vectors = vectors if self.vectors is None else np.vstack([self.vectors, vectors])
+        for row, (vector, (_, ticket_id, _)) in enumerate(zip(vectors, new), first):
+            self.assign(row, vector, ticket_id)
+
+    def assign(self, row: int, vector, ticket_id: str):
+        """Adds one suggestion to its nearest gap within the threshold, or to a new gap."""
+        count = len(self.members)
+        if count:
+            similarity = self.centroids[:count] @ vector
+            gap = int(np.argmax(similarity))
+            if similarity[gap] >= self.threshold:
+                self.members[gap].append(row)
+                self.tickets[gap].add(ticket_id)
+                self.sums[gap] += vector
+                self.centroids[gap] = self.sums[gap] / max(np.linalg.norm(self.sums[gap]), 1e-12)
+                return
+        if self.sums is None or count == len(self.sums):  # grow by doubling, not one row at a time
+            capacity = max(64, 2 * count)
+            sums, centroids = np.zeros((capacity, len(vector)), np.float32), np.zeros((capacity, len(vector)), np.float32)
+            if count:
+                sums[:count], centroids[:count] = self.sums, self.centroids
+            self.sums, self.centroids = sums, centroids
+        self.members.append([row])
+        self.tickets.append({ticket_id})
+        self.sums[count] = vector
+        self.centroids[count] = vector
+
+    def gaps(self, limit: int = 10):
+        """[{label, suggestions, tickets, examples}] best first; label is the most central suggestion."""
+        with self.lock:
+            self.refresh()
+            ranked = sorted(range(len(self.members)), key=lambda g: (len(self.members[g]), len(self.tickets[g])),
+                            reverse=True)[:limit]
+            gaps = []
+            for g in ranked:
+                members = self.members[g]
+                leader = members[int(np.argmax(self.vectors[members] @ self.centroids[g]))]
+                label = self.items[leader][2]
+                texts = [self.items[m][2] for m in members]
+                gaps.append({
+                    "label": label,
+                    "suggestions": len(members),
+                    "tickets": sorted(self.tickets[g]),
+                    "examples": [t for t in dict.fromkeys(texts) if t != label][:3],
+                })
+        return gaps
@@ -0,0 +1,526 @@
+import functools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import embed_cache
+import kb_index
+import kb_lexical
+import kb_routing
+import kb_metrics
+from kb_metrics import span
+
+
+# Configuration
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or (os.cpu_count() or 1)
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.97"))  # cosine; >= 1 disables
+MANIFEST_SAVE_INTERVAL = float(os.getenv("MANIFEST_SAVE_INTERVAL", "2"))  # seconds between manifest checkpoints
+SYNC_LOCK = threading.RLock()  # syncs in one process share the manifest and BM25 files
+
+
+# Throughput Stats
+class IngestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.docs = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.embed_seconds = 0.0
+        self.extra = {}
+
+    def as_dict(self) -> dict:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "docs_per_s": round(self.docs / elapsed, 2),
+            "chunks_per_s": round(self.chunks / elapsed, 2),
+            "embeddings_per_s": round(self.embedded / self.embed_seconds, 2) if self.embed_seconds else 0.0,
+            **self.extra,
+        }
+
+
+# Parsing Stage (process pool)
+def _parse_job(chunk_file, filepath):
+    """Returns (chunks, error, seconds); timed here because spans in pool workers stay in the worker."""
+    t0 = time.perf_counter()
+    try:
+        return chunk_file(filepath), None, time.perf_counter() - t0
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", time.perf_counter() - t0
+
+
+def _parsed(file, chunks, error, seconds):
+    kb_metrics.observe("kb_stage_seconds", seconds, stage="parse_file", outcome="error" if error else "ok")
+    return file, chunks, error
+
+
+def parse_stream(chunk_file, docs_folder: str, files, workers: int = None):
+    """
+    Yields (file, chunks, error) as files finish parsing.
+
+    At most 2 * workers files are in flight, and new files are only submitted when the
+    consumer asks for the next result, so a slow consumer throttles parsing.
+    """
+    workers = min(workers or INGEST_WORKERS, len(files))
+    if workers <= 1:
+        for file in files:
+            yield _parsed(file, *_parse_job(chunk_file, os.path.join(docs_folder, file)))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(files)
+        inflight = {}
+
+        def submit_next():
+            file = next(remaining, None)
+            if file is not None:
+                inflight[pool.submit(_parse_job, chunk_file, os.path.join(docs_folder, file))] = file
+
+        for _ in range(2 * workers):
+            submit_next()
+        while inflight:
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                file = inflight.pop(fut)
+                yield _parsed(file, *fut.result())
+                submit_next()
+
+
+# Embedding + Write Stage (single writer thread)
+class IndexWriter(threading.Thread):
+    """
+    Consumes index operations from a bounded queue, embeds new chunks in fixed-size batches
+    and writes each batch to the collection as soon as it is full.
+
+    Every distinct chunk text is stored once. A Chroma record keeps refs to every
+    (file, chunk id) that uses it, and its "sources" metadata lists those files; the record
+    is deleted when its last ref goes. Chunks whose embedding is within NEAR_DUP_THRESHOLD
+    cosine of an existing record become aliases of that record instead of new vectors.
+
+    Ops: ("ref", file, chunk id, position, text, meta), ("unref", file, chunk ids),
+    ("move", file, {chunk id: position}), ("commit", file, entry), ("forget", file).
+    If a BM25 `lexical` index is given, it receives the same record adds and deletes.
+
+    If `checkpoint` is given, it is called (to save the manifest) at most every
+    MANIFEST_SAVE_INTERVAL seconds, right after a file is committed or forgotten and its
+    chunks are flushed, so the saved manifest never describes half a file.
+    """
+
+    def __init__(self, collection, manifest: dict, embed_documents, batch_size: int, stats, report: dict,
+                 near_dup_threshold: float = NEAR_DUP_THRESHOLD, lexical=None, checkpoint=None):
+        super().__init__(name="index-writer", daemon=True)
+        self.collection = collection
+        self.manifest = manifest
+        self.records = manifest["records"]
+        self.aliases = manifest["aliases"]
+        self.embed_documents = embed_documents
+        self.batch_size = batch_size
+        self.stats = stats
+        self.report = report
+        self.near_dup_threshold = near_dup_threshold
+        self.lexical = lexical
+        self.checkpoint = checkpoint
+        self.checkpointed_at = time.monotonic()
+        self.ops = queue.Queue(maxsize=4 * batch_size)
+        self.buffer = {}  # chunk id -> {"text", "meta", "refs": {file: {chunk id: position}}}
+        self.dirty = set()
+        self.error = None
+
+    def put(self, op):
+        while True:
+            if self.error is not None:
+                raise RuntimeError(f"index writer failed: {self.error}") from self.error
+            try:
+                self.ops.put(op, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        """Flushes everything still queued; re-raises writer errors."""
+        if self.error is None:
+            self.put(None)
+        self.join()
+        if self.error is not None:
+            raise RuntimeError(f"index writer failed: {self.error}") from self.error
+
+    def run(self):
+        try:
+            while True:
+                op = self.ops.get()
+                if op is None:
+                    break
+                getattr(self, "op_" + op[0])(*op[1:])
+            self.flush()
+        except BaseException as e:
+            self.error = e
+
+    # Ops
+    def op_ref(self, file, chunk_id, position, text, meta):
+        rid = self.aliases.get(chunk_id, chunk_id)
+        if rid in self.records:
+            self.add_ref(rid, file, chunk_id, position)
+            self.report["duplicates_exact"] += 1
+            return
+        pending = self.buffer.get(chunk_id)
+        if pending is not None:
+            pending["refs"].setdefault(file, {})[chunk_id] = position
+            self.report["duplicates_exact"] += 1
+            return
+        self.buffer[chunk_id] = {"text": text, "meta": meta, "refs": {file: {chunk_id: position}}}
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def op_unref(self, file, chunk_ids):
+        if any(c in self.buffer for c in chunk_ids):
+            self.flush()
+        stale = []
+        for chunk_id in chunk_ids:
+            rid = self.aliases.get(chunk_id, chunk_id)
+            record = self.records.get(rid)
+            if record is None:
+                continue
+            file_refs = record["refs"].get(file, {})
+            file_refs.pop(chunk_id, None)
+            if not file_refs:
+                record["refs"].pop(file, None)
+            if record["refs"]:
+                self.dirty.add(rid)
+            else:
+                del self.records[rid]
+                self.dirty.discard(rid)
+                stale.append(rid)
+        if stale:
+            gone = set(stale)
+            for alias in [a for a, target in self.aliases.items() if target in gone]:
+                del self.aliases[alias]
+            kb_index.delete_in_batches(self.collection, stale, self.batch_size)
+            if self.lexical is not None:
+                self.lexical.remove(stale)
+
+    def op_move(self, file, positions):
+        for chunk_id, position in positions.items():
+            rid = self.aliases.get(chunk_id, chunk_id)
+            record = self.records.get(rid)
+            if record is not None and file in record["refs"]:
+                record["refs"][file][chunk_id] = position
+                self.dirty.add(rid)
+
+    def op_commit(self, file, entry):
+        self.manifest["files"][file] = entry
+        self.maybe_checkpoint()
+
+    def op_forget(self, file):
+        self.manifest["files"].pop(file, None)
+        self.maybe_checkpoint()
+
+    def maybe_checkpoint(self):
+        if self.checkpoint is None or time.monotonic() - self.checkpointed_at < MANIFEST_SAVE_INTERVAL:
+            return
+        self.flush()
+        self.checkpoint()
+        self.checkpointed_at = time.monotonic()
+
+    # Records
+    def add_ref(self, rid, file, chunk_id, position):
+        self.records[rid]["refs"].setdefault(file, {})[chunk_id] = position
+        self.dirty.add(rid)
+
+    def record_metadata(self, rid):
+        record = self.records[rid]
+        refs = record["refs"]
+        if record["source"] not in refs:
+            record["source"] = min(refs)
+        source = record["source"]
+        record["chunk"] = min(refs[source].values())
+        return {
+            **record.get("meta", {}),
+            "source": source,
+            "sources": "|".join(sorted(refs)),
+            "chunk": record["chunk"],
+            "chunk_hash": record["chunk_hash"],
+        }
+
+    def nearest_records(self, vectors):
+        """For each vector, the id of an existing record within the near-duplicate threshold, or None."""
+        matches = [None] * len(vectors)
+        if self.near_dup_threshold >= 1 or not self.records:
+            return matches
+        res = self.collection.query(query_embeddings=vectors, n_results=1, include=["embeddings"])
+        for i, (ids, embs) in enumerate(zip(res["ids"], res["embeddings"])):
+            if ids and ids[0] in self.records and cosine(vectors[i], embs[0]) >= self.near_dup_threshold:
+                matches[i] = ids[0]
+        return matches
+
+    def flush(self):
+        if self.buffer:
+            chunk_ids = list(self.buffer)
+            texts = [self.buffer[c]["text"] for c in chunk_ids]
+            t0 = time.perf_counter()
+            with span("embed_batch", size=len(texts)):
+                vectors = np.asarray(self.embed_documents(texts), dtype=np.float32)
+            self.stats.embed_seconds += time.perf_counter() - t0
+            kb_metrics.observe("kb_batch_size", len(texts), kb_metrics.COUNT_BUCKETS, stage="embed_batch")
+            self.stats.embedded += len(texts)
+
+            # Near duplicates: against the existing collection first, then within this batch
+            matches = self.nearest_records(vectors)
+            unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            new = []
+            for i, chunk_id in enumerate(chunk_ids):
+                if matches[i] is None and new and self.near_dup_threshold < 1:
+                    sims = unit[new] @ unit[i]
+                    j = int(np.argmax(sims))
+                    if sims[j] >= self.near_dup_threshold:
+                        matches[i] = chunk_ids[new[j]]
+                if matches[i] is None:
+                    new.append(i)
+                    refs = self.buffer[chunk_id]["refs"]
+                    source = min(refs)
+                    self.records[chunk_id] = {
+                        "refs": refs, "source": source, "chunk": min(refs[source].values()),
+                        "chunk_hash": kb_index.chunk_hash(texts[i]), "meta": self.buffer[chunk_id]["meta"],
+                    }
+                else:
+                    self.aliases[chunk_id] = matches[i]
+                    for file, positions in self.buffer[chunk_id]["refs"].items():
+                        for cid, position in positions.items():
+                            self.add_ref(matches[i], file, cid, position)
+                    self.report["duplicates_near"] += 1
+
+            if new:
+                with span("index_upsert", size=len(new)):
+                    self.collection.upsert(
+                        ids=[chunk_ids[i] for i in new],
+                        documents=[texts[i] for i in new],
+                        metadatas=[self.record_metadata(chunk_ids[i]) for i in new],
+                        embeddings=vectors[new].tolist(),
+                    )
+                if self.lexical is not None:
+                    self.lexical.add_many([chunk_ids[i] for i in new], [texts[i] for i in new])
+                self.dirty.difference_update(chunk_ids[i] for i in new)
+            self.buffer = {}
+
+        # Refreshed "sources"/positions of records that gained or lost refs
+        dirty = [rid for rid in self.dirty if rid in self.records]
+        for start in range(0, len(dirty), self.batch_size):
+            batch = dirty[start:start + self.batch_size]
+            self.collection.update(ids=batch, metadatas=[self.record_metadata(rid) for rid in batch])
+        self.dirty = set()
+
+
+def cosine(a, b) -> float:
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    return float(a @ b / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-12))
+
+
+# Incremental Sync
+def split_chunks(chunks):
+    """Separates chunk texts from any extra per-chunk metadata (e.g. section path)."""
+    texts, metas = [], []
+    for chunk in chunks:
+        if isinstance(chunk, dict):
+            texts.append(chunk["text"])
+            metas.append({k: v for k, v in chunk.items() if k != "text"})
+        else:
+            texts.append(chunk)
+            metas.append({})
+    return texts, metas
+
+
+def reconcile_checkpoint(collection, manifest: dict, batch_size: int = EMBED_BATCH_SIZE):
+    """
+    Lines the collection up with a manifest checkpointed by an interrupted sync: records written
+    after the checkpoint are deleted, and records deleted after it are forgotten, with the files
+    that used them marked for re-parsing.
+    """
+    records = manifest["records"]
+    present = set(collection.get(include=[])["ids"])
+    kb_index.delete_in_batches(collection, [rid for rid in present if rid not in records], batch_size)
+    missing = {rid for rid in records if rid not in present}
+    for rid in missing:
+        for file, positions in records.pop(rid)["refs"].items():
+            entry = manifest["files"].get(file)
+            if entry:
+                for chunk_id in positions:
+                    entry["chunks"].pop(chunk_id, None)
+                entry["sha256"], entry["mtime_ns"] = "", None  # re-hashed, so the file is parsed again
+    for alias in [a for a, target in manifest["aliases"].items() if target in missing]:
+        del manifest["aliases"][alias]
+
+
+def serialized(fn):
+    @functools.wraps(fn)
+    def locked(*args, **kwargs):
+        with SYNC_LOCK:
+            return fn(*args, **kwargs)
+    return locked
+
+
+@kb_metrics.traced("sync_index")
+@serialized
+def sync_index(chunk_file, embed_documents=None, docs_folder: str = kb_index.DOCS_DIR,
+               db_dir: str = None, model_name: str = None,
+               batch_size: int = EMBED_BATCH_SIZE, workers: int = None, progress=None, only_files=None):
+    """
+    Brings the dell_kb collection in line with docs_folder, embedding only new or changed chunks.
+
+    chunk_file(filepath) -> list of chunk texts, or of {"text", ...extra metadata} dicts;
+    must be a module-level function so the process pool can pickle it.
+    embed_documents(texts) -> list of vectors; defaults to the collection's embedding function.
+    Both go through the shared on-disk embedding cache unless EMBED_CACHE=0.
+    db_dir defaults to the active index directory (kb_index.active_db_dir()).
+    progress(dict) is called after every parsed file with files_done/files_total,
+    chunks, embedded and embeddings_per_s so far.
+    only_files limits the sync to those file names (e.g. a fresh upload): other files are
+    neither re-hashed for changes nor removed, and keep the hashes they were indexed at in
+    the stamped corpus version, so edits to them still show the index as stale.
+    Returns (collection, report).
+    """
+    model_name = model_name or kb_index.embed_model_name()
+    db_dir = db_dir or kb_index.active_db_dir()
+    client = kb_index.get_client(db_dir)
+    manifest_path = os.path.join(db_dir, kb_index.MANIFEST_FILE)
+    collection, manifest, rebuilt = kb_index.open_or_reset_for_sync(client, kb_index.load_manifest(manifest_path), model_name)
+    report = kb_index.new_sync_report()
+    report["full_rebuild"] = rebuilt
+    stats = IngestStats()
+
+    # An interrupted sync left a checkpoint: the collection is reconciled with it, and the BM25
+    # and document indexes are rebuilt since they missed its writes
+    resumed = not rebuilt and manifest.pop("in_progress", False)
+    report["resumed"] = resumed
+    if resumed:
+        reconcile_checkpoint(collection, manifest, batch_size)
+
+    # BM25 and document indexes follow the collection incrementally when they match the pre-sync state
+    previous_version = None if resumed else (collection.metadata or {}).get("corpus_version")
+    lexical_path = os.path.join(db_dir, kb_lexical.BM25_FILE)
+    lexical = None if rebuilt else kb_lexical.LexicalIndex.load(lexical_path)
+    if lexical is not None and lexical.version != previous_version:
+        lexical = None
+    lexical_rebuild = lexical is None and not rebuilt
+    if rebuilt:
+        lexical = kb_lexical.LexicalIndex()
+
+    embed_fn = embed_documents or kb_index.get_embedding_function(model_name)
+    cache = embed_cache.EmbeddingCache(kb_index.embed_cache_key(model_name)) if embed_cache.EMBED_CACHE_ENABLED else None
+    if cache:
+        embed_fn = cache.wrap(embed_fn)
+
+    known = manifest["files"]
+    files = kb_index.list_docx_files(docs_folder)
+    removed = sorted(set(known) - set(files))
+    if only_files is not None:
+        removed = [f for f in removed if f in only_files]
+        files = [f for f in files if f in only_files]
+
+    # Cheap pass: content hashes decide which files need parsing at all
+    to_parse, old_entries, file_state = [], {}, {}
+    for file in files:
+        filepath = os.path.join(docs_folder, file)
+        entry = known.get(file)
+        sha = kb_index.cached_file_sha256(filepath, entry)
+        st = os.stat(filepath)
+        if entry and entry["sha256"] == sha:
+            entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+            report["files_unchanged"] += 1
+            continue
+        to_parse.append(file)
+        old_entries[file] = entry
+        file_state[file] = (sha, st.st_size, st.st_mtime_ns)
+
+    # Until the writer has drained, saved manifests are checkpoints a later sync resumes from
+    manifest["in_progress"] = True
+
+    def checkpoint():
+        with span("manifest_checkpoint"):
+            kb_index.save_manifest(manifest, manifest_path)
+
+    checkpoint()
+
+    def report_progress():
+        if progress is not None:
+            files_done = len(files) - len(file_state) + report["files_failed"]  # file_state: still to parse
+            progress({"files_done": files_done, "files_total": len(files), "chunks": stats.chunks,
+                      "embedded": stats.embedded, "embeddings_per_s": stats.as_dict()["embeddings_per_s"]})
+
+    writer = IndexWriter(collection, manifest, embed_fn, batch_size, stats, report, lexical=lexical,
+                         checkpoint=checkpoint)
+    committed = []
+    writer.start()
+    report_progress()
+    try:
+        for file in removed:
+            stale = list(known[file]["chunks"])
+            writer.put(("unref", file, stale))
+            writer.put(("forget", file))
+            report["files_removed"] += 1
+            report["chunks_deleted"] += len(stale)
+
+        for file, chunks, error in parse_stream(chunk_file, docs_folder, to_parse, workers):
+            if error:
+                print(f" Failed to parse {file}: {error}")
+                report["files_failed"] += 1
+                report_progress()
+                continue
+            stats.docs += 1
+            stats.chunks += len(chunks)
+
+            entry = old_entries.pop(file)
+            texts, metas = split_chunks(chunks)
+            ids, _ = kb_index.chunk_ids(texts)
+            positions = {}
+            for k, chunk_id in enumerate(ids):
+                positions.setdefault(chunk_id, k)
+            old = entry["chunks"] if entry else {}
+            stale = [c for c in old if c not in positions]
+            kept = {c: k for c, k in positions.items() if c in old}
+
+            if stale:
+                writer.put(("unref", file, stale))
+            if kept:
+                # Unchanged chunks may have moved within the file: refresh metadata only
+                writer.put(("move", file, kept))
+            fresh = 0
+            for chunk_id, k in positions.items():
+                if chunk_id not in old:
+                    writer.put(("ref", file, chunk_id, k, texts[k], metas[k]))
+                    fresh += 1
+
+            sha, size, mtime_ns = file_state.pop(file)
+            writer.put(("commit", file, {"sha256": sha, "size": size, "mtime_ns": mtime_ns, "chunks": positions,
+                                         "indexed_at": time.time()}))
+            report["files_changed" if entry else "files_added"] += 1
+            committed.append(file)
+            report["chunks_added"] += fresh
+            report["chunks_deleted"] += len(stale)
+            report["chunks_kept"] += len(kept)
+            report_progress()
+    finally:
+        writer.close()
+        if cache:
+            cache.close()
+            stats.extra.update(cache.stats())
+
+    report["chunks_embedded"] = stats.embedded
+    del manifest["in_progress"]
+    kb_index.save_manifest(manifest, manifest_path)
+    # Stamp what was indexed: files that failed to parse keep their old hash (or none), so the
+    # collection reads as stale and the next sync retries them
+    version = kb_index.indexed_version(manifest)
+    collection.modify(metadata=kb_index.index_metadata(model_name, version))
+    if lexical_rebuild:
+        lexical = kb_lexical.build_from_collection(collection)
+    lexical.version = version
+    lexical.save(lexical_path)
+    with span("doc_index"):
+        kb_routing.update_doc_index(client, collection, manifest, committed, removed, previous_version, version)
+    report.update(stats.as_dict())
+    report_progress()
+    return collection, report
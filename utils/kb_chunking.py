@@ -0,0 +1,220 @@
+import functools
+import os
+import re
+
+from docx import Document as DocxDocument
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+import kb_index
+from kb_metrics import span
+
+
+HEADING_RE = re.compile(r"^(?:Heading|Überschrift)\s*(\d+)$", re.IGNORECASE)
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+LIST_STYLES = ("List Bullet", "List Number", "List Paragraph", "List Continue")
+
+
+# Token Counting
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(model_name: str):
+    """The embedding model's own tokenizer, so budgets match what the model actually sees."""
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        print(f" Tokenizer for {model_name} unavailable ({e}); estimating tokens from word counts")
+        return None
+
+
+def count_tokens(text: str, model_name: str = None) -> int:
+    tokenizer = get_tokenizer(model_name or kb_index.embed_model_name())
+    if tokenizer is None:
+        return int(len(text.split()) * 1.3) + 1
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+# Document Reading
+def iter_blocks(doc):
+    """Yields paragraphs and tables in document order."""
+    for child in doc.element.body.iterchildren():
+        if child.tag.endswith("}p"):
+            yield Paragraph(child, doc)
+        elif child.tag.endswith("}tbl"):
+            yield Table(child, doc)
+
+
+def heading_level(paragraph):
+    """Heading level from the Word style, or a guess for short all-bold lines in 'Normal' docs."""
+    style = paragraph.style.name if paragraph.style is not None else ""
+    if style == "Title":
+        return 1
+    m = HEADING_RE.match(style)
+    if m:
+        return int(m.group(1))
+    text = paragraph.text.strip()
+    runs = [r for r in paragraph.runs if r.text.strip()]
+    if runs and all(r.bold for r in runs) and len(text.split()) <= 12 and not text.endswith((".", ":", ",")):
+        return 9
+    return None
+
+
+def is_list_item(paragraph) -> bool:
+    style = paragraph.style.name if paragraph.style is not None else ""
+    if style.startswith(LIST_STYLES):
+        return True
+    ppr = paragraph._p.pPr
+    return ppr is not None and ppr.numPr is not None
+
+
+def table_rows(table):
+    """Renders each row as 'Header: value; ...' using the first row as headers."""
+    rows = [[c.text.strip() for c in row.cells] for row in table.rows]
+    if not rows:
+        return []
+    header, body = rows[0], rows[1:]
+    if not body:
+        return [" | ".join(header)]
+    out = []
+    for row in body:
+        cells = [f"{h}: {v}" if h else v for h, v in zip(header, row) if v]
+        if cells:
+            out.append("; ".join(cells))
+    return out
+
+
+def read_blocks(filepath: str):
+    """
+    Returns [(section_path, unit_text)] in reading order.
+
+    Units are paragraphs, list items ("- " prefixed) and table rows; section_path is the
+    chain of headings above them, e.g. "Battery Issues > Battery Not Charging".
+    """
+    doc = DocxDocument(filepath)
+    headings = []  # [(level, text)]
+    units = []
+    for block in iter_blocks(doc):
+        path = " > ".join(t for _, t in headings)
+        if isinstance(block, Table):
+            units.extend((path, row) for row in table_rows(block))
+            continue
+        text = block.text.strip()
+        if not text:
+            continue
+        level = heading_level(block)
+        if level is not None:
+            headings = [(lv, t) for lv, t in headings if lv < level] + [(level, text)]
+        elif is_list_item(block):
+            units.append((path, f"- {text}"))
+        else:
+            units.append((path, text))
+    return units
+
+
+def read_docx(filepath: str) -> str:
+    """Extracts text content from a .docx file, including tables."""
+    doc = DocxDocument(filepath)
+    lines = []
+    for block in iter_blocks(doc):
+        if isinstance(block, Table):
+            lines.extend(table_rows(block))
+        elif block.text.strip():
+            lines.append(block.text.strip())
+    return "\n".join(lines)
+
+
+# Chunking
+def fit_windows(items, sep: str, budget: int, model_name: str, size: int):
+    """
+    Splits items into consecutive windows joined by sep: [(text, tokens)]. Each window starts
+    at `size` items and shrinks until its counted tokens fit the budget, since tokens are not
+    spread evenly over words; only a single item can still be over budget.
+    """
+    windows, start = [], 0
+    while start < len(items):
+        size = min(size, len(items) - start)
+        while True:
+            text = sep.join(items[start:start + size])
+            n = count_tokens(text, model_name)
+            if n <= budget or size == 1:
+                break
+            size = max(1, min(size - 1, int(size * budget / n)))
+        windows.append((text, n))
+        start += size
+    return windows
+
+
+def split_unit(text: str, budget: int, model_name: str):
+    """
+    Splits an oversized unit into sentences, oversized sentences into word windows, and words
+    that alone exceed the budget (long hex strings, URLs) into character slices.
+    """
+    pieces = []
+    for sentence in SENTENCE_RE.split(text):
+        n = count_tokens(sentence, model_name)
+        if n <= budget:
+            pieces.append((sentence, n))
+            continue
+        words = sentence.split()
+        for window, m in fit_windows(words, " ", budget, model_name, max(1, int(len(words) * budget / n))):
+            if m <= budget:
+                pieces.append((window, m))
+            else:
+                pieces.extend(fit_windows(window, "", budget, model_name, max(1, int(len(window) * budget / m))))
+    return pieces
+
+
+def chunk_units(units, max_tokens: int = None, overlap_tokens: int = None, model_name: str = None):
+    """
+    Packs (section_path, text) units into chunks of at most max_tokens tokens.
+
+    Chunks never span sections; each starts with its section path so the embedding keeps
+    the heading context, and consecutive chunks in a section share up to overlap_tokens
+    of trailing units.
+    """
+    max_tokens = max_tokens or kb_index.CHUNK_MAX_TOKENS
+    overlap_tokens = kb_index.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    model_name = model_name or kb_index.embed_model_name()
+
+    sections = []
+    for path, text in units:
+        if not sections or sections[-1][0] != path:
+            sections.append((path, []))
+        sections[-1][1].append(text)
+
+    chunks = []
+    for path, texts in sections:
+        header = f"{path}\n" if path else ""
+        budget = max(16, max_tokens - (count_tokens(header, model_name) if header else 0))
+        pieces = []
+        for text in texts:
+            n = count_tokens(text, model_name)
+            pieces.extend([(text, n)] if n <= budget else split_unit(text, budget, model_name))
+
+        current, used = [], 0
+        for text, n in pieces:
+            if current and used + n > budget:
+                chunks.append({"text": header + "\n".join(t for t, _ in current), "section": path})
+                carry, carried = [], 0
+                for t, m in reversed(current):
+                    if carried + m > overlap_tokens or carried + m + n > budget:
+                        break
+                    carry.insert(0, (t, m))
+                    carried += m
+                current, used = carry, carried
+            current.append((text, n))
+            used += n
+        if current:
+            chunks.append({"text": header + "\n".join(t for t, _ in current), "section": path})
+    return chunks
+
+
+def chunk_file(filepath: str):
+    """Reads one .docx and returns token-bounded chunks: [{"text", "section"}]."""
+    with span("read_docx", file=os.path.basename(filepath)) as s:
+        units = read_blocks(filepath)
+        s.set(units=len(units))
+    with span("chunk", units=len(units)) as s:
+        chunks = chunk_units(units)
+        s.set(chunks=len(chunks))
+    return chunks
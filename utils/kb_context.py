@@ -0,0 +1,191 @@
+import os
+import re
+
+
+# Configuration
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1200"))
+CONTEXT_OVERLAP_THRESHOLD = float(os.getenv("CONTEXT_OVERLAP_THRESHOLD", "0.8"))  # word-set containment
+CONTEXT_MIN_PART_TOKENS = 48  # don't bother adding a truncated part smaller than this
+
+WORD_RE = re.compile(r"\w+")
+
+
+def count_tokens(text: str) -> int:
+    """Tokens by the embedding model's tokenizer (a close proxy for the LLM's); imported lazily."""
+    from kb_chunking import count_tokens as count
+
+    return count(text)
+
+
+def word_set(text: str):
+    return frozenset(WORD_RE.findall(text.lower()))
+
+
+def containment(a, b) -> float:
+    """Share of the smaller word set that also appears in the other one."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+# Chunks & Parts
+class Chunk:
+    def __init__(self, rank, chunk_id, text, meta):
+        meta = meta or {}
+        self.rank = rank
+        self.id = chunk_id
+        self.source = meta.get("source") or "unknown"
+        self.section = meta.get("section") or ""
+        self.index = meta.get("chunk")
+        body = text
+        if self.section and text.startswith(self.section + "\n"):
+            body = text[len(self.section) + 1:]  # the chunker prefixes every chunk with its heading path
+        self.lines = [line for line in body.split("\n") if line.strip()]
+        self.words = word_set(body)
+
+
+class Part:
+    """Consecutive chunks of one source, rendered as a single citation."""
+
+    def __init__(self, chunk):
+        self.chunks = [chunk]
+
+    @property
+    def rank(self):
+        return min(c.rank for c in self.chunks)
+
+    @property
+    def source(self):
+        return self.chunks[0].source
+
+    def adjacent(self, chunk) -> bool:
+        if chunk.source != self.source or chunk.index is None or self.chunks[0].index is None:
+            return False
+        return chunk.index in (self.chunks[0].index - 1, self.chunks[-1].index + 1)
+
+    def touches(self, other) -> bool:
+        return any(self.adjacent(c) for c in (other.chunks[0], other.chunks[-1]))
+
+    def add(self, chunk):
+        self.chunks.append(chunk)
+        self.chunks.sort(key=lambda c: c.index)
+
+    def merge(self, other):
+        self.chunks = sorted(self.chunks + other.chunks, key=lambda c: c.index)
+
+    def lines(self):
+        """Body lines in document order, with the overlap between consecutive chunks removed."""
+        out, section = [], None
+        for chunk in self.chunks:
+            lines = chunk.lines
+            if out:
+                k = min(len(out), len(lines))
+                while k and out[-k:] != lines[:k]:
+                    k -= 1
+                lines = lines[k:]
+            if chunk.section != section and lines:
+                if out and chunk.section:
+                    out.append(f"({chunk.section})")
+                section = chunk.section
+            out.extend(lines)
+        return out
+
+    def label(self) -> str:
+        section = self.chunks[0].section
+        return f"{self.source} › {section}" if section else self.source
+
+
+# Context Builder
+def new_context_report(budget):
+    return {
+        "budget_tokens": budget, "context_tokens": 0, "parts": 0, "chunks_in": 0, "chunks_used": 0,
+        "duplicates_dropped": 0, "merged": 0, "truncated": 0, "skipped": 0, "sources": [],
+    }
+
+
+def group_chunks(chunks, threshold, report):
+    """Drops exact/overlapping duplicates and groups adjacent chunks of the same source."""
+    parts, seen_ids, seen_text = [], set(), set()
+    for chunk in chunks:
+        key = "\n".join(chunk.lines)
+        if chunk.id in seen_ids or key in seen_text:
+            report["duplicates_dropped"] += 1
+            continue
+        seen_ids.add(chunk.id)
+        seen_text.add(key)
+
+        part = next((p for p in parts if p.adjacent(chunk)), None)
+        if part is not None:
+            part.add(chunk)
+            report["merged"] += 1
+            continue
+        if any(containment(chunk.words, c.words) >= threshold for p in parts for c in p.chunks):
+            report["duplicates_dropped"] += 1
+            continue
+        parts.append(Part(chunk))
+
+    # A chunk that arrived late can bridge two parts of the same source: join them
+    i = 0
+    while i < len(parts):
+        other = next((p for p in parts[i + 1:] if parts[i].touches(p)), None)
+        if other is None:
+            i += 1
+            continue
+        parts[i].merge(other)
+        parts.remove(other)
+    return sorted(parts, key=lambda p: p.rank)
+
+
+def fit_lines(lines, budget):
+    """Leading lines of a part that fit within budget tokens."""
+    kept, used = [], 0
+    for line in lines:
+        n = count_tokens(line) + 1
+        if used + n > budget:
+            break
+        kept.append(line)
+        used += n
+    return kept
+
+
+def build_context(documents, ids=None, metadatas=None, max_tokens=CONTEXT_MAX_TOKENS,
+                  overlap_threshold=CONTEXT_OVERLAP_THRESHOLD):
+    """
+    Assembles retrieved chunks (in rank order) into a citation-tagged prompt context.
+
+    Duplicate and mostly-overlapping chunks are dropped, adjacent chunks of the same
+    source are merged in document order, and parts are added in rank order until
+    max_tokens is reached (a part that does not fit is truncated by lines, or skipped
+    if too little room is left). Returns (context_text, report).
+    """
+    ids = ids or [None] * len(documents)
+    metadatas = metadatas or [{}] * len(documents)
+    report = new_context_report(max_tokens)
+    report["chunks_in"] = len(documents)
+    chunks = [Chunk(rank, cid, text, meta) for rank, (cid, text, meta) in enumerate(zip(ids, documents, metadatas))]
+
+    blocks, used = [], 0
+    for part in group_chunks(chunks, overlap_threshold, report):
+        tag = f"[{len(blocks) + 1}] {part.label()}"
+        lines = part.lines()
+        header_tokens = count_tokens(tag) + 1
+        body = "\n".join(lines)
+        n = header_tokens + count_tokens(body)
+        if used + n > max_tokens:
+            room = max_tokens - used - header_tokens
+            lines = fit_lines(lines, room) if room >= CONTEXT_MIN_PART_TOKENS else []
+            if not lines:
+                report["skipped"] += 1
+                continue
+            body = "\n".join(lines)
+            n = header_tokens + count_tokens(body)
+            report["truncated"] += 1
+        blocks.append(f"{tag}\n{body}")
+        used += n
+        report["chunks_used"] += len(part.chunks)
+        if part.source not in report["sources"]:
+            report["sources"].append(part.source)
+
+    report["parts"] = len(blocks)
+    report["context_tokens"] = used
+    return "\n\n".join(blocks), report
@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+import kb_index
+from embed_cache import model_slug
+
+
+# Configuration
+EMBED_BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBED_ONNX_INT8_FILE = os.getenv("EMBED_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")  # shipped by most sbert repos
+EMBED_ONNX_DIR = os.getenv("EMBED_ONNX_DIR", os.path.join(kb_index.CHROMA_DB_DIR, "onnx_models"))
+EMBED_COMPAT_MIN_COSINE = float(os.getenv("EMBED_COMPAT_MIN_COSINE", "0.98"))
+EMBED_COMPAT_SAMPLE = 8
+
+
+# ONNX Runtime Backend
+def load_onnx_model(model_name: str, quantized: bool):
+    """
+    sentence-transformers model on ONNX Runtime. For int8, uses the repo's pre-quantized
+    file if it ships one, otherwise quantizes the exported model once into EMBED_ONNX_DIR.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if not quantized:
+        return SentenceTransformer(model_name, device="cpu", backend="onnx")
+    try:
+        return SentenceTransformer(model_name, device="cpu", backend="onnx",
+                                   model_kwargs={"file_name": EMBED_ONNX_INT8_FILE})
+    except Exception as e:
+        print(f" No pre-quantized {EMBED_ONNX_INT8_FILE} for {model_name} ({e}); quantizing locally")
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    local_dir = os.path.join(EMBED_ONNX_DIR, model_slug(model_name))
+    local_file = os.path.join("onnx", "model_qint8_avx2.onnx")
+    if not os.path.exists(os.path.join(local_dir, local_file)):
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+        model.save(local_dir)
+        export_dynamic_quantized_onnx_model(model, "avx2", local_dir)
+    return SentenceTransformer(local_dir, device="cpu", backend="onnx", model_kwargs={"file_name": local_file})
+
+
+class OnnxEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Chroma embedding function running a sentence-transformers model on ONNX Runtime.
+
+    It reports the sentence-transformers name() and config, so Chroma accepts it for
+    collections built with the torch backend; whether the stored vectors really match is
+    checked by check_compatibility().
+    """
+
+    models = {}  # (model, backend) -> SentenceTransformer
+
+    def __init__(self, model_name: str, backend: str = "onnx"):
+        self.model_name = model_name
+        self.backend = backend
+        key = (model_name, backend)
+        if key not in self.models:
+            self.models[key] = load_onnx_model(model_name, quantized=backend == "onnx-int8")
+        self.model = self.models[key]
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = self.model.encode(list(input), convert_to_numpy=True, normalize_embeddings=False)
+        return [np.asarray(v, dtype=np.float32) for v in vectors]
+
+    @staticmethod
+    def name() -> str:
+        return SentenceTransformerEmbeddingFunction.name()
+
+    def get_config(self) -> dict:
+        return {"model_name": self.model_name, "device": "cpu", "normalize_embeddings": False, "kwargs": {}}
+
+    @staticmethod
+    def build_from_config(config: dict) -> EmbeddingFunction:
+        """Collections only record the sentence-transformers config, so they reopen on torch."""
+        return SentenceTransformerEmbeddingFunction.build_from_config(config)
+
+
+def make_embedding_function(model_name: str, backend: str):
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"unknown EMBED_BACKEND {backend!r}; expected one of {', '.join(EMBED_BACKENDS)}")
+    if backend == "torch":
+        return SentenceTransformerEmbeddingFunction(model_name=model_name)
+    return OnnxEmbeddingFunction(model_name, backend)
+
+
+# Compatibility
+def check_compatibility(collection, embedding_function, sample: int = EMBED_COMPAT_SAMPLE,
+                        min_cosine: float = EMBED_COMPAT_MIN_COSINE):
+    """
+    Re-embeds a few stored chunks with embedding_function and compares them to the stored
+    vectors. Returns (compatible, mean cosine, reason).
+    """
+    stored = collection.get(limit=sample, include=["documents", "embeddings"])
+    if not len(stored["ids"]):
+        return True, 1.0, "collection is empty"
+    old = np.asarray(stored["embeddings"], dtype=np.float32)
+    new = np.asarray(embedding_function(stored["documents"]), dtype=np.float32)
+    if old.shape != new.shape:
+        return False, 0.0, f"dimension {new.shape[1]} does not match stored {old.shape[1]}"
+    cos = np.sum(old * new, axis=1) / np.maximum(np.linalg.norm(old, axis=1) * np.linalg.norm(new, axis=1), 1e-12)
+    mean = float(np.mean(cos))
+    if mean < min_cosine:
+        return False, mean, f"mean cosine {mean:.4f} to stored vectors is below {min_cosine}"
+    return True, mean, f"mean cosine {mean:.4f} to stored vectors"
@@ -0,0 +1,358 @@
+"""
+Exact-search export of the KB index, next to the Chroma files of the index it came from:
+
+    flat_vectors.npy     every chunk embedding, L2-normalized, float16
+    flat_texts.bin       chunk texts, UTF-8, back to back
+    flat_metadatas.bin   chunk metadata as JSON, back to back
+    flat_offsets.npy     (2, rows + 1) byte offsets of each text and each metadata record
+    flat_columns.npy     (fields, rows) float64 per metadata field: numbers, or codes of strings
+    flat_records.json    header (corpus version, fields with their string values) and the ids
+
+FlatIndex memory-maps all of these but the records table, so every process searching the
+same export shares one copy in the page cache; only the ids and the header are loaded.
+It answers the subset of Chroma's collection API the query path uses
+(query/get/count/metadata) with a brute-force top-k in NumPy, and evaluates where filters
+on the field columns. Neither chromadb nor its HNSW files are loaded.
+
+    python utils/store_embedding.py --export-flat   # syncs the index and writes the export
+    FLAT_SEARCH=1 python utils/dell_knowledge_query_groq.py
+"""
+import json
+import operator
+import os
+
+import numpy as np
+
+import kb_index
+
+
+# Configuration
+FLAT_VECTORS_FILE = "flat_vectors.npy"
+FLAT_TEXTS_FILE = "flat_texts.bin"
+FLAT_METADATAS_FILE = "flat_metadatas.bin"
+FLAT_OFFSETS_FILE = "flat_offsets.npy"
+FLAT_COLUMNS_FILE = "flat_columns.npy"
+FLAT_RECORDS_FILE = "flat_records.json"  # written last: the corpus version of a complete export
+FLAT_EXPORT_BATCH = 1024
+FLAT_SEARCH_BLOCK = 65536  # rows converted to float32 per matrix product
+FLAT_MAX_CODES = 4096  # string fields with more distinct values (e.g. chunk_hash) get no column
+
+
+def unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def has_export(db_dir: str = None) -> bool:
+    return os.path.exists(os.path.join(db_dir or kb_index.active_db_dir(), FLAT_RECORDS_FILE))
+
+
+def export_version(db_dir: str = None):
+    """Corpus version the export was written at, or None if there is no readable export."""
+    try:
+        with open(os.path.join(db_dir or kb_index.active_db_dir(), FLAT_RECORDS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)["header"].get("corpus_version")
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# Export
+def field_columns(fields: dict, rows: int):
+    """
+    {field: [value per row]} -> (field specs, (fields, rows) float64 matrix, fields without a
+    column). Numbers are stored as they are, strings as the index of their value in the
+    spec's "values"; NaN means missing. Fields of mixed types or with too many distinct
+    strings get no column.
+    """
+    specs, columns, unindexed = [], [], []
+    for name, values in sorted(fields.items()):
+        present = [v for v in values if v is not None]
+        if present and all(isinstance(v, (int, float)) for v in present):
+            specs.append({"name": name, "kind": "number"})
+            columns.append([np.nan if v is None else float(v) for v in values])
+            continue
+        if present and all(isinstance(v, str) for v in present):
+            vocab = sorted(set(present))
+            if len(vocab) <= FLAT_MAX_CODES:
+                code = {v: float(i) for i, v in enumerate(vocab)}
+                specs.append({"name": name, "kind": "string", "values": vocab})
+                columns.append([np.nan if v is None else code[v] for v in values])
+                continue
+        unindexed.append(name)
+    return specs, np.array(columns, dtype=np.float64).reshape(len(columns), rows), unindexed
+
+
+def export_flat(collection, db_dir: str = None) -> dict:
+    """
+    Writes collection's records to db_dir as a flat index; returns its header. Every file is
+    written under a temporary name and renamed into place, the records table (which carries
+    the corpus version) last, so a reader sees either the old export or the complete new one.
+    """
+    db_dir = db_dir or kb_index.active_db_dir()
+    path = lambda name, tmp=False: os.path.join(db_dir, name + (".tmp" if tmp else ""))
+    total = collection.count()
+    ids, vectors, fields = [], None, {}
+    offsets = ([0], [0])
+    with open(path(FLAT_TEXTS_FILE, True), "wb") as texts, open(path(FLAT_METADATAS_FILE, True), "wb") as metas:
+        for offset in range(0, total, FLAT_EXPORT_BATCH):
+            batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=FLAT_EXPORT_BATCH,
+                                   offset=offset)
+            block = unit_rows(batch["embeddings"]).astype(np.float16)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(path(FLAT_VECTORS_FILE, True), mode="w+",
+                                                    dtype=np.float16, shape=(total, block.shape[1]))
+            vectors[len(ids):len(ids) + len(block)] = block
+            for row, (document, meta) in enumerate(zip(batch["documents"], batch["metadatas"]), len(ids)):
+                meta = meta or {}
+                for key in meta:
+                    fields.setdefault(key, [None] * row)
+                for key, values in fields.items():
+                    values.append(meta.get(key))
+                for f, column, data in ((texts, 0, (document or "").encode("utf-8")),
+                                        (metas, 1, json.dumps(meta, ensure_ascii=False).encode("utf-8"))):
+                    f.write(data)
+                    offsets[column].append(offsets[column][-1] + len(data))
+            ids.extend(batch["ids"])
+    if vectors is None:
+        raise kb_index.IndexUnavailable("cannot export an empty index")
+    vectors.flush()
+    dim = vectors.shape[1]
+    del vectors
+
+    specs, columns, unindexed = field_columns(fields, len(ids))
+    for name, array in ((FLAT_OFFSETS_FILE, np.array(offsets, dtype=np.int64)), (FLAT_COLUMNS_FILE, columns)):
+        with open(path(name, True), "wb") as f:
+            np.save(f, array)
+    header = {**(collection.metadata or {}), "count": len(ids), "dim": dim, "fields": specs, "unindexed": unindexed}
+    with open(path(FLAT_RECORDS_FILE, True), "w", encoding="utf-8") as f:
+        json.dump({"header": header, "ids": ids}, f, ensure_ascii=False, separators=(",", ":"))
+    for name in (FLAT_VECTORS_FILE, FLAT_TEXTS_FILE, FLAT_METADATAS_FILE, FLAT_OFFSETS_FILE, FLAT_COLUMNS_FILE,
+                 FLAT_RECORDS_FILE):
+        os.replace(path(name, True), path(name))
+    return header
+
+
+def refresh_export(collection, report: dict, db_dir: str = None, create: bool = False):
+    """
+    Re-exports collection after a sync if an export exists (or create is set) and either the
+    sync changed the collection or the export is behind it; returns the new header or None.
+    """
+    db_dir = db_dir or kb_index.active_db_dir()
+    if not create and not has_export(db_dir):
+        return None
+    current = export_version(db_dir) == (collection.metadata or {}).get("corpus_version")
+    if not create and current and not kb_index.sync_changed(report):
+        return None
+    return export_flat(collection, db_dir)
+
+
+# Metadata Filters
+COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+def compare(op: str, value, target) -> bool:
+    """One where condition on one metadata value (None: the field is missing)."""
+    if op == "$eq":
+        return value == target
+    if op == "$ne":
+        return value != target
+    if op == "$in":
+        return value in target
+    if op == "$nin":
+        return value not in target
+    if op not in COMPARISONS:
+        raise ValueError(f"unsupported where operator {op!r}")
+    return value is not None and COMPARISONS[op](value, target)
+
+
+def conditions(cond):
+    """{"$op": target, ...} pairs of a field's condition; a bare value means $eq."""
+    return cond.items() if isinstance(cond, dict) else [("$eq", cond)]
+
+
+def matches(meta: dict, where: dict) -> bool:
+    """Chroma's where syntax: {"field": value}, {"field": {"$eq|$ne|$in|$nin|$gt|$gte|$lt|$lte": v}}, $and/$or."""
+    for key, cond in where.items():
+        if key == "$and":
+            ok = all(matches(meta, c) for c in cond)
+        elif key == "$or":
+            ok = any(matches(meta, c) for c in cond)
+        else:
+            ok = all(compare(op, meta.get(key), target) for op, target in conditions(cond))
+        if not ok:
+            return False
+    return True
+
+
+def open_blob(path: str):
+    """Read-only byte view of a file (np.memmap cannot map an empty one)."""
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+# Flat Index
+class FlatIndex:
+    """Read-only exact-search stand-in for the dell_kb Chroma collection."""
+
+    exact = True  # brute-force search over every chunk: no document routing needed
+
+    def __init__(self, db_dir: str = None, embedding_function=None):
+        db_dir = db_dir or kb_index.active_db_dir()
+        path = lambda name: os.path.join(db_dir, name)
+        try:
+            with open(path(FLAT_RECORDS_FILE), "r", encoding="utf-8") as f:
+                records = json.load(f)
+            self.vectors = np.load(path(FLAT_VECTORS_FILE), mmap_mode="r")
+            self.offsets = np.load(path(FLAT_OFFSETS_FILE), mmap_mode="r")
+            self.columns = np.load(path(FLAT_COLUMNS_FILE), mmap_mode="r")
+            self.texts = open_blob(path(FLAT_TEXTS_FILE))
+            self.metas = open_blob(path(FLAT_METADATAS_FILE))
+        except (OSError, ValueError, KeyError) as e:
+            raise kb_index.IndexUnavailable(f"no flat index export in {db_dir}: {e}")
+        self.metadata = records["header"]
+        self.ids = records["ids"]
+        rows = len(self.ids)
+        self.fields = {spec["name"]: (i, spec) for i, spec in enumerate(self.metadata.get("fields", []))}
+        if (self.vectors.shape != (rows, self.metadata["dim"]) or self.offsets.shape != (2, rows + 1)
+                or self.columns.shape != (len(self.fields), rows)
+                or (self.offsets[0, -1], self.offsets[1, -1]) != (len(self.texts), len(self.metas))):
+            raise kb_index.IndexUnavailable(f"flat index in {db_dir} is incomplete (export in progress?)")
+        self.rows = {cid: i for i, cid in enumerate(self.ids)}
+        self.embedding_function = embedding_function
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def document(self, row: int) -> str:
+        return bytes(self.texts[self.offsets[0, row]:self.offsets[0, row + 1]]).decode("utf-8")
+
+    def metadata_of(self, row: int) -> dict:
+        return json.loads(bytes(self.metas[self.offsets[1, row]:self.offsets[1, row + 1]]).decode("utf-8"))
+
+    # Filters
+    def mask(self, where):
+        """Rows matching a where filter, evaluated column-wise (see matches() for the syntax)."""
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, cond in where.items():
+            if key == "$and":
+                for c in cond:
+                    mask &= self.mask(c)
+            elif key == "$or":
+                mask &= np.logical_or.reduce([self.mask(c) for c in cond])
+            else:
+                for op, target in conditions(cond):
+                    mask &= self.field_mask(key, op, target)
+        return mask
+
+    def field_mask(self, name: str, op: str, target):
+        if name not in self.fields:
+            if name not in self.metadata.get("unindexed", ()):
+                return np.full(len(self.ids), compare(op, None, target))  # no row has the field
+            # a field without a column (mixed types, too many distinct strings): row by row
+            return np.fromiter((compare(op, self.metadata_of(r).get(name), target) for r in range(len(self.ids))),
+                               dtype=bool, count=len(self.ids))
+        i, spec = self.fields[name]
+        column = self.columns[i]
+        present = ~np.isnan(column)
+        if spec["kind"] == "string":
+            # evaluate the condition once per distinct value, then look it up by code
+            values = spec["values"]
+            ok = np.fromiter((compare(op, v, target) for v in values), dtype=bool, count=len(values))
+            out = np.full(len(column), compare(op, None, target))
+            out[present] = ok[column[present].astype(np.int64)]
+            return out
+        if op in ("$in", "$nin"):
+            hit = np.isin(column, [float(t) for t in target if isinstance(t, (int, float))])
+            return hit if op == "$in" else ~hit
+        if op in ("$eq", "$ne"):
+            hit = column == float(target) if isinstance(target, (int, float)) else np.zeros(len(column), dtype=bool)
+            return hit if op == "$eq" else ~hit
+        if op not in COMPARISONS:
+            raise ValueError(f"unsupported where operator {op!r}")
+        with np.errstate(invalid="ignore"):
+            return COMPARISONS[op](column, target) & present
+
+    # Search
+    def scores(self, queries):
+        """Cosine similarity of every row to each query: (rows, queries) float32."""
+        out = np.empty((len(self.ids), len(queries)), dtype=np.float32)
+        for start in range(0, len(self.ids), FLAT_SEARCH_BLOCK):
+            block = np.asarray(self.vectors[start:start + FLAT_SEARCH_BLOCK], dtype=np.float32)
+            out[start:start + len(block)] = block @ queries.T
+        return out
+
+    def records(self, rows, include):
+        return {
+            "ids": [self.ids[r] for r in rows],
+            "documents": [self.document(r) for r in rows] if "documents" in include else None,
+            "metadatas": [self.metadata_of(r) for r in rows] if "metadatas" in include else None,
+            "embeddings": np.asarray(self.vectors[rows], dtype=np.float32) if "embeddings" in include else None,
+        }
+
+    def query(self, query_embeddings=None, n_results: int = 10, where: dict = None, ids=None, query_texts=None,
+              include=("documents", "metadatas", "distances")):
+        """Top n_results per query by cosine similarity, as Chroma returns them (one list per query)."""
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts))
+        queries = unit_rows(query_embeddings)
+        scores = self.scores(queries)
+        if where:
+            scores[~self.mask(where)] = -np.inf
+        if ids is not None:
+            allowed = np.zeros(len(self.ids), dtype=bool)
+            allowed[[self.rows[cid] for cid in ids if cid in self.rows]] = True
+            scores[~allowed] = -np.inf
+        k = min(n_results, len(self.ids))
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in range(len(queries)):
+            column = scores[:, q]
+            top = np.argpartition(-column, k - 1)[:k] if k < len(column) else np.arange(len(column))
+            top = top[np.argsort(-column[top], kind="stable")]
+            top = top[np.isfinite(column[top])]
+            found = self.records(top, include)
+            for key in ("ids", "documents", "metadatas"):
+                results[key].append(found[key])
+            results["distances"].append((1.0 - column[top]).tolist())
+        return results
+
+    def get(self, ids=None, where: dict = None, limit: int = None, offset: int = 0,
+            include=("documents", "metadatas")):
+        if ids is not None:
+            rows = [self.rows[cid] for cid in ids if cid in self.rows]
+        else:
+            rows = np.flatnonzero(self.mask(where)).tolist() if where else list(range(len(self.ids)))
+            rows = rows[offset:offset + limit if limit is not None else None]
+        return self.records(rows, include)
+
+
+def open_flat(model_name: str = None, docs_folder: str = kb_index.DOCS_DIR, db_dir: str = None,
+              embedding_function=None, stale_ok: bool = False) -> FlatIndex:
+    """The flat export of the active index, checked against the model and corpus like open_collection()."""
+    db_dir = db_dir or kb_index.active_db_dir()
+    index = FlatIndex(db_dir, embedding_function)
+    version = None
+    if not stale_ok:
+        manifest = kb_index.load_manifest(os.path.join(db_dir, kb_index.MANIFEST_FILE))
+        version = kb_index.corpus_version(docs_folder, manifest)
+    kb_index.check_index(index, model_name or kb_index.embed_model_name(), version)
+    return index
+
+
+# Query Encoder
+class Encoder:
+    """Query embeddings straight from sentence-transformers, so flat search never imports chromadb."""
+
+    def __init__(self, model_name: str, backend: str = None):
+        backend = backend or kb_index.embed_backend_name()
+        if backend == "torch":
+            from sentence_transformers import SentenceTransformer
+
+            self.model = SentenceTransformer(model_name, device="cpu")
+        else:
+            import kb_embeddings  # the ONNX loader; this path does import chromadb
+
+            self.model = kb_embeddings.load_onnx_model(model_name, quantized=backend == "onnx-int8")
+
+    def __call__(self, texts):
+        return list(self.model.encode(list(texts), convert_to_numpy=True))
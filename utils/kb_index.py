@@ -0,0 +1,393 @@
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+
+try:
+    import fcntl
+except ImportError:  # Windows: msvcrt byte-range locks instead
+    fcntl = None
+    import msvcrt
+
+
+# Configuration
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DOCS_DIR = os.path.join(BASE_DIR, "docs", "dell-data")
+CHROMA_DB_DIR = os.path.join(BASE_DIR, "chroma_dell_db")
+COLLECTION_NAME = "dell_kb"
+MANIFEST_FILE = "manifest.json"
+SLOTS_DIR = "slots"  # blue/green builds: chroma_dell_db/slots/<slot>/
+ACTIVE_SLOT_FILE = "active_slot"  # name of the slot queries use; absent = the root directory itself
+INDEX_LOCK_FILE = "index.lock"  # held while syncing into the active slot or switching slots
+DEFAULT_EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Chunk token budget (embedding model tokens) and overlap between consecutive chunks
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+
+# Bump whenever parsing/chunking changes so old indexes are rejected
+INDEX_SCHEMA_VERSION = f"3-t{CHUNK_MAX_TOKENS}-o{CHUNK_OVERLAP_TOKENS}"
+
+
+class IndexUnavailable(Exception):
+    """Raised when the persisted index is missing or does not match the current config."""
+
+
+def embed_model_name():
+    """Returns the configured embedding model (EMBED_MODEL from .env or the default)."""
+    return os.getenv("EMBED_MODEL", DEFAULT_EMBED_MODEL)
+
+
+def embed_backend_name():
+    """Returns the configured embedding runtime: torch (default), onnx or onnx-int8 (EMBED_BACKEND)."""
+    return os.getenv("EMBED_BACKEND", "torch")
+
+
+def embed_cache_key(model_name: str, backend: str = None) -> str:
+    """Embedding-cache namespace: vectors from different runtimes are never mixed in the cache."""
+    backend = backend or embed_backend_name()
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+# Corpus Versioning
+def list_docx_files(docs_folder: str = DOCS_DIR):
+    """Returns the sorted .docx file names in the docs folder."""
+    if not os.path.isdir(docs_folder):
+        return []
+    return sorted(f for f in os.listdir(docs_folder) if f.lower().endswith(".docx"))
+
+
+def file_sha256(filepath: str) -> str:
+    """Hashes a file's content in fixed-size blocks."""
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cached_file_sha256(filepath: str, entry: dict = None) -> str:
+    """Reuses the manifest hash when size and mtime are unchanged, otherwise re-hashes the file."""
+    st = os.stat(filepath)
+    if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+        return entry["sha256"]
+    return file_sha256(filepath)
+
+
+def fingerprint(file_hashes) -> str:
+    """Hashes (file name, content hash) pairs, in file name order, with the schema version."""
+    h = hashlib.sha256(INDEX_SCHEMA_VERSION.encode())
+    for file, sha in file_hashes:
+        h.update(file.encode())
+        h.update(sha.encode())
+    return h.hexdigest()[:16]
+
+
+def corpus_version(docs_folder: str = DOCS_DIR, manifest: dict = None) -> str:
+    """Fingerprint of the corpus: file names and content hashes of every .docx."""
+    if manifest is None:
+        manifest = load_manifest(os.path.join(active_db_dir(), MANIFEST_FILE))
+    known = manifest.get("files", {})
+    return fingerprint((file, cached_file_sha256(os.path.join(docs_folder, file), known.get(file)))
+                       for file in list_docx_files(docs_folder))
+
+
+def indexed_version(manifest: dict) -> str:
+    """
+    Fingerprint of the files the manifest records as indexed, with the hashes they were
+    indexed at. It equals corpus_version only once every .docx on disk has been synced.
+    """
+    return fingerprint((file, entry["sha256"]) for file, entry in sorted(manifest.get("files", {}).items()))
+
+
+# Manifest
+# files:   file -> {sha256, size, mtime_ns, chunks: {chunk id: position}, indexed_at}
+# records: Chroma record id -> {refs: {file: {chunk id: position}}, source, chunk, chunk_hash, meta}
+# aliases: near-duplicate chunk id -> record id that stands in for it
+def new_manifest(model_name: str) -> dict:
+    return {
+        "embed_model": model_name, "embed_backend": embed_backend_name(), "schema_version": INDEX_SCHEMA_VERSION,
+        "complete": True,
+        "files": {}, "records": {}, "aliases": {},
+    }
+
+
+def load_manifest(path: str) -> dict:
+    """Loads the index manifest, or an empty one if it does not exist yet."""
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path: str):
+    """Writes the manifest atomically so a crash never leaves it half-written."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace/unicode normalization so trivially different copies hash the same."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def chunk_ids(chunks):
+    """
+    Content-addressed ids, "c::" plus the first 20 hex digits of the sha256 of the normalized
+    text: the same text gets the same id in every file, whatever its source or position.
+    """
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    return [f"c::{h[:20]}" for h in hashes], hashes
+
+
+def index_metadata(model_name: str, version: str) -> dict:
+    """Collection metadata recorded at build time and checked at load time."""
+    return {
+        "embed_model": model_name,
+        "embed_backend": embed_backend_name(),
+        "corpus_version": version,
+        "schema_version": INDEX_SCHEMA_VERSION,
+    }
+
+
+# Index Slots
+def slot_dir(slot: str, root: str = None) -> str:
+    return os.path.join(root or CHROMA_DB_DIR, SLOTS_DIR, slot)
+
+
+def active_slot(root: str = None):
+    """Name of the active slot, or None while the index lives directly in the root directory."""
+    try:
+        with open(os.path.join(root or CHROMA_DB_DIR, ACTIVE_SLOT_FILE), "r", encoding="utf-8") as f:
+            slot = f.read().strip()
+    except OSError:
+        return None
+    return slot if slot and os.path.isdir(slot_dir(slot, root)) else None
+
+
+def active_db_dir(root: str = None) -> str:
+    """
+    Directory holding the index that queries and incremental syncs use. A background
+    rebuild fills a fresh slot and then switches to it with activate_slot().
+    """
+    slot = active_slot(root)
+    return slot_dir(slot, root) if slot else (root or CHROMA_DB_DIR)
+
+
+def activate_slot(slot: str, root: str = None):
+    """Atomically points the index at a fully built slot."""
+    path = os.path.join(root or CHROMA_DB_DIR, ACTIVE_SLOT_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(slot)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def lock_file(path: str, blocking: bool = True):
+    """
+    Opens path and takes an exclusive lock on it, held until the returned file is closed.
+    Returns None if blocking is False and another process holds the lock.
+    """
+    f = open(path, "a")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return f
+        f.seek(0)
+        while True:  # msvcrt has no blocking lock without a retry limit
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)  # first byte; released when f is closed
+                return f
+            except OSError:
+                if not blocking:
+                    raise
+                time.sleep(0.1)
+    except OSError:
+        f.close()
+        return None
+
+
+@contextlib.contextmanager
+def index_lock(root: str = None):
+    """
+    Serializes syncs into the active index with slot switches across processes, so a sync
+    never writes to a slot that is being replaced.
+    """
+    root = root or CHROMA_DB_DIR
+    os.makedirs(root, exist_ok=True)
+    f = lock_file(os.path.join(root, INDEX_LOCK_FILE))
+    try:
+        yield
+    finally:
+        f.close()
+
+
+# Chroma Access
+def get_client(db_dir: str = None):
+    """Returns a persistent Chroma client for db_dir (default: the active index directory)."""
+    import chromadb  # imported on first use: chromadb alone takes ~1s to import
+
+    db_dir = db_dir or active_db_dir()
+    os.makedirs(db_dir, exist_ok=True)
+    return chromadb.PersistentClient(path=db_dir)
+
+
+def get_embedding_function(model_name: str = None, backend: str = None):
+    """Returns the embedding function shared by build and query (one per model and backend per process)."""
+    return _embedding_function(model_name or embed_model_name(), backend or embed_backend_name())
+
+
+@functools.lru_cache(maxsize=None)
+def _embedding_function(model_name: str, backend: str):
+    import kb_embeddings  # chromadb + sentence-transformers / onnxruntime, loaded on first use
+
+    return kb_embeddings.make_embedding_function(model_name, backend)
+
+
+def check_backend(collection, model_name: str, built_with: str):
+    """
+    Raises IndexUnavailable unless vectors stored by the `built_with` backend are close enough
+    to what the configured backend produces (e.g. torch-built index queried with onnx-int8).
+    """
+    backend = embed_backend_name()
+    if (built_with or "torch") == backend:
+        return
+    import kb_embeddings
+
+    ok, _, reason = kb_embeddings.check_compatibility(collection, get_embedding_function(model_name, backend))
+    if not ok:
+        raise IndexUnavailable(f"index built with the {built_with} backend is incompatible with {backend}: {reason}")
+    print(f" Index built with the {built_with} backend is compatible with {backend} ({reason})")
+
+
+def check_index(collection, model_name: str, version: str = None):
+    """
+    Raises IndexUnavailable if the collection was built with another model or corpus; the
+    corpus is not compared when version is None (serving a stale but usable index).
+    """
+    meta = collection.metadata or {}
+    if meta.get("embed_model") != model_name:
+        raise IndexUnavailable(f"index built with model {meta.get('embed_model')!r}, expected {model_name!r}")
+    if meta.get("schema_version") != INDEX_SCHEMA_VERSION:
+        raise IndexUnavailable(f"index schema {meta.get('schema_version')!r}, expected {INDEX_SCHEMA_VERSION!r}")
+    if version is not None and meta.get("corpus_version") != version:
+        raise IndexUnavailable(f"index corpus {meta.get('corpus_version')!r} is stale, current corpus is {version!r}")
+    if collection.count() == 0:
+        raise IndexUnavailable("index is empty")
+    check_backend(collection, model_name, meta.get("embed_backend"))
+
+
+def open_collection(client=None, model_name: str = None, docs_folder: str = DOCS_DIR, db_dir: str = None,
+                    verify: bool = True, stale_ok: bool = False):
+    """
+    Opens the persisted dell_kb collection without re-embedding anything. With stale_ok, a
+    collection behind the docs folder is accepted as long as its model and schema match.
+    """
+    db_dir = db_dir or active_db_dir()
+    client = client or get_client(db_dir)
+    model_name = model_name or embed_model_name()
+    try:
+        collection = client.get_collection(
+            name=COLLECTION_NAME,
+            embedding_function=get_embedding_function(model_name),
+        )
+    except Exception as e:
+        raise IndexUnavailable(f"collection {COLLECTION_NAME!r} not found in {db_dir}: {e}")
+    if verify:
+        version = None if stale_ok else corpus_version(docs_folder, load_manifest(os.path.join(db_dir, MANIFEST_FILE)))
+        check_index(collection, model_name, version)
+    return collection
+
+
+def stale_reason(collection, docs_folder: str = DOCS_DIR, db_dir: str = None):
+    """Why the collection is behind the docs folder, or None if it is current."""
+    db_dir = db_dir or active_db_dir()
+    version = corpus_version(docs_folder, load_manifest(os.path.join(db_dir, MANIFEST_FILE)))
+    indexed = (collection.metadata or {}).get("corpus_version")
+    if indexed != version:
+        return f"index corpus {indexed!r} is behind the documents on disk ({version!r})"
+    return None
+
+
+def reset_collection(client, model_name: str, version: str):
+    """Drops any existing dell_kb collection and creates an empty one stamped with build metadata."""
+    try:
+        client.delete_collection(name=COLLECTION_NAME)
+    except Exception:
+        pass
+    return client.create_collection(
+        name=COLLECTION_NAME,
+        embedding_function=get_embedding_function(model_name),
+        metadata=index_metadata(model_name, version),
+    )
+
+
+# Incremental Sync
+def new_sync_report() -> dict:
+    return {
+        "files_added": 0, "files_changed": 0, "files_removed": 0, "files_unchanged": 0, "files_failed": 0,
+        "chunks_added": 0, "chunks_embedded": 0, "chunks_deleted": 0, "chunks_kept": 0,
+        "duplicates_exact": 0, "duplicates_near": 0, "full_rebuild": False, "resumed": False,
+    }
+
+
+def open_or_reset_for_sync(client, manifest: dict, model_name: str):
+    """
+    Returns (collection, manifest, rebuilt); starts from scratch if the model or schema changed,
+    the embedding backend changed to an incompatible one, or the manifest is not complete
+    (the embedding cache keeps that cheap). A manifest checkpointed by an interrupted sync is
+    complete and marked "in_progress"; sync_index resumes from it.
+    """
+    if (manifest.get("embed_model") == model_name and manifest.get("schema_version") == INDEX_SCHEMA_VERSION
+            and manifest.get("complete")):
+        from chromadb.errors import NotFoundError
+
+        # Only a missing collection or an incompatible backend resets the index; anything else
+        # (a locked database, an I/O error) propagates instead of wiping it
+        try:
+            collection = client.get_collection(name=COLLECTION_NAME, embedding_function=get_embedding_function(model_name))
+            check_backend(collection, model_name, manifest.get("embed_backend"))
+            manifest["embed_backend"] = embed_backend_name()
+            return collection, manifest, False
+        except NotFoundError:
+            print(f" Collection {COLLECTION_NAME!r} not found, rebuilding the index")
+        except IndexUnavailable as e:
+            print(f" {e}, rebuilding the index")
+    return reset_collection(client, model_name, ""), new_manifest(model_name), True
+
+
+def delete_in_batches(collection, ids, batch_size: int = 256):
+    for start in range(0, len(ids), batch_size):
+        collection.delete(ids=ids[start:start + batch_size])
+
+
+def sync_changed(report: dict) -> bool:
+    """Whether a sync changed the collection at all (a no-op sync only re-checks file hashes)."""
+    return bool(report["full_rebuild"] or report.get("resumed")
+                or any(report[k] for k in ("files_added", "files_changed", "files_removed",
+                                           "chunks_added", "chunks_deleted")))
+
+
+def format_sync_report(report: dict) -> str:
+    return (
+        f" Files: +{report['files_added']} new, ~{report['files_changed']} changed, "
+        f"-{report['files_removed']} removed, {report['files_unchanged']} unchanged, {report['files_failed']} failed\n"
+        f" Chunks: {report['chunks_added']} added ({report['chunks_embedded']} embedded), {report['chunks_deleted']} deleted, {report['chunks_kept']} kept, "
+        f"{report['duplicates_exact']} exact / {report['duplicates_near']} near duplicates collapsed"
+        + (f"\n Throughput: {report['docs_per_s']} docs/s, {report['chunks_per_s']} chunks/s, "
+           f"{report['embeddings_per_s']} embeddings/s ({report['elapsed_s']}s total)" if "elapsed_s" in report else "")
+        + ("\n (full rebuild: no complete manifest for this model/schema)" if report["full_rebuild"] else "")
+        + ("\n (resumed an interrupted sync from its last checkpoint)" if report.get("resumed") else "")
+    )
@@ -0,0 +1,190 @@
+import json
+import math
+import os
+import re
+
+import kb_index
+
+
+# Configuration
+BM25_FILE = "bm25.json"
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # reciprocal rank fusion constant: score = sum(1 / (RRF_K + rank))
+LEXICAL_SCHEMA = 1  # bump when tokenization changes so persisted indexes are rebuilt
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+HEX_RE = re.compile(r"^0x0*([0-9a-f]+)$")
+PART_RE = re.compile(r"[._\-/]")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do for from has have how i if in is it its my not of on or "
+    "the this to was what when where which with you your".split()
+)
+
+
+# Tokenization
+def tokenize(text: str):
+    """
+    Lowercased terms, keeping codes intact: "0x0000007B" -> "0x7b", "CRITICAL_PROCESS_DIED"
+    and "XPS-15" stay whole and also contribute their parts.
+    """
+    terms = []
+    for token in TOKEN_RE.findall(text.lower()):
+        m = HEX_RE.match(token)
+        if m:
+            terms.append("0x" + m.group(1))
+            continue
+        if token not in STOPWORDS:
+            terms.append(token)
+        if PART_RE.search(token):
+            terms.extend(p for p in PART_RE.split(token) if p and p not in STOPWORDS)
+    return terms
+
+
+# BM25 Index
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over the collection's chunk records (term -> {chunk id: tf}).
+
+    Kept in step with Chroma by the ingest writer (add/remove per record) and persisted as
+    bm25.json next to the Chroma files, stamped with the corpus version it matches.
+    """
+
+    def __init__(self, version: str = None, k1: float = BM25_K1, b: float = BM25_B):
+        self.version = version
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {chunk id: term frequency}
+        self.lengths = {}  # chunk id -> number of terms
+        self.terms = {}  # chunk id -> its distinct terms, so removal only touches their postings
+        self.total_length = 0
+        self.idf = {}
+
+    def __len__(self):
+        return len(self.lengths)
+
+    # Updates
+    def add(self, chunk_id: str, text: str):
+        if chunk_id in self.lengths:
+            self.remove([chunk_id])
+        terms = tokenize(text)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        self.terms[chunk_id] = list(counts)
+        self.lengths[chunk_id] = len(terms)
+        self.total_length += len(terms)
+        self.idf = {}
+
+    def add_many(self, chunk_ids, texts):
+        for chunk_id, text in zip(chunk_ids, texts):
+            self.add(chunk_id, text)
+
+    def remove(self, chunk_ids):
+        for chunk_id in set(chunk_ids):
+            if chunk_id not in self.lengths:
+                continue
+            for term in self.terms.pop(chunk_id):
+                docs = self.postings[term]
+                del docs[chunk_id]
+                if not docs:
+                    del self.postings[term]
+            self.total_length -= self.lengths.pop(chunk_id)
+            self.idf = {}
+
+    # Search
+    def term_idf(self, term: str) -> float:
+        idf = self.idf.get(term)
+        if idf is None:
+            n = len(self.postings.get(term, ()))
+            idf = self.idf[term] = math.log(1 + (len(self.lengths) - n + 0.5) / (n + 0.5))
+        return idf
+
+    def search(self, query: str, k: int = 10):
+        """Top-k (chunk id, BM25 score), best first."""
+        if not self.lengths:
+            return []
+        avg_len = self.total_length / len(self.lengths) or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.term_idf(term)
+            for chunk_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avg_len)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    # Persistence
+    def save(self, path: str):
+        """Atomic write; chunk ids are stored once and postings refer to them by slot."""
+        ids = sorted(self.lengths)
+        slot = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        data = {
+            "schema": LEXICAL_SCHEMA, "version": self.version, "k1": self.k1, "b": self.b,
+            "ids": ids, "lengths": [self.lengths[c] for c in ids],
+            "postings": {term: [x for c, tf in docs.items() for x in (slot[c], tf)]
+                         for term, docs in self.postings.items()},
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """Returns the persisted index, or None if it is missing, unreadable or from another schema."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("schema") != LEXICAL_SCHEMA:
+            return None
+        index = cls(data.get("version"), data.get("k1", BM25_K1), data.get("b", BM25_B))
+        ids = data["ids"]
+        index.lengths = dict(zip(ids, data["lengths"]))
+        index.total_length = sum(index.lengths.values())
+        index.postings = {
+            term: {ids[flat[i]]: flat[i + 1] for i in range(0, len(flat), 2)}
+            for term, flat in data["postings"].items()
+        }
+        for term, docs in index.postings.items():
+            for chunk_id in docs:
+                index.terms.setdefault(chunk_id, []).append(term)
+        return index
+
+
+def build_from_collection(collection, batch_size: int = 256):
+    """Rebuilds the BM25 index from every record stored in the collection."""
+    index = LexicalIndex((collection.metadata or {}).get("corpus_version"))
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        batch = collection.get(include=["documents"], limit=batch_size, offset=offset)
+        index.add_many(batch["ids"], batch["documents"])
+    return index
+
+
+def open_lexical(collection, db_dir: str = None):
+    """The persisted BM25 index if it matches the collection's corpus version; otherwise rebuilt and saved."""
+    path = os.path.join(db_dir or kb_index.active_db_dir(), BM25_FILE)
+    version = (collection.metadata or {}).get("corpus_version")
+    index = LexicalIndex.load(path)
+    if index is None or index.version != version or len(index) != collection.count():
+        print(" BM25 index missing or stale; rebuilding from the collection...")
+        index = build_from_collection(collection)
+        index.save(path)
+    return index
+
+
+# Fusion
+def rrf_fuse(rankings, k: int = RRF_K):
+    """Reciprocal rank fusion of several ranked id lists; returns [(id, score)] best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
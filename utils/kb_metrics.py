@@ -0,0 +1,355 @@
+"""
+Lightweight tracing and metrics for the KB pipeline (stdlib only).
+
+Off unless KB_METRICS=1. When off, span() returns a shared no-op context and the
+recording helpers return immediately, so instrumented code pays one function call.
+
+    KB_METRICS=1                 enable spans, histograms and counters
+    KB_METRICS_LOG=path | -      append one JSON line per span/event (- = stderr)
+    KB_METRICS_PORT=9464         serve /metrics (Prometheus text) and /metrics.json
+    KB_METRICS_HOST=0.0.0.0      interface the endpoint binds (default 127.0.0.1)
+"""
+import atexit
+import contextvars
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+
+# Configuration
+METRICS_ENABLED = os.getenv("KB_METRICS", "0") == "1"
+METRICS_LOG = os.getenv("KB_METRICS_LOG", "")
+METRICS_PORT = int(os.getenv("KB_METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("KB_METRICS_HOST", "127.0.0.1")
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def label_value(value) -> str:
+    """A label value escaped for the Prometheus text format (backslash, double quote, newline)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float):
+        """Upper bucket bound holding the q-th observation (what Prometheus would estimate)."""
+        if not self.count:
+            return None
+        target, seen = q * self.count, 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+# Registry
+class Registry:
+    """Histograms and counters keyed by (metric name, sorted label pairs)."""
+
+    HELP = {
+        "kb_stage_seconds": "Duration of pipeline stages (spans)",
+        "kb_tokens": "Token counts per prompt/completion/context",
+        "kb_batch_size": "Items per embedding/query batch",
+        "kb_events_total": "Pipeline events (fallbacks, hedges, cache hits, errors)",
+        "kb_tokens_total": "Total tokens by kind",
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value, labels, buckets=SECONDS_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def inc(self, name, amount, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    # Export
+    def prometheus_text(self) -> str:
+        def fmt_labels(pairs, extra=()):
+            pairs = list(pairs) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{label_value(v)}"' for k, v in pairs) + "}"
+
+        lines, typed = [], set()
+        with self.lock:
+            for (name, labels), hist in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines += [f"# HELP {name} {self.HELP.get(name, name)}", f"# TYPE {name} histogram"]
+                cumulative = 0
+                for bound, n in zip(hist.buckets + ("+Inf",), hist.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {hist.sum:.6f}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {hist.count}")
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines += [f"# HELP {name} {self.HELP.get(name, name)}", f"# TYPE {name} counter"]
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view: count/sum/mean/p50/p95 per histogram series, plus counters."""
+        out = {"histograms": [], "counters": []}
+        with self.lock:
+            for (name, labels), hist in sorted(self.histograms.items()):
+                out["histograms"].append({
+                    "name": name, "labels": dict(labels), "count": hist.count, "sum": round(hist.sum, 6),
+                    "mean": round(hist.sum / hist.count, 6) if hist.count else None,
+                    "p50_le": hist.quantile(0.5), "p95_le": hist.quantile(0.95),
+                })
+            for (name, labels), value in sorted(self.counters.items()):
+                out["counters"].append({"name": name, "labels": dict(labels), "value": value})
+        return out
+
+
+registry = Registry()
+prometheus_text = registry.prometheus_text
+snapshot = registry.snapshot
+
+
+# JSON Logs
+_log_lock = threading.Lock()
+_log_file = None
+
+
+def log_json(record: dict):
+    global _log_file
+    if not METRICS_LOG:
+        return
+    line = json.dumps(record, default=str)
+    with _log_lock:
+        if METRICS_LOG == "-":
+            sys.stderr.write(line + "\n")
+            return
+        if _log_file is None:
+            _log_file = open(METRICS_LOG, "a", encoding="utf-8", buffering=1)
+        _log_file.write(line + "\n")
+
+
+# Spans
+_current = contextvars.ContextVar("kb_span", default=None)
+_ids = itertools.count(1)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Times a stage into kb_stage_seconds{stage=...} and logs it with its trace and parent ids."""
+
+    __slots__ = ("name", "attrs", "id", "trace", "parent", "t0", "token")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Adds attributes known only after the work started (token counts, outcome, ...)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _current.get()
+        self.id = next(_ids)
+        self.parent = parent.id if parent else None
+        self.trace = parent.trace if parent else self.id
+        self.token = _current.set(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.t0
+        _current.reset(self.token)
+        outcome = self.attrs.pop("outcome", "error" if exc_type else "ok")
+        labels = {"stage": self.name, "outcome": outcome}
+        if "provider" in self.attrs:
+            labels["provider"] = self.attrs["provider"]
+        registry.observe("kb_stage_seconds", elapsed, labels)
+        log_json({
+            "ts": round(time.time(), 6), "span": self.name, "duration_ms": round(elapsed * 1000, 3),
+            "trace_id": self.trace, "span_id": self.id, "parent_id": self.parent, "outcome": outcome,
+            **({"error": f"{exc_type.__name__}: {exc}"[:200]} if outcome == "error" and exc_type else {}), **self.attrs,
+        })
+        return False
+
+
+def current_span():
+    """The innermost open span in this context (None outside any span or with metrics off)."""
+    return _current.get()
+
+
+def adopt(parent):
+    """
+    Makes parent the current span of this context, so spans opened here (e.g. in a task on
+    another thread's event loop) join the caller's trace.
+    """
+    if parent is not None:
+        _current.set(parent)
+
+
+def span(name: str, **attrs):
+    """with span("vector_query", k=4): ...  (no-op when metrics are disabled)."""
+    if not METRICS_ENABLED:
+        return NOOP_SPAN
+    ensure_exporter()
+    return Span(name, attrs)
+
+
+def traced(name: str):
+    """Decorator form of span(); leaves the function untouched when metrics are disabled."""
+    def wrap(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        def inner(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        inner.__name__, inner.__doc__, inner.__wrapped__ = fn.__name__, fn.__doc__, fn
+        return inner
+    return wrap
+
+
+# Recording Helpers
+def observe(name: str, value: float, buckets=SECONDS_BUCKETS, **labels):
+    if METRICS_ENABLED:
+        registry.observe(name, value, labels, buckets)
+
+
+def tokens(kind: str, count: int, **labels):
+    """Records a token count (prompt, completion, context) as histogram and running total."""
+    if METRICS_ENABLED and count is not None:
+        registry.observe("kb_tokens", count, {"kind": kind, **labels}, TOKEN_BUCKETS)
+        registry.inc("kb_tokens_total", count, {"kind": kind, **labels})
+
+
+def event(name: str, **attrs):
+    """Counts kb_events_total{event=name} and logs the event with the current trace id."""
+    if not METRICS_ENABLED:
+        return
+    labels = {"event": name}
+    if "provider" in attrs:
+        labels["provider"] = attrs["provider"]
+    registry.inc("kb_events_total", 1, labels)
+    current = _current.get()
+    log_json({"ts": round(time.time(), 6), "event": name,
+              "trace_id": current.trace if current else None, "span_id": current.id if current else None, **attrs})
+
+
+# Export
+def metrics_handler():
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body, ctype = json.dumps(registry.snapshot()).encode(), "application/json"
+            elif self.path.startswith("/metrics"):
+                body, ctype = registry.prometheus_text().encode(), "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return MetricsHandler
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def ensure_exporter():
+    """Starts the /metrics endpoint once per process if KB_METRICS_PORT is set."""
+    global _exporter
+    if _exporter is not None or not METRICS_PORT:
+        return
+    with _exporter_lock:
+        if _exporter is not None:
+            return
+        from http.server import ThreadingHTTPServer
+
+        try:
+            _exporter = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), metrics_handler())
+        except OSError as e:  # e.g. a second Streamlit worker on the same port
+            print(f" Metrics endpoint not started on port {METRICS_PORT}: {e}")
+            _exporter = False
+            return
+        _exporter.daemon_threads = True
+        threading.Thread(target=_exporter.serve_forever, name="kb-metrics", daemon=True).start()
+
+
+def write_prometheus(path: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+def summary_lines(stage_prefix: str = ""):
+    """Human-readable per-stage count / mean / p95 bucket, for CLI shutdown output."""
+    lines = []
+    for h in snapshot()["histograms"]:
+        if h["name"] != "kb_stage_seconds" or not h["labels"]["stage"].startswith(stage_prefix):
+            continue
+        labels = ", ".join(f"{k}={v}" for k, v in h["labels"].items() if k != "stage")
+        lines.append(f" {h['labels']['stage']:<18} {h['count']:>6} calls, mean {1000 * h['mean']:.1f} ms, "
+                     f"p95 <= {1000 * h['p95_le']:g} ms ({labels})")
+    return lines
+
+
+if METRICS_ENABLED and os.getenv("KB_METRICS_PROM_FILE"):
+    atexit.register(write_prometheus, os.getenv("KB_METRICS_PROM_FILE"))
@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+
+import kb_index
+
+
+# Configuration
+DOC_COLLECTION_NAME = "dell_kb_docs"  # one centroid per source file, in the same Chroma directory
+ROUTE_DOCS = int(os.getenv("ROUTE_DOCS", "4"))  # documents whose chunks the second stage searches
+ROUTE_CATEGORY_WEIGHT = float(os.getenv("ROUTE_CATEGORY_WEIGHT", "0.3"))  # pull of the ticket category on routing
+# Ticket categories (demo2_app) described in KB vocabulary; embedded once and blended into the routing vector
+CATEGORY_HINTS = {
+    "Login Issue": "Windows sign-in, password, PIN, fingerprint reader and Windows Hello login problems",
+    "Hardware Issue": "laptop hardware: battery, power, charging, keyboard, touchpad, fingerprint reader, diagnostics",
+    "Software Bug": "Windows errors: blue screen BSOD stop codes, boot failures, drivers, updates, slow performance",
+    "Warranty": "Dell warranty, service, repair, support contact and company information",
+}
+
+
+def unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+# Document Index
+def file_records(manifest: dict, file: str):
+    """
+    Chroma record ids holding file's chunks. A chunk shared with another file (duplicate or
+    near-duplicate) is one record whose "source" metadata may name the other file, so
+    membership comes from the manifest, not from the metadata.
+    """
+    aliases = manifest.get("aliases", {})
+    return list(dict.fromkeys(aliases.get(cid, cid) for cid in manifest["files"].get(file, {}).get("chunks", {})))
+
+
+def doc_records(db_dir: str = None):
+    """{file: [record ids]} for every file in the index manifest; the second stage searches these ids."""
+    manifest = kb_index.load_manifest(os.path.join(db_dir or kb_index.active_db_dir(), kb_index.MANIFEST_FILE))
+    return {file: file_records(manifest, file) for file in manifest.get("files", {})}
+
+
+def doc_centroids(collection, manifest: dict, files, batch_size: int = 512):
+    """{file: unit-length mean of its chunk embeddings} read back from the chunk collection."""
+    centroids = {}
+    for file in files:
+        ids = file_records(manifest, file)
+        vectors = []
+        for start in range(0, len(ids), batch_size):
+            vectors.extend(collection.get(ids=ids[start:start + batch_size], include=["embeddings"])["embeddings"])
+        if len(vectors):
+            centroids[file] = unit(np.mean(unit(vectors), axis=0))
+    return centroids
+
+
+def update_doc_index(client, collection, manifest: dict, changed, removed, previous_version: str, version: str):
+    """
+    Brings the document index in line with the chunk collection after a sync: centroids of
+    changed files are recomputed and removed files dropped. A missing or out-of-step document
+    index (e.g. after a full rebuild) is rebuilt from every file in the manifest.
+    """
+    try:
+        docs = client.get_collection(name=DOC_COLLECTION_NAME, embedding_function=None)
+        in_step = (docs.metadata or {}).get("corpus_version") == previous_version
+    except Exception:
+        docs, in_step = None, False
+    if docs is None or not in_step:
+        try:
+            client.delete_collection(name=DOC_COLLECTION_NAME)
+        except Exception:
+            pass
+        docs = client.create_collection(name=DOC_COLLECTION_NAME, embedding_function=None)
+        changed, removed = list(manifest["files"]), []
+    if removed:
+        docs.delete(ids=list(removed))
+    centroids = doc_centroids(collection, manifest, [f for f in changed if f in manifest["files"]])
+    if centroids:
+        files = sorted(centroids)
+        docs.upsert(ids=files, embeddings=[centroids[f].tolist() for f in files],
+                    metadatas=[{"chunks": len(manifest["files"][f]["chunks"])} for f in files])
+    docs.modify(metadata={"corpus_version": version})
+    return docs
+
+
+def open_doc_index(collection, db_dir: str = None):
+    """The document index matching collection's corpus version, or None (missing or stale)."""
+    try:
+        docs = kb_index.get_client(db_dir).get_collection(name=DOC_COLLECTION_NAME, embedding_function=None)
+    except Exception:
+        return None
+    if (docs.metadata or {}).get("corpus_version") != (collection.metadata or {}).get("corpus_version"):
+        return None
+    return docs
+
+
+# Routing
+def routing_vectors(query_embeddings, hint_embeddings=None, weight: float = ROUTE_CATEGORY_WEIGHT):
+    """Query embeddings, each pulled towards its category hint embedding (None: no hint)."""
+    vectors = unit(query_embeddings)
+    for i, hint in enumerate(hint_embeddings or []):
+        if hint is not None:
+            vectors[i] = unit(vectors[i] + weight * unit(hint))
+    return vectors
+
+
+def route(docs, vectors, k: int = ROUTE_DOCS):
+    """Top-k source files for each routing vector (one batched query over the document index)."""
+    results = docs.query(query_embeddings=[v.tolist() for v in vectors], n_results=min(k, docs.count()),
+                         include=[])
+    return results["ids"]
@@ -0,0 +1,415 @@
+import abc
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import httpx
+
+import kb_metrics
+from kb_metrics import event, span
+
+
+# Configuration
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
+LLM_TEMPERATURE = 0.3
+
+LLM_TTFT_TIMEOUT_S = float(os.getenv("LLM_TTFT_TIMEOUT_S", "20"))  # deadline for the first token
+LLM_TOTAL_TIMEOUT_S = float(os.getenv("LLM_TOTAL_TIMEOUT_S", "90"))  # deadline for the whole answer
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_DEFAULT_S = float(os.getenv("LLM_HEDGE_DEFAULT_S", "4.0"))  # used until enough TTFT samples exist
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+
+FALLBACK_NOTICE = "\n\n[Primary model interrupted, continuing with fallback model]\n\n"
+
+
+# Circuit Breaker
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive errors; open -> half-open after `cooldown_s`,
+    where one trial request is let through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown_s: float = LLM_BREAKER_COOLDOWN_S):
+        self.max_failures = failures
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown_s:
+            return "half-open"
+        return "open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.trial_running)
+
+    def on_launch(self):
+        if self.state == "half-open":
+            self.trial_running = True
+
+    def on_cancel(self):
+        self.trial_running = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.failures >= self.max_failures or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+# Providers
+class Provider(abc.ABC):
+    name = "provider"
+
+    def __init__(self, api_key: str, base_url: str, model: str):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.breaker = CircuitBreaker()
+        self.ttft_samples = deque(maxlen=1000)  # appended on the scheduler loop, read from any thread
+        self.samples_lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.wins = 0
+
+    def record_ttft(self, seconds: float):
+        with self.samples_lock:
+            self.ttft_samples.append(seconds)
+
+    def sorted_ttft(self):
+        with self.samples_lock:
+            samples = list(self.ttft_samples)
+        return sorted(samples)
+
+    def hedge_delay(self) -> float:
+        """How long to wait for this provider's first token before hedging to the next one."""
+        samples = self.sorted_ttft()
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_S
+        return max(0.25, samples[min(len(samples) - 1, int(len(samples) * LLM_HEDGE_PERCENTILE))])
+
+    @abc.abstractmethod
+    def stream(self, client: httpx.AsyncClient, prompt: str):
+        """Async generator of answer tokens; subclasses implement it with `async def ... yield`."""
+
+    def stats(self) -> dict:
+        samples = self.sorted_ttft()
+        pct = lambda p: round(samples[min(len(samples) - 1, int(len(samples) * p))], 3) if samples else None
+        return {
+            "calls": self.calls, "failures": self.failures, "timeouts": self.timeouts, "wins": self.wins,
+            "breaker": self.breaker.state, "ttft_p50_s": pct(0.5), "ttft_p95_s": pct(0.95),
+        }
+
+
+async def sse_events(response: httpx.Response):
+    """Yields decoded JSON payloads of a server-sent-events response."""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if not data:
+            continue
+        yield "[DONE]" if data == "[DONE]" else json.loads(data)
+
+
+class IncompleteStream(Exception):
+    """The provider closed the stream without its end-of-answer marker."""
+
+
+class EmptyCompletion(Exception):
+    """The provider finished its stream without producing any answer text."""
+
+
+class GroqProvider(Provider):
+    """OpenAI-compatible chat completions with stream=true."""
+    name = "groq"
+
+    async def stream(self, client, prompt):
+        body = {
+            "model": self.model, "temperature": LLM_TEMPERATURE, "stream": True,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        async with client.stream("POST", f"{self.base_url}/chat/completions", json=body, headers=headers) as resp:
+            resp.raise_for_status()
+            async for sse in sse_events(resp):
+                if sse == "[DONE]":
+                    return
+                choices = sse.get("choices") or []
+                delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                if delta:
+                    yield delta
+        raise IncompleteStream("groq stream ended without [DONE]")
+
+
+class GeminiProvider(Provider):
+    """Gemini streamGenerateContent over SSE."""
+    name = "gemini"
+
+    async def stream(self, client, prompt):
+        body = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": LLM_TEMPERATURE},
+        }
+        url = f"{self.base_url}/models/{self.model}:streamGenerateContent"
+        headers = {"x-goog-api-key": self.api_key}
+        async with client.stream("POST", url, params={"alt": "sse"}, json=body, headers=headers) as resp:
+            resp.raise_for_status()
+            finished = False
+            async for sse in sse_events(resp):
+                if sse == "[DONE]":
+                    continue
+                for candidate in sse.get("candidates") or []:
+                    for part in (candidate.get("content") or {}).get("parts") or []:
+                        if part.get("text"):
+                            yield part["text"]
+                    finished = finished or bool(candidate.get("finishReason"))
+        if not finished:
+            raise IncompleteStream("gemini stream ended without finishReason")
+
+
+# Streams
+class LLMStream:
+    """
+    Iterates answer tokens from the scheduler. After iteration, .text holds the answer
+    of the provider that completed it (None if every provider failed), .provider its
+    name, .ttft_s its time to first token and .hedged whether a hedge request was sent.
+    """
+
+    def __init__(self, scheduler, prompt: str):
+        self.scheduler = scheduler
+        self.prompt = prompt
+        self.text = None
+        self.provider = None
+        self.ttft_s = None
+        self.hedged = False
+
+    def __iter__(self):
+        tokens = queue.Queue()
+        future = self.scheduler.submit(self.scheduler.run(self.prompt, tokens.put_nowait, self))
+        try:
+            while True:
+                token = tokens.get()
+                if token is None:
+                    break
+                yield token
+            future.result()
+        finally:
+            future.cancel()
+
+
+# Scheduler
+class LLMScheduler:
+    """
+    Runs provider calls on one background asyncio loop with a shared httpx connection pool.
+
+    The first provider whose circuit is closed is called with a first-token deadline. If it
+    has not produced a token after its hedge delay (LLM_HEDGE_PERCENTILE of its observed
+    TTFT), the next provider is started as well; whichever streams first wins and the other
+    is cancelled. Errors, empty answers, deadline misses and mid-stream failures fall back to
+    the next provider, and every failure counts towards that provider's circuit breaker.
+    """
+
+    def __init__(self, providers):
+        self.providers = list(providers)
+        self.loop = None
+        self.client = None
+        self.hedges = 0
+        self.started = threading.Lock()
+
+    @classmethod
+    def from_keys(cls, groq_key: str = None, gemini_key: str = None):
+        providers = []
+        if groq_key:
+            providers.append(GroqProvider(groq_key, GROQ_BASE_URL, GROQ_MODEL))
+        if gemini_key:
+            providers.append(GeminiProvider(gemini_key, GEMINI_BASE_URL, GEMINI_MODEL))
+        return cls(providers)
+
+    # Event loop
+    def ensure_loop(self):
+        with self.started:
+            if self.loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-scheduler", daemon=True).start()
+            self.client = asyncio.run_coroutine_threadsafe(self.make_client(), loop).result()
+            self.loop = loop
+
+    async def make_client(self):
+        limits = httpx.Limits(max_connections=64, max_keepalive_connections=16)
+        timeout = httpx.Timeout(LLM_TOTAL_TIMEOUT_S, connect=5.0)
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    def submit(self, coro):
+        """Runs coro on the scheduler's loop; its spans join the caller's trace."""
+        self.ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self.in_trace(kb_metrics.current_span(), coro), self.loop)
+
+    @staticmethod
+    async def in_trace(parent, coro):
+        kb_metrics.adopt(parent)  # the task runs in its own copy of the loop thread's context
+        return await coro
+
+    # Public API
+    def stream(self, prompt: str) -> LLMStream:
+        return LLMStream(self, prompt)
+
+    def complete(self, prompt: str) -> LLMStream:
+        """Blocking call; returns the drained stream (.text is None if no provider answered)."""
+        stream = self.stream(prompt)
+        for _ in stream:
+            pass
+        return stream
+
+    async def acomplete(self, prompt: str) -> LLMStream:
+        """Awaitable from any event loop; runs on the scheduler's loop and shared pool."""
+        result = LLMStream(self, prompt)
+        await asyncio.wrap_future(self.submit(self.run(prompt, lambda token: None, result)))
+        return result
+
+    def stats(self) -> dict:
+        return {"hedges": self.hedges, **{p.name: p.stats() for p in self.providers}}
+
+    # Scheduling
+    async def attempt(self, provider, prompt, events):
+        """Streams one provider into the shared event queue, enforcing its deadlines."""
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        tokens = provider.stream(self.client, prompt).__aiter__()
+        first, empty = True, True
+        with span("llm_call", provider=provider.name) as s:
+            try:
+                while True:
+                    budget = LLM_TTFT_TIMEOUT_S if first else LLM_TOTAL_TIMEOUT_S - (loop.time() - t0)
+                    if budget <= 0:
+                        raise asyncio.TimeoutError()
+                    try:
+                        token = await asyncio.wait_for(tokens.__anext__(), budget)
+                    except StopAsyncIteration:
+                        break
+                    if first:
+                        provider.record_ttft(loop.time() - t0)
+                        s.set(ttft_s=round(loop.time() - t0, 4))
+                        first = False
+                    empty = empty and not token.strip()
+                    events.put_nowait(("token", provider, token, loop.time() - t0))
+                if empty:
+                    raise EmptyCompletion(f"{provider.name} returned an empty answer")
+                events.put_nowait(("done", provider, None, None))
+            except asyncio.CancelledError:
+                s.set(outcome="cancelled")
+                raise
+            except Exception as e:
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                if timed_out:
+                    provider.timeouts += 1
+                s.set(outcome="timeout" if timed_out else "failed", error=f"{type(e).__name__}: {e}"[:200])
+                events.put_nowait(("error", provider, e, None))
+            finally:
+                try:
+                    await tokens.aclose()
+                except Exception:
+                    pass
+
+    async def run(self, prompt, emit, result):
+        try:
+            await self.schedule(prompt, emit, result)
+        finally:
+            emit(None)
+
+    async def schedule(self, prompt, emit, result):
+        loop = asyncio.get_running_loop()
+        allowed = [p for p in self.providers if p.breaker.available()]
+        remaining = allowed or list(self.providers)  # every circuit open: try anyway rather than fail outright
+        events = asyncio.Queue()
+        running = {}
+        winner, parts, hedge_at = None, [], None
+
+        def launch():
+            provider = remaining.pop(0)
+            provider.calls += 1
+            provider.breaker.on_launch()
+            running[provider] = asyncio.ensure_future(self.attempt(provider, prompt, events))
+            return provider
+
+        if remaining:
+            primary = launch()
+            hedge_at = loop.time() + primary.hedge_delay() if remaining else None
+
+        try:
+            while running:
+                timeout = None
+                if winner is None and hedge_at is not None and remaining:
+                    timeout = max(0.0, hedge_at - loop.time())
+                try:
+                    kind, provider, payload, elapsed = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    # Primary is slower than its usual TTFT: hedge with the next provider
+                    self.hedges += 1
+                    result.hedged = True
+                    hedge = launch()
+                    event("llm_hedge", provider=hedge.name)
+                    hedge_at = None
+                    continue
+                if provider not in running:
+                    continue  # late event from a cancelled loser
+
+                if kind == "token":
+                    if winner is None:
+                        winner = provider
+                        result.ttft_s = elapsed
+                        for other in [p for p in running if p is not provider]:
+                            running.pop(other).cancel()
+                            other.breaker.on_cancel()
+                            remaining.insert(0, other)  # cancelled, not failed: still usable for fallback
+                    parts.append(payload)
+                    emit(payload)
+                    continue
+
+                running.pop(provider)
+                if kind == "done":
+                    provider.breaker.record_success()
+                    provider.wins += 1
+                    result.text = "".join(parts).strip()
+                    result.provider = provider.name
+                    return
+
+                provider.failures += 1
+                provider.breaker.record_failure()
+                reason = (str(payload).splitlines() or [""])[0]
+                print(f" {provider.name.capitalize()} failed: {type(payload).__name__}: {reason}")
+                if provider.breaker.state == "open":
+                    event("llm_breaker_open", provider=provider.name)
+                if winner is provider:
+                    event("llm_fallback", provider=provider.name, mid_stream=True)
+                    emit(FALLBACK_NOTICE)
+                    winner, parts, result.ttft_s = None, [], None
+                if not running and remaining:
+                    nxt = launch()
+                    event("llm_fallback", provider=nxt.name, mid_stream=False)
+                    hedge_at = loop.time() + nxt.hedge_delay() if remaining else None
+        finally:
+            for provider, task in running.items():
+                task.cancel()
+                provider.breaker.on_cancel()
@@ -0,0 +1,174 @@
+"""
+Background rebuild of the KB index (the Content Manager's "Rebuild Embeddings").
+
+start_rebuild() launches this file as a separate process. It builds a complete index into a
+fresh slot (chroma_dell_db/slots/<slot>/) while queries keep using the active one, checks it,
+and then switches to it with kb_index.activate_slot() (blue/green). Progress is written to
+rebuild_status.json. Only one rebuild runs at a time (a lock on rebuild.lock), and a failed
+rebuild deletes its slot and leaves the active index untouched.
+
+    python utils/reindex_job.py          # same rebuild in the foreground
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import kb_index
+
+
+# Configuration
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+REBUILD_STATUS_FILE = "rebuild_status.json"
+REBUILD_LOCK_FILE = "rebuild.lock"
+REBUILD_LOG_FILE = "rebuild.log"
+REBUILD_KEEP_SLOTS = max(2, int(os.getenv("REBUILD_KEEP_SLOTS", "3")))  # the live slot and the newest older ones
+STATUS_INTERVAL_S = 0.5
+
+
+# Status
+def root_path(name: str, root: str = None) -> str:
+    return os.path.join(root or kb_index.CHROMA_DB_DIR, name)
+
+
+def write_status(root: str, status: dict):
+    path = root_path(REBUILD_STATUS_FILE, root)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(status, f)
+    os.replace(tmp, path)
+
+
+def acquire_lock(root: str = None):
+    """Returns the open lock file while holding the rebuild lock, or None if a rebuild holds it."""
+    os.makedirs(root or kb_index.CHROMA_DB_DIR, exist_ok=True)
+    return kb_index.lock_file(root_path(REBUILD_LOCK_FILE, root), blocking=False)
+
+
+def is_running(root: str = None) -> bool:
+    lock = acquire_lock(root)
+    if lock is None:
+        return True
+    lock.close()
+    return False
+
+
+def read_status(root: str = None) -> dict:
+    """
+    Last rebuild's status: {"state": idle|running|done|failed, ...progress fields}.
+    A "running" status without a live rebuild process is reported as failed.
+    """
+    try:
+        with open(root_path(REBUILD_STATUS_FILE, root), "r", encoding="utf-8") as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return {"state": "idle"}
+    if status.get("state") == "running" and not is_running(root):
+        status.update(state="failed", error="rebuild process exited unexpectedly")
+    return status
+
+
+# Launch
+def start_rebuild(root: str = None, docs_folder: str = None) -> bool:
+    """Starts a rebuild process in the background; False if one is already running."""
+    root = root or kb_index.CHROMA_DB_DIR
+    if is_running(root):
+        return False
+    os.makedirs(root, exist_ok=True)
+    with open(root_path(REBUILD_LOG_FILE, root), "ab") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--root", root, "--docs", docs_folder or kb_index.DOCS_DIR],
+            cwd=UTILS_DIR, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+            start_new_session=True,  # survives Streamlit reruns and restarts
+        )
+    return True
+
+
+# Rebuild (runs in the job process)
+def remove_old_slots(root: str, active: str, keep: int = REBUILD_KEEP_SLOTS):
+    """
+    Deletes all but the newest `keep` slots (names start with their build time); the active
+    slot always stays. A CLI or batch process opened on a slot keeps working through the
+    next keep - 1 rebuilds.
+    """
+    slots = root_path(kb_index.SLOTS_DIR, root)
+    if not os.path.isdir(slots):
+        return
+    names = sorted(os.listdir(slots))
+    for slot in [name for name in names if name != active][:max(0, len(names) - keep)]:
+        shutil.rmtree(os.path.join(slots, slot), ignore_errors=True)
+
+
+def run_rebuild(root: str, docs_folder: str, model_name: str = None) -> bool:
+    import ingest_pipeline
+    import kb_flat
+    from kb_chunking import chunk_file
+
+    lock = acquire_lock(root)
+    if lock is None:
+        print(" A rebuild is already running")
+        return False
+
+    previous = kb_index.active_slot(root)
+    slot = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    target = kb_index.slot_dir(slot, root)
+    status = {"state": "running", "pid": os.getpid(), "slot": slot, "previous": previous,
+              "started": time.time(), "files_done": 0, "files_total": 0, "chunks": 0, "embedded": 0,
+              "embeddings_per_s": 0.0}
+    write_status(root, status)
+    last_write = [0.0]
+
+    def progress(p):
+        status.update(p, elapsed_s=round(time.time() - status["started"], 1))
+        if time.monotonic() - last_write[0] >= STATUS_INTERVAL_S:
+            write_status(root, status)
+            last_write[0] = time.monotonic()
+
+    try:
+        model_name = model_name or kb_index.embed_model_name()
+        shutil.rmtree(target, ignore_errors=True)
+        collection, report = ingest_pipeline.sync_index(
+            chunk_file, docs_folder=docs_folder, db_dir=target, model_name=model_name, progress=progress,
+        )
+        print(kb_index.format_sync_report(report))
+        # Uploads indexed into the active slot during the build are on disk by now. Catch up under
+        # the index lock, so no upload lands in the old slot between this sync and the switch.
+        with kb_index.index_lock(root):
+            collection, catch_up = ingest_pipeline.sync_index(
+                chunk_file, docs_folder=docs_folder, db_dir=target, model_name=model_name,
+            )
+            status["caught_up"] = catch_up["files_added"] + catch_up["files_changed"] + catch_up["files_removed"]
+            # The new slot must pass the same checks a query process applies before it goes live
+            kb_index.open_collection(model_name=model_name, docs_folder=docs_folder, db_dir=target)
+            kb_flat.export_flat(collection, target)
+            kb_index.activate_slot(slot, root)
+        # Older slots stay for a while: processes still finishing a query on them are not disturbed
+        remove_old_slots(root, slot)
+        status.update(state="done", finished=time.time(), chunks_total=collection.count(),
+                      report={k: v for k, v in report.items() if isinstance(v, (int, float, bool))})
+        print(f" Switched to slot {slot} ({collection.count()} chunks)")
+        return True
+    except Exception as e:
+        status.update(state="failed", finished=time.time(), error=f"{type(e).__name__}: {e}")
+        print(f" Rebuild failed, active index unchanged: {status['error']}")
+        shutil.rmtree(target, ignore_errors=True)
+        return False
+    finally:
+        status["elapsed_s"] = round(time.time() - status["started"], 1)
+        write_status(root, status)
+        lock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the KB index into a new slot and switch to it")
+    parser.add_argument("--root", default=kb_index.CHROMA_DB_DIR)
+    parser.add_argument("--docs", default=kb_index.DOCS_DIR)
+    args = parser.parse_args()
+
+    from dell_knowledge_query_groq import load_env
+
+    load_env()
+    sys.exit(0 if run_rebuild(args.root, args.docs) else 1)
@@ -1,26 +1,15 @@
-from dotenv import load_dotenv
-from pathlib import Path
+import argparse
 import os
-from docx import Document as DocxDocument
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain_core.documents import Document
-import re
+import kb_index
+import ingest_pipeline
+import kb_flat
+from kb_chunking import chunk_file
 
-# --- Load environment variables from project root ---
-env_path = Path(__file__).resolve().parent.parent / ".env"
-print(" Loading .env from:", env_path)
-load_dotenv(dotenv_path=env_path)
 
-
-#print(" EMBED_MODEL from .env:", os.getenv("EMBED_MODEL"))
-
-
-# Configuration
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-DOCS_DIR = os.path.join(BASE_DIR, "docs", "dell-data")
-CHROMA_DB_DIR = os.path.join(BASE_DIR, "chroma_dell_db")
-EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")  # From .env or default
+# Configuration (the embedding model and backend are read from .env when the sync runs)
+BASE_DIR = kb_index.BASE_DIR
+DOCS_DIR = kb_index.DOCS_DIR
+CHROMA_DB_DIR = kb_index.CHROMA_DB_DIR
 
 
 # Folder setup
@@ -31,67 +20,56 @@ def ensure_directories():
     print(f" Verified folders: {DOCS_DIR} and {CHROMA_DB_DIR}")
 
 
-# Document Reading
-def read_docx(filepath: str) -> str:
-    """Extracts and returns text content from a .docx file."""
-    doc = DocxDocument(filepath)
-    text_blocks = [p.text.strip() for p in doc.paragraphs if p.text.strip()]
-    return "\n".join(text_blocks)
-
-
-# Semantic Chunking
-def semantic_chunk_text(text):
-    text = re.sub(r'\n{3,}', '\n\n', text.strip())
-    chunks = re.split(r'\n\s*\n', text)
-    chunks = [c.strip() for c in chunks if len(c.strip()) > 0]
-    return chunks
-
-
-# Document Preparation
-def process_all_docs(docs_folder: str):
-    """Parses all .docx files, splits into semantic chunks, returns LangChain Document objects."""
-    documents = []
-    for file in sorted(os.listdir(docs_folder)):
-        if file.lower().endswith(".docx"):
-            filepath = os.path.join(docs_folder, file)
-            print(f" Processing file: {file}")
-
-            text = read_docx(filepath)
-            if not text:
-                print(f" Skipped empty file: {file}")
-                continue
-
-            chunks = semantic_chunk_text(text)
-            for idx, chunk in enumerate(chunks):
-                metadata = {"source": file, "chunk": idx}
-                documents.append(Document(page_content=chunk, metadata=metadata))
-
-            print(f" {len(chunks)} semantic chunks created for {file}")
-    print(f"\n Total Chunks Ready: {len(documents)}")
-    return documents
-
-
 # Embedding + ChromaDB Storage
-def create_and_store_embeddings(documents):
-    """Generates embeddings using Hugging Face and stores them in ChromaDB."""
-    print("\n Creating embeddings using Hugging Face model...")
-    embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
-
-    vectordb = Chroma.from_documents(
-        documents=documents,
-        embedding=embeddings,
-        persist_directory=CHROMA_DB_DIR
-    )
-
-    print(f" Embeddings stored in: {CHROMA_DB_DIR}")
+def update_embeddings(docs_folder: str = DOCS_DIR, export_flat: bool = False):
+    """
+    Embeds only new or changed chunks (through the shared embedding cache) and removes chunks of
+    edited or deleted files. An existing flat export is refreshed when the sync changed the
+    collection or the export is behind it; export_flat also creates one.
+    """
+    model_name, backend = kb_index.embed_model_name(), kb_index.embed_backend_name()
+    print(f"\n Updating embeddings using {model_name} ({backend} backend)...")
+    embeddings = kb_index.get_embedding_function(model_name, backend)
+
+    with kb_index.index_lock():  # a background rebuild does not switch slots under this sync
+        vectordb, report = ingest_pipeline.sync_index(
+            chunk_file,
+            embed_documents=embeddings,
+            docs_folder=docs_folder,
+            db_dir=kb_index.active_db_dir(),
+            model_name=model_name,
+        )
+
+        print(kb_index.format_sync_report(report))
+        print(f" Embeddings stored in: {kb_index.active_db_dir()} (collection '{kb_index.COLLECTION_NAME}', {vectordb.count()} chunks)")
+        export_flat_index(vectordb, report, create=export_flat)
+    return report
+
+
+# Flat Export
+def export_flat_index(vectordb, report: dict, create: bool = False):
+    """Refreshes the exact-search export (float16 vectors + records table) next to the Chroma files."""
+    db_dir = kb_index.active_db_dir()
+    header = kb_flat.refresh_export(vectordb, report, db_dir, create=create)
+    if header is None:
+        return
+    size_mb = os.path.getsize(os.path.join(db_dir, kb_flat.FLAT_VECTORS_FILE)) / 1e6
+    print(f" Flat index exported: {header['count']} x {header['dim']} float16 ({size_mb:.1f} MB) in {db_dir}")
 
 
 # Main Entry Point
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync docs/dell-data into the persisted index")
+    parser.add_argument("--export-flat", action="store_true",
+                        help="write the exact-search export even if none exists or it is current")
+    args = parser.parse_args()
+
+    from dell_knowledge_query_groq import load_env
+
+    load_env()
     ensure_directories()
-    docs = process_all_docs(DOCS_DIR)
-    if docs:
-        create_and_store_embeddings(docs)
-        print("\n Embedding creation completed successfully for Dell Knowledge Base!")
+    if kb_index.list_docx_files(DOCS_DIR):
+        update_embeddings(DOCS_DIR, export_flat=args.export_flat)
+        print("\n Embedding update completed successfully for Dell Knowledge Base!")
     else:
         print(" No .docx files found in the docs/dell-data folder. Add files and re-run.")
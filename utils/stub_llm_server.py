@@ -0,0 +1,164 @@
+"""
+Local stand-in for the Groq (OpenAI-compatible) and Gemini streaming APIs.
+
+Simulates time-to-first-token, per-token delay, failures, mid-stream disconnects and hangs
+so the provider layer can be exercised without API keys:
+
+    python utils/stub_llm_server.py --port 8765 --ttft 0.4 --token-delay 0.02
+    GROQ_BASE_URL=http://127.0.0.1:8765/openai/v1 GEMINI_BASE_URL=http://127.0.0.1:8765/v1beta \
+    GROQ_API_KEY=stub GEMINI_API_KEY=stub python utils/dell_knowledge_query_groq.py
+
+Behaviour can differ per provider: --groq-ttft 5 makes only the Groq endpoint slow.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = (
+    "Based on the Dell documentation: restart the laptop, update the BIOS and drivers from "
+    "Dell Support, and run the built-in ePSA diagnostics if the issue persists."
+)
+
+
+class StubConfig:
+    def __init__(self, ttft=0.3, token_delay=0.02, fail_rate=0.0, drop_rate=0.0, hang_rate=0.0,
+                 answer=DEFAULT_ANSWER, overrides=None):
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.fail_rate = fail_rate  # HTTP 503 before any token
+        self.drop_rate = drop_rate  # connection dropped halfway through the stream
+        self.hang_rate = hang_rate  # never answers (exercises deadlines)
+        self.answer = answer
+        self.overrides = overrides or {}  # provider -> {field: value}
+        self.requests = {"groq": 0, "gemini": 0}
+
+    def get(self, provider, field):
+        return self.overrides.get(provider, {}).get(field, getattr(self, field))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        try:
+            self.handle_post()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client cancelled (e.g. a hedged request that lost the race)
+
+    def handle_post(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.startswith("/openai/v1/chat/completions"):
+            provider, stream = "groq", bool(body.get("stream"))
+        elif ":streamGenerateContent" in self.path:
+            provider, stream = "gemini", True
+        elif ":generateContent" in self.path:
+            provider, stream = "gemini", False
+        else:
+            self.send_error(404)
+            return
+
+        cfg = self.config
+        cfg.requests[provider] += 1
+        roll = random.random()
+        if roll < cfg.get(provider, "hang_rate"):
+            time.sleep(3600)
+            return
+        if roll < cfg.get(provider, "hang_rate") + cfg.get(provider, "fail_rate"):
+            self.send_error(503, "stub overloaded")
+            return
+
+        time.sleep(cfg.get(provider, "ttft"))
+        tokens = [w + " " for w in cfg.get(provider, "answer").split()]
+        if not stream:
+            self.send_json(provider, "".join(tokens).strip())
+            return
+
+        drop_at = len(tokens) // 2 if random.random() < cfg.get(provider, "drop_rate") else None
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            if i == drop_at:
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            last = i == len(tokens) - 1
+            self.wfile.write(f"data: {json.dumps(self.event(provider, token, last))}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(cfg.get(provider, "token_delay"))
+        if provider == "groq":
+            self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    @staticmethod
+    def event(provider, text, last=True):
+        if provider == "groq":
+            return {"choices": [{"index": 0, "delta": {"content": text}}]}
+        candidate = {"content": {"role": "model", "parts": [{"text": text}]}}
+        if last:
+            candidate["finishReason"] = "STOP"
+        return {"candidates": [candidate]}
+
+    def send_json(self, provider, text):
+        if provider == "groq":
+            payload = {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}
+        else:
+            payload = self.event(provider, text)
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub_server(port: int = 0, config: StubConfig = None):
+    """Starts the stub in a daemon thread; returns (server, groq_base_url, gemini_base_url)."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config or StubConfig()})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}/openai/v1", f"http://{host}:{port}/v1beta"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stub Groq/Gemini streaming server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    for provider in ("groq", "gemini"):
+        parser.add_argument(f"--{provider}-ttft", type=float)
+        parser.add_argument(f"--{provider}-fail-rate", type=float)
+        parser.add_argument(f"--{provider}-hang-rate", type=float)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    overrides = {}
+    for provider in ("groq", "gemini"):
+        for field in ("ttft", "fail_rate", "hang_rate"):
+            value = getattr(args, f"{provider}_{field}")
+            if value is not None:
+                overrides.setdefault(provider, {})[field] = value
+    config = StubConfig(args.ttft, args.token_delay, args.fail_rate, args.drop_rate, args.hang_rate, overrides=overrides)
+    server, groq_url, gemini_url = start_stub_server(args.port, config)
+    print(f" Stub LLM server listening\n  GROQ_BASE_URL={groq_url}\n  GEMINI_BASE_URL={gemini_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
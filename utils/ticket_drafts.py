@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+import kb_index
+from kb_metrics import event, span
+from ticket_store import SUPPORT_DB, get_database
+
+
+# Configuration
+DRAFT_WORKERS = int(os.getenv("DRAFT_WORKERS", "2"))  # drafts generated at once, i.e. concurrent LLM calls
+DRAFT_QUEUE_SIZE = int(os.getenv("DRAFT_QUEUE_SIZE", "32"))  # in-memory backlog; the rest waits in SQLite
+DRAFT_POLL_S = 5.0  # idle workers look for pending drafts this often
+DRAFT_STALE_S = 600.0  # a "running" draft older than this was orphaned by a crashed process
+
+
+def draft_query(category: str, message: str) -> str:
+    """Retrieval query for a ticket: the message, prefixed by its category."""
+    return f"{category}: {message}" if category and category != "Other" else message
+
+
+def dedup_key(query: str) -> str:
+    """Same key for messages that differ only in case, punctuation or spacing."""
+    normalized = re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", query.lower())).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def hit_sources(hits):
+    """[(where, chunk id)] for the retrieved chunks; stored with RAG replies and drafts."""
+    sources = []
+    for chunk_id, meta in zip(hits["ids"], hits["metadatas"]):
+        meta = meta or {}
+        where = meta.get("sources") or meta.get("source", "unknown")
+        if meta.get("section"):
+            where += f" › {meta['section']}"
+        sources.append((where, chunk_id))
+    return sources
+
+
+# Draft Store
+DRAFT_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS drafts (ticket_id TEXT PRIMARY KEY, dedup_key TEXT NOT NULL, "
+    "query TEXT NOT NULL, state TEXT NOT NULL, draft TEXT, sources TEXT, error TEXT, created REAL NOT NULL, "
+    "started REAL, finished REAL, category TEXT)",
+    "CREATE INDEX IF NOT EXISTS drafts_state ON drafts (state, created)",
+    "CREATE INDEX IF NOT EXISTS drafts_key ON drafts (dedup_key, state)",
+)
+DRAFT_MIGRATIONS = (
+    ("drafts", "category", "ALTER TABLE drafts ADD COLUMN category TEXT", None),
+)
+
+
+class DraftStore:
+    """
+    RAG draft replies per ticket, next to the tickets: {ticket_id, state, draft, sources, ...}.
+
+    state is pending -> running -> ready | failed. Tickets whose message normalizes to the
+    same text share a dedup_key: one generation fills every pending ticket with that key,
+    and a new ticket reuses an existing ready draft without calling the LLM.
+    """
+
+    def __init__(self, db_path: str = SUPPORT_DB):
+        self.db = get_database(db_path)
+        self.db.ensure_schema("drafts", DRAFT_SCHEMA, DRAFT_MIGRATIONS)
+
+    @staticmethod
+    def to_dict(row) -> dict:
+        record = dict(row)
+        record["sources"] = json.loads(record["sources"]) if record["sources"] else []
+        return record
+
+    def add(self, ticket_id: str, category: str, message: str) -> dict:
+        """Records a pending draft for the ticket, or a ready one copied from an identical earlier message."""
+        query = draft_query(category, message)
+        key = dedup_key(query)
+        now = time.time()
+        conn = self.db.connect()
+        with self.db.transaction(conn):
+            done = conn.execute("SELECT draft, sources FROM drafts WHERE dedup_key = ? AND state = 'ready' LIMIT 1",
+                                (key,)).fetchone()
+            if done:
+                conn.execute("INSERT OR REPLACE INTO drafts (ticket_id, dedup_key, query, category, state, draft, "
+                             "sources, created, finished) VALUES (?, ?, ?, ?, 'ready', ?, ?, ?, ?)",
+                             (ticket_id, key, query, category, done["draft"], done["sources"], now, now))
+            else:
+                conn.execute("INSERT OR REPLACE INTO drafts (ticket_id, dedup_key, query, category, state, created) "
+                             "VALUES (?, ?, ?, ?, 'pending', ?)", (ticket_id, key, query, category, now))
+        return self.get(ticket_id)
+
+    def start(self, key: str) -> bool:
+        """Claims the pending drafts with this key; False if another worker or process already has them."""
+        conn = self.db.connect()
+        with self.db.transaction(conn):
+            cur = conn.execute("UPDATE drafts SET state = 'running', started = ? WHERE dedup_key = ? AND state = 'pending'",
+                               (time.time(), key))
+        return cur.rowcount > 0
+
+    def finish(self, key: str, draft: str = None, sources=None, error: str = None) -> int:
+        """
+        Stores the result for every ticket with this key still waiting for it, including ones
+        submitted while it was generated; returns how many tickets got it.
+        """
+        conn = self.db.connect()
+        with self.db.transaction(conn):
+            cur = conn.execute(
+                "UPDATE drafts SET state = ?, draft = ?, sources = ?, error = ?, finished = ? "
+                "WHERE dedup_key = ? AND state IN ('pending', 'running')",
+                ("failed" if error else "ready", draft, json.dumps(sources) if sources else None, error,
+                 time.time(), key),
+            )
+        return cur.rowcount
+
+    def requeue_stale(self, older_than_s: float = DRAFT_STALE_S) -> int:
+        conn = self.db.connect()
+        with self.db.transaction(conn):
+            cur = conn.execute("UPDATE drafts SET state = 'pending' WHERE state = 'running' AND started < ?",
+                               (time.time() - older_than_s,))
+        return cur.rowcount
+
+    def pending(self, limit: int):
+        """[(dedup_key, query, category)] of pending drafts, oldest first, one per key."""
+        rows = self.db.connect().execute(
+            "SELECT dedup_key, query, category, MIN(created) AS first FROM drafts WHERE state = 'pending' "
+            "GROUP BY dedup_key ORDER BY first LIMIT ?", (limit,)
+        ).fetchall()
+        return [(row["dedup_key"], row["query"], row["category"]) for row in rows]
+
+    def get(self, ticket_id: str):
+        row = self.db.connect().execute("SELECT * FROM drafts WHERE ticket_id = ?", (ticket_id,)).fetchone()
+        return self.to_dict(row) if row else None
+
+
+# Draft Workers
+class DraftWorker:
+    """
+    Generates ticket drafts in the background with DRAFT_WORKERS threads.
+
+    submit() records the draft and offers its key to a bounded queue without blocking. When
+    the queue is full (a burst of tickets), the draft simply stays pending in SQLite and an
+    idle worker picks it up later, so the number of LLM calls in flight never exceeds
+    DRAFT_WORKERS. Pending drafts left by a restart are picked up the same way.
+    """
+
+    def __init__(self, kb, store: DraftStore = None, workers: int = DRAFT_WORKERS,
+                 queue_size: int = DRAFT_QUEUE_SIZE):
+        self.kb = kb  # dell_knowledge_query_groq
+        self.store = store or DraftStore()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.queued = {}  # dedup_key -> (query, category), for keys in self.queue
+        self.lock = threading.Lock()
+        self.collections = {}
+        self.store.requeue_stale()
+        for i in range(workers):
+            threading.Thread(target=self.run, name=f"ticket-draft-{i}", daemon=True).start()
+
+    def submit(self, ticket: dict) -> dict:
+        record = self.store.add(ticket["id"], ticket["category"], ticket["message"])
+        if record["state"] == "pending" and not self.offer(record["dedup_key"], record["query"], record["category"]):
+            event("draft_backpressure", ticket=ticket["id"])
+        return record
+
+    def offer(self, key: str, query: str, category: str = None) -> bool:
+        """Queues key unless it is already queued; False if the queue is full."""
+        with self.lock:
+            if key in self.queued:
+                return True
+            try:
+                self.queue.put_nowait(key)
+            except queue.Full:
+                return False
+            self.queued[key] = (query, category)
+            return True
+
+    def refill(self):
+        for key, query, category in self.store.pending(self.queue.maxsize):
+            if not self.offer(key, query, category):
+                break
+
+    def run(self):
+        while True:
+            try:
+                key = self.queue.get(timeout=DRAFT_POLL_S)
+            except queue.Empty:
+                self.refill()
+                continue
+            with self.lock:
+                query, category = self.queued.pop(key)
+            if not self.store.start(key):
+                continue
+            try:
+                draft, sources = self.generate(query, category)
+                self.store.finish(key, draft, sources)
+            except Exception as e:
+                print(f" Draft for {query[:60]!r} failed: {type(e).__name__}: {e}")
+                self.store.finish(key, error=f"{type(e).__name__}: {e}")
+            if self.queue.empty():
+                self.refill()
+
+    def collection(self):
+        db_dir = self.kb.backend.index_dir()
+        with self.lock:
+            collection = self.collections.get(db_dir)
+        if collection is None:
+            collection = kb_index.open_collection(model_name=self.kb.backend.model_name, db_dir=db_dir, verify=False)
+            with self.lock:
+                collection = self.collections.setdefault(db_dir, collection)
+        return collection
+
+    def forget_collections(self):
+        """Drops opened collections, e.g. after a sync changed the corpus version; reopened on next use."""
+        with self.lock:
+            self.collections.clear()
+
+    def generate(self, query: str, category: str = None):
+        """(draft answer, [(where, chunk id)]) for the query; an empty draft if nothing matched."""
+        with span("ticket_draft"):
+            hits = self.kb.retrieve(self.collection(), query, category=category)
+            if not hits["documents"]:
+                return "", []
+            self.kb.generate_answer(query, hits)
+        if hits["answer"] == self.kb.NO_LLM_RESPONSE:
+            raise RuntimeError("no LLM available")
+        return hits["answer"], hit_sources(hits)
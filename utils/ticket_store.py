@@ -0,0 +1,340 @@
+import contextlib
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import kb_index
+
+
+# Configuration
+SUPPORT_DB = os.getenv("SUPPORT_DB", os.path.join(kb_index.BASE_DIR, "support.db"))
+SQLITE_BUSY_TIMEOUT_MS = 5000
+TICKET_PREFIX = "TCK-"
+TICKET_STATUSES = ("Open", "In Progress", "Waiting for User", "Resolved")
+UNASSIGNED = "Not Assigned"
+TICKET_FIELDS = ("id", "email", "message", "category", "priority", "status", "agent", "created_at", "due")
+PRIORITY_RANKS = {"High": 3, "Medium": 2, "Low": 1}
+QUEUE_STATUSES = ("Open", "In Progress")
+# Hours until a ticket of each priority breaches its SLA, e.g. "High=4,Medium=24,Low=72"
+TICKET_SLA_HOURS = {
+    name.strip(): float(hours)
+    for name, hours in (pair.split("=") for pair in os.getenv("TICKET_SLA_HOURS", "High=4,Medium=24,Low=72").split(","))
+}
+DEFAULT_SLA_HOURS = max(TICKET_SLA_HOURS.values())
+
+
+# Connections
+class Database:
+    """
+    One SQLite file shared by every Streamlit session and process.
+
+    WAL mode lets readers run alongside the single writer; each thread gets its own
+    connection (Streamlit runs every session's script in its own thread).
+    """
+
+    def __init__(self, path: str = SUPPORT_DB):
+        self.path = path
+        self.local = threading.local()
+        self.schema_lock = threading.Lock()
+        self.schemas = set()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            self.local.conn = conn
+        return conn
+
+    def ensure_schema(self, name: str, statements, migrations=()):
+        """
+        Runs a store's CREATE TABLE/INDEX statements once per process. migrations are
+        (table, column, ALTER statement, backfill UPDATE or None) for columns added later.
+        """
+        if name in self.schemas:
+            return
+        with self.schema_lock:
+            if name not in self.schemas:
+                conn = self.connect()
+                with self.transaction(conn):
+                    for sql in statements:
+                        if not sql.startswith("CREATE INDEX"):
+                            conn.execute(sql)
+                    for table, column, alter, backfill in migrations:
+                        if column not in {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                            conn.execute(alter)
+                            if backfill:
+                                conn.execute(backfill)
+                    for sql in statements:
+                        if sql.startswith("CREATE INDEX"):
+                            conn.execute(sql)
+                self.schemas.add(name)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def transaction(conn):
+        """BEGIN IMMEDIATE ... COMMIT: takes the write lock up front so read-modify-write is atomic."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path: str = SUPPORT_DB) -> Database:
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = Database(path)
+        return _databases[path]
+
+
+# Ticket IDs
+def format_ticket_id(seq: int) -> str:
+    return f"{TICKET_PREFIX}{seq:03}"
+
+
+def sla_due(priority: str, created: float) -> float:
+    return created + 3600 * TICKET_SLA_HOURS.get(priority, DEFAULT_SLA_HOURS)
+
+
+def parse_ticket_id(ticket_id: str):
+    """"TCK-007" -> 7; None for anything that is not a ticket id."""
+    if not ticket_id or not ticket_id.startswith(TICKET_PREFIX):
+        return None
+    try:
+        return int(ticket_id[len(TICKET_PREFIX):])
+    except ValueError:
+        return None
+
+
+# Ticket Repository
+TICKET_SCHEMA = (
+    # seq is the rowid: AUTOINCREMENT hands out each id exactly once, even across processes
+    "CREATE TABLE IF NOT EXISTS tickets (seq INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT NOT NULL, "
+    "message TEXT NOT NULL, category TEXT, priority TEXT, status TEXT NOT NULL, agent TEXT NOT NULL, "
+    "created_at TEXT NOT NULL, updated REAL NOT NULL, priority_rank INTEGER NOT NULL DEFAULT 0, "
+    "due REAL NOT NULL DEFAULT 0)",
+    "CREATE INDEX IF NOT EXISTS tickets_email ON tickets (email, seq)",
+    "CREATE INDEX IF NOT EXISTS tickets_status ON tickets (status, seq)",
+    "CREATE INDEX IF NOT EXISTS tickets_priority ON tickets (priority, status)",
+    # the queue: overdue tickets by due time, the rest by priority then age
+    "CREATE INDEX IF NOT EXISTS tickets_due ON tickets (status, due)",
+    "CREATE INDEX IF NOT EXISTS tickets_schedule ON tickets (status, priority_rank DESC, seq)",
+)
+_rank_sql = "CASE priority " + " ".join(f"WHEN '{p}' THEN {r}" for p, r in PRIORITY_RANKS.items()) + " ELSE 0 END"
+_sla_sql = "CASE priority " + " ".join(f"WHEN '{p}' THEN {h}" for p, h in TICKET_SLA_HOURS.items()) + \
+    f" ELSE {DEFAULT_SLA_HOURS} END"
+TICKET_MIGRATIONS = (
+    ("tickets", "priority_rank", "ALTER TABLE tickets ADD COLUMN priority_rank INTEGER NOT NULL DEFAULT 0",
+     f"UPDATE tickets SET priority_rank = {_rank_sql}"),
+    ("tickets", "due", "ALTER TABLE tickets ADD COLUMN due REAL NOT NULL DEFAULT 0",
+     f"UPDATE tickets SET due = CAST(strftime('%s', created_at, 'utc') AS REAL) + 3600 * ({_sla_sql})"),
+)
+
+
+class TicketStore:
+    """
+    Tickets in SQLite, returned as the dicts demo2_app always used
+    (id, email, message, category, priority, status, agent, created_at).
+
+    Every query goes through an index (rowid for ids, email, status, priority) and list
+    queries are LIMITed, so a rerun's cost does not grow with the number of tickets.
+    """
+
+    def __init__(self, db_path: str = SUPPORT_DB):
+        self.db = get_database(db_path)
+        self.db.ensure_schema("tickets", TICKET_SCHEMA, TICKET_MIGRATIONS)
+
+    @staticmethod
+    def to_dict(row) -> dict:
+        ticket = {key: row[key] for key in TICKET_FIELDS if key != "id"}
+        ticket["id"] = format_ticket_id(row["seq"])
+        return ticket
+
+    @staticmethod
+    def where(email=None, statuses=None, category=None, priority=None, agent=None):
+        clauses, params = [], []
+        for column, value in (("email", email), ("category", category), ("priority", priority), ("agent", agent)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if statuses:
+            clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    # Writes
+    def create(self, email: str, message: str, category: str, priority: str) -> dict:
+        """Inserts an Open ticket and returns it with its newly allocated id."""
+        conn = self.db.connect()
+        now = time.time()
+        created_at = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        due = sla_due(priority, now)
+        with self.db.transaction(conn):
+            cur = conn.execute(
+                "INSERT INTO tickets (email, message, category, priority, status, agent, created_at, updated, "
+                "priority_rank, due) VALUES (?, ?, ?, ?, 'Open', ?, ?, ?, ?, ?)",
+                (email, message, category, priority, UNASSIGNED, created_at, now, PRIORITY_RANKS.get(priority, 0), due),
+            )
+            seq = cur.lastrowid
+        return {"id": format_ticket_id(seq), "email": email, "message": message, "category": category,
+                "priority": priority, "status": "Open", "agent": UNASSIGNED, "created_at": created_at, "due": due}
+
+    def update(self, ticket_id: str, status: str = None, agent: str = None) -> bool:
+        """Sets status and/or agent; returns False if the ticket does not exist."""
+        seq = parse_ticket_id(ticket_id)
+        if seq is None:
+            return False
+        if status is not None and status not in TICKET_STATUSES:
+            raise ValueError(f"unknown ticket status {status!r}")
+        conn = self.db.connect()
+        with self.db.transaction(conn):
+            cur = conn.execute(
+                "UPDATE tickets SET status = COALESCE(?, status), agent = COALESCE(?, agent), updated = ? "
+                "WHERE seq = ?", (status, agent, time.time(), seq),
+            )
+        return cur.rowcount == 1
+
+    def assign(self, ticket_id: str, agent: str) -> bool:
+        """Claims one ticket for agent; False if it does not exist or another agent already has it."""
+        seq = parse_ticket_id(ticket_id)
+        if seq is None:
+            return False
+        conn = self.db.connect()
+        with self.db.transaction(conn):
+            cur = conn.execute(
+                "UPDATE tickets SET status = 'In Progress', agent = ?, updated = ? "
+                "WHERE seq = ? AND (agent = ? OR agent = ?)", (agent, time.time(), seq, agent, UNASSIGNED),
+            )
+        return cur.rowcount == 1
+
+    def claim_next(self, agent: str, category: str = None, priority: str = None):
+        """
+        Assigns the first unassigned Open ticket in queue order to agent and returns it
+        (None if there is none). The select and update share one write transaction, so
+        two agents claiming at once always get different tickets.
+        """
+        now = time.time()
+        conn = self.db.connect()
+        with self.db.transaction(conn):
+            rows = self.scheduled(conn, 1, now, ("Open",), category=category, priority=priority, agent=UNASSIGNED)
+            if not rows:
+                return None
+            row = rows[0]
+            conn.execute("UPDATE tickets SET status = 'In Progress', agent = ?, updated = ? WHERE seq = ?",
+                         (agent, now, row["seq"]))
+        ticket = self.to_dict(row)
+        ticket.update(status="In Progress", agent=agent, breached=ticket["due"] < now)
+        return ticket
+
+    def set_status(self, ticket_id: str, status: str) -> bool:
+        return self.update(ticket_id, status=status)
+
+    # Reads
+    def get(self, ticket_id: str):
+        seq = parse_ticket_id(ticket_id)
+        if seq is None:
+            return None
+        row = self.db.connect().execute("SELECT * FROM tickets WHERE seq = ?", (seq,)).fetchone()
+        return self.to_dict(row) if row else None
+
+    def list(self, email: str = None, statuses=None, limit: int = 50, offset: int = 0, newest_first: bool = False):
+        """One page of tickets matching the filters, in creation order."""
+        where, params = self.where(email, statuses)
+        order = "DESC" if newest_first else "ASC"
+        rows = self.db.connect().execute(
+            f"SELECT * FROM tickets{where} ORDER BY seq {order} LIMIT ? OFFSET ?", (*params, limit, offset)
+        ).fetchall()
+        return [self.to_dict(row) for row in rows]
+
+    def count(self, email: str = None, statuses=None, category: str = None, priority: str = None,
+              agent: str = None) -> int:
+        where, params = self.where(email, statuses, category, priority, agent)
+        return self.db.connect().execute(f"SELECT COUNT(*) FROM tickets{where}", params).fetchone()[0]
+
+    # Agent Queue
+    # SLA breaches first (most overdue first), then priority, then oldest. Each part is read in
+    # its index's order (tickets_due, tickets_schedule), one LIMITed query per status, and the
+    # per-status runs are merged, so no query sorts the queue. Pages are keyset-paged: a page
+    # starts after the previous page's last ticket, so page N never reads pages 0..N-1.
+    QUEUE_PARTS = (
+        ("tickets_due", "due < ?", "due, seq", lambda row: (row["due"], row["seq"])),
+        ("tickets_schedule", "due >= ?", "priority_rank DESC, seq", lambda row: (-row["priority_rank"], row["seq"])),
+    )
+
+    @staticmethod
+    def seeks(part: int, key):
+        """
+        The index ranges of a queue part after key (the part's sort key of the last ticket
+        already shown, None for the whole part), in queue order: [(condition, params)].
+        """
+        if key is None:
+            return [("", ())]
+        first, seq = key
+        if part == 0:
+            return [(" AND (due, seq) > (?, ?)", (first, seq))]
+        # (-priority_rank, seq) > key, split so both ranges are seeks on tickets_schedule
+        return [(" AND priority_rank = ? AND seq > ?", (-first, seq)), (" AND priority_rank < ?", (-first,))]
+
+    @classmethod
+    def queue_cursor(cls, row, now: float):
+        """The cursor just after row: (queue part, the row's sort key in that part)."""
+        part = 0 if row["due"] < now else 1
+        return part, cls.QUEUE_PARTS[part][3](row)
+
+    def scheduled(self, conn, limit: int, now: float, statuses=QUEUE_STATUSES, after=None, **filters):
+        """The first `limit` ticket rows of the queue in schedule order, after the cursor if given."""
+        rows = []
+        for part, (index, condition, order, key) in enumerate(self.QUEUE_PARTS):
+            if after is not None and part < after[0]:
+                continue
+            ranges = self.seeks(part, after[1] if after is not None and part == after[0] else None)
+            want = limit - len(rows)
+            if want <= 0:
+                break
+            runs = []
+            for status in statuses:
+                where, params = self.where(statuses=(status,), **filters)
+                run = []
+                for seek, seek_params in ranges:
+                    if len(run) >= want:
+                        break
+                    run.extend(conn.execute(
+                        f"SELECT * FROM tickets INDEXED BY {index}{where} AND {condition}{seek} "
+                        f"ORDER BY {order} LIMIT ?",
+                        (*params, now, *seek_params, want - len(run)),
+                    ).fetchall())
+                runs.append(run)
+            rows.extend(itertools.islice(heapq.merge(*runs, key=key), want))
+        return rows
+
+    def queue_page(self, after=None, page_size: int = 20, statuses=QUEUE_STATUSES, category: str = None,
+                   priority: str = None, agent: str = None):
+        """
+        One page of the agent queue in schedule order, starting after the cursor `after`
+        (None for the first page), plus the cursor of the next page (None on the last page).
+        Each ticket carries "breached" (past its SLA due time). At most page_size + 1 rows
+        are read per status, whichever page it is.
+        """
+        now = time.time()
+        rows = self.scheduled(self.db.connect(), page_size + 1, now, statuses, after=after,
+                              category=category, priority=priority, agent=agent)
+        tickets = [self.to_dict(row) for row in rows[:page_size]]
+        for ticket in tickets:
+            ticket["breached"] = ticket["due"] < now
+        return tickets, self.queue_cursor(rows[page_size - 1], now) if len(rows) > page_size else None
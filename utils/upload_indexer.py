@@ -0,0 +1,118 @@
+import os
+import queue
+import shutil
+import threading
+import time
+
+import kb_index
+
+
+# Configuration
+UPLOAD_CHUNK_BYTES = 1 << 20  # copy uploads to disk 1 MB at a time
+
+
+# Upload Storage
+def save_upload(fileobj, name: str, target_dir: str = kb_index.DOCS_DIR) -> str:
+    """
+    Streams an uploaded file object to target_dir/name in fixed-size blocks. The data goes
+    to a temporary file first and is renamed into place, so an index sync never sees a
+    half-written .docx.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    path = os.path.join(target_dir, os.path.basename(name))
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    if hasattr(fileobj, "seek"):
+        fileobj.seek(0)
+    try:
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(fileobj, f, UPLOAD_CHUNK_BYTES)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+# Ingestion Queue
+class UploadIndexer(threading.Thread):
+    """
+    Indexes uploaded documents into the live collection, one file at a time, in the background.
+
+    submit(file) queues a file name from the docs folder; the worker parses, chunks and embeds
+    only that file (sync_index(only_files=...)) and upserts into the active index, so it is
+    searchable as soon as it finishes. A file submitted again while still queued is indexed
+    once. status(file) returns {"state": queued|indexing|indexed|failed, ...}.
+
+    After each sync, on_indexed(collection) is called with the freshly opened collection so
+    callers can drop collection objects cached with the previous corpus version.
+    """
+
+    def __init__(self, backend, docs_folder: str = kb_index.DOCS_DIR, on_indexed=None):
+        super().__init__(name="upload-indexer", daemon=True)
+        self.backend = backend  # dell_knowledge_query_groq.Backend: embedding function, answer cache, BM25
+        self.docs_folder = docs_folder
+        self.on_indexed = on_indexed
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.states = {}
+        self.lock = threading.Lock()
+        self.start()
+
+    def submit(self, file: str):
+        with self.lock:
+            self.states[file] = {"state": "queued", "queued_at": time.time()}
+            if file in self.pending:
+                return
+            self.pending.add(file)
+        self.queue.put(file)
+
+    def status(self, file: str):
+        with self.lock:
+            return dict(self.states[file]) if file in self.states else None
+
+    def run(self):
+        while True:
+            file = self.queue.get()
+            with self.lock:
+                self.pending.discard(file)
+                self.states[file] = {"state": "indexing", "started": time.time()}
+            try:
+                report = self.index_file(file)
+                state = {"state": "indexed" if not report["files_failed"] else "failed",
+                         "chunks_added": report["chunks_added"], "seconds": report.get("elapsed_s")}
+                if report["files_failed"]:
+                    state["error"] = "could not parse the document"
+            except Exception as e:
+                print(f" Indexing {file} failed: {type(e).__name__}: {e}")
+                state = {"state": "failed", "error": f"{type(e).__name__}: {e}"}
+            state["finished"] = time.time()
+            with self.lock:
+                if self.states.get(file, {}).get("state") == "indexing":  # not re-queued meanwhile
+                    self.states[file] = state
+
+    def index_file(self, file: str) -> dict:
+        import ingest_pipeline
+        import kb_flat
+        from kb_chunking import chunk_file
+
+        with kb_index.index_lock():  # a rebuild switching slots waits, and this sync then targets the new slot
+            db_dir = self.backend.index_dir()
+            collection, report = ingest_pipeline.sync_index(
+                chunk_file, docs_folder=self.docs_folder, db_dir=db_dir,
+                model_name=self.backend.model_name, workers=1, only_files=[file],
+            )
+            kb_flat.refresh_export(collection, report, db_dir)  # keep FLAT_SEARCH processes on the new corpus version
+        self.backend.answer_cache.purge_missing(collection)
+        self.backend.index_changed()
+        if self.on_indexed:
+            self.on_indexed(collection)
+        print(f" Indexed {file}: {report['chunks_added']} new chunks in {report.get('elapsed_s')}s")
+        return report
+
+
+def indexed_files(db_dir: str = None) -> dict:
+    """file -> {chunks, indexed_at} from the active index manifest."""
+    manifest = kb_index.load_manifest(os.path.join(db_dir or kb_index.active_db_dir(), kb_index.MANIFEST_FILE))
+    return {file: {"chunks": len(entry.get("chunks", {})), "indexed_at": entry.get("indexed_at")}
+            for file, entry in manifest.get("files", {}).items()}